@@ -0,0 +1,46 @@
+from datetime import date, datetime
+import sys
+import timeit
+from typing import Any, NamedTuple
+
+from website import create_app
+from website.api.common import build_query, resources
+
+
+class Case(NamedTuple):
+    fields: dict[str, list[str]]
+    filter: dict[str, Any]
+    sort: dict[str, list[str]]
+
+
+CASES = {
+    'posts': Case({'fields': ['title', 'author']},
+                  {'posted_on_gte': datetime(2023, 1, 1)},
+                  {'sort': ['-posted_on']}),
+    'entries': Case({},
+                    {'date_gte': date(2023, 1, 1), 'date_lte': date(2023, 12, 31)},
+                    {'sort': ['-date', '-time']}),
+    'users': Case({'fields': ['username', 'registered_on']},
+                  {'username': 'a%'},
+                  {'sort': ['username']}),
+}
+
+
+def benchmark(config: str, number: int) -> None:
+    app = create_app(config)
+    with app.test_request_context():
+        for resource, case in CASES.items():
+            model = resources[resource]['model']
+            seconds = min(timeit.repeat(lambda: build_query(case.fields, case.filter, case.sort, model, resource),
+                                        number=number, repeat=5))
+            print(f'{resource:10} {seconds / number * 1e6:8.1f} us/request')
+
+
+def main(args: list[str]) -> None:
+    if len(args) not in (2, 3):
+        raise SystemExit(f'Usage: {args[0]} config [iterations]')
+    benchmark(args[1], int(args[2]) if len(args) == 3 else 2000)
+
+
+if __name__ == '__main__':
+    main(sys.argv)
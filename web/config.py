@@ -1,4 +1,5 @@
 import os
+import tempfile
 from dotenv import load_dotenv
 
 
@@ -26,8 +27,45 @@ class Config:
     MAIL_USERNAME = os.environ.get('MAIL_USERNAME')
     MAIL_PASSWORD = os.environ.get('MAIL_PASSWORD')
     MAIL_DEFAULT_SENDER = os.environ.get('MAIL_DEFAULT_SENDER')
+    MAIL_OUTBOX_THREAD = True
+    MAIL_OUTBOX_POLL = 30
+    MAIL_RATE_LIMIT = 5
+    MAIL_MAX_ATTEMPTS = 5
+    MAIL_RETRY_BACKOFF = 60
     UPLOAD_FOLDER = 'static/images/'
     DEFAULT_AVATAR = 'default.jpg'
+    IMAGE_WIDTHS = {'posts': (320, 640, 1280), 'profiles': (75, 150)}
+    IMAGE_QUALITY = 80
+    IMAGE_PLACEHOLDERS = {'posts': 'processing.jpg', 'profiles': DEFAULT_AVATAR}
+    IMAGE_WORKERS = 2
+    IMAGE_CACHE_MAX_AGE = 31536000
+    IMAGE_PROCESSING_THREAD = True
+    IMAGE_RESIZE_WIDTHS = (75, 150, 320, 640, 1280)
+    IMAGE_CACHE_DIR = 'static/images/cache'
+    IMAGE_CACHE_MAX_BYTES = 512 * 2 ** 20
+    IMAGE_ACCEL_REDIRECT = os.environ.get('IMAGE_ACCEL_REDIRECT')
+    IMAGE_STORAGE = os.environ.get('IMAGE_STORAGE', 'filesystem')
+    S3_BUCKET = os.environ.get('S3_BUCKET')
+    S3_ENDPOINT_URL = os.environ.get('S3_ENDPOINT_URL')
+    S3_REGION = os.environ.get('S3_REGION')
+    S3_PUBLIC_URL = os.environ.get('S3_PUBLIC_URL', '')
+    S3_PREFIX = os.environ.get('S3_PREFIX', '')
+    POSTS_PER_PAGE = 10
+    ENTRIES_PER_PAGE = 10
+    FRAGMENT_CACHE_SIZE = 1024
+    FRAGMENT_CACHE_TTL = 300
+    FRAGMENT_CACHE_URL = os.environ.get('FRAGMENT_CACHE_URL')
+    OPENING_TIME = '09:00'
+    CLOSING_TIME = '21:00'
+    AVAILABILITY_MAX_DAYS = 31
+    TOKEN_EXPIRATION = 3600
+    TOKEN_CACHE_SIZE = 1024
+    TOKEN_CACHE_TTL = 30
+    PASSWORD_HASH_SLOTS = 2
+    PASSWORD_HASH_MAX_WAIT = 0.5
+    LOGIN_RATE_CAPACITY = 10
+    LOGIN_RATE_RATE = 0.1
+    PROXY_FIX_X_FOR = 1
     APIFAIRY_TITLE = 'JuliyaNails API'
     APIFAIRY_VERSION = '1.0'
     APIFAIRY_UI = 'elements'
@@ -50,6 +88,9 @@ class TestingConfig(Config):
     TESTING_DB_NAME = os.environ.get('TESTING_DB_NAME')
     SQLALCHEMY_DATABASE_URI = f"postgresql://{Config.POSTGRES_USER}:{Config.POSTGRES_PASSWORD}@{Config.POSTGRES_HOST}:{Config.POSTGRES_PORT}/{TESTING_DB_NAME}"
     TESTING = True
+    MAIL_OUTBOX_THREAD = False
+    IMAGE_PROCESSING_THREAD = False
+    IMAGE_CACHE_DIR = os.path.join(tempfile.gettempdir(), 'image-cache-testing')
 
 
 class ProductionConfig(Config):
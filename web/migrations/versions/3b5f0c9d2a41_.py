@@ -0,0 +1,57 @@
+"""empty message
+
+Revision ID: 3b5f0c9d2a41
+Revises: 7e0dce936ba9
+Create Date: 2026-10-18 10:12:04.518211
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = '3b5f0c9d2a41'
+down_revision = '7e0dce936ba9'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('entries', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('period', postgresql.TSTZRANGE(), nullable=True))
+
+    # entries without services still hold a minimum slot, empty ranges would never overlap
+    op.execute("""
+        UPDATE entries
+        SET period = tstzrange(
+            entries.date + entries.time,
+            entries.date + entries.time + GREATEST(COALESCE((
+                SELECT sum(services.duration)
+                FROM association_table
+                JOIN services ON services.id = association_table.service_id
+                WHERE association_table.entry_id = entries.uuid), 0) * interval '1 hour', interval '30 minutes'),
+            '[)')
+    """)
+
+    conflicts = op.get_bind().execute(sa.text("""
+        SELECT a.uuid, a.period, b.uuid, b.period
+        FROM entries a
+        JOIN entries b ON a.uuid < b.uuid AND a.period && b.period
+        ORDER BY lower(a.period)
+    """)).all()
+    if conflicts:
+        raise RuntimeError('Cannot add entries_period_excl, resolve these overlapping entries first:\n' +
+                           '\n'.join(f'  {a} {a_period} overlaps {b} {b_period}'
+                                      for a, a_period, b, b_period in conflicts))
+
+    with op.batch_alter_table('entries', schema=None) as batch_op:
+        batch_op.alter_column('period',
+               existing_type=postgresql.TSTZRANGE(),
+               nullable=False)
+        batch_op.create_exclude_constraint('entries_period_excl', ('period', '&&'), using='gist')
+
+
+def downgrade():
+    with op.batch_alter_table('entries', schema=None) as batch_op:
+        batch_op.drop_constraint('entries_period_excl')
+        batch_op.drop_column('period')
@@ -0,0 +1,38 @@
+"""empty message
+
+Revision ID: 5d8e2b7c9f06
+Revises: 9c4e1a7f3d12
+Create Date: 2026-10-18 14:21:09.418337
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5d8e2b7c9f06'
+down_revision = '9c4e1a7f3d12'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('entries', schema=None) as batch_op:
+        batch_op.create_index('ix_entries_date_time_uuid', ['date', 'time', 'uuid'], unique=False)
+
+    with op.batch_alter_table('posts', schema=None) as batch_op:
+        batch_op.create_index('ix_posts_posted_on_id', ['posted_on', 'id'], unique=False)
+
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.create_index('ix_users_registered_on_uuid', ['registered_on', 'uuid'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.drop_index('ix_users_registered_on_uuid')
+
+    with op.batch_alter_table('posts', schema=None) as batch_op:
+        batch_op.drop_index('ix_posts_posted_on_id')
+
+    with op.batch_alter_table('entries', schema=None) as batch_op:
+        batch_op.drop_index('ix_entries_date_time_uuid')
@@ -0,0 +1,48 @@
+"""empty message
+
+Revision ID: 9c4e1a7f3d12
+Revises: 3b5f0c9d2a41
+Create Date: 2026-10-18 11:02:47.130592
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9c4e1a7f3d12'
+down_revision = '3b5f0c9d2a41'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('entries', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('duration_minutes', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('ends_at', sa.DateTime(timezone=True), nullable=True))
+
+    op.execute("""
+        UPDATE entries
+        SET duration_minutes = COALESCE((
+                SELECT sum(services.duration) * 60
+                FROM association_table
+                JOIN services ON services.id = association_table.service_id
+                WHERE association_table.entry_id = entries.uuid), 0),
+            ends_at = upper(entries.period)
+    """)
+
+    with op.batch_alter_table('entries', schema=None) as batch_op:
+        batch_op.alter_column('duration_minutes',
+               existing_type=sa.Integer(),
+               nullable=False)
+        batch_op.alter_column('ends_at',
+               existing_type=sa.DateTime(timezone=True),
+               nullable=False)
+        batch_op.create_index(batch_op.f('ix_entries_ends_at'), ['ends_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('entries', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_entries_ends_at'))
+        batch_op.drop_column('ends_at')
+        batch_op.drop_column('duration_minutes')
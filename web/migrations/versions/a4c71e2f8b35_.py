@@ -0,0 +1,42 @@
+"""empty message
+
+Revision ID: a4c71e2f8b35
+Revises: 5d8e2b7c9f06
+Create Date: 2026-10-18 16:05:42.771930
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'a4c71e2f8b35'
+down_revision = '5d8e2b7c9f06'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('tokens',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('token_hash', sa.String(length=64), nullable=False),
+    sa.Column('user_id', sa.UUID(), nullable=False),
+    sa.Column('issued_on', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.Column('expires_at', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('scopes', postgresql.ARRAY(sa.String(length=32)), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.uuid'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('token_hash')
+    )
+    with op.batch_alter_table('tokens', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_tokens_expires_at'), ['expires_at'], unique=False)
+        batch_op.create_index(batch_op.f('ix_tokens_user_id'), ['user_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('tokens', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_tokens_user_id'))
+        batch_op.drop_index(batch_op.f('ix_tokens_expires_at'))
+
+    op.drop_table('tokens')
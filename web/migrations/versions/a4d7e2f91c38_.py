@@ -0,0 +1,102 @@
+"""empty message
+
+Revision ID: a4d7e2f91c38
+Revises: f3b8d1c6a9e4
+Create Date: 2026-10-18 22:03:51.806412
+
+"""
+import logging
+from urllib.parse import urlparse
+
+from alembic import op
+import phonenumbers
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'a4d7e2f91c38'
+down_revision = 'f3b8d1c6a9e4'
+branch_labels = None
+depends_on = None
+
+logger = logging.getLogger('alembic.runtime.migration')
+
+
+def upgrade():
+    with op.batch_alter_table('socials', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('phone_number_display', sa.String(length=50), nullable=True))
+        batch_op.add_column(sa.Column('viber_display', sa.String(length=50), nullable=True))
+        batch_op.add_column(sa.Column('whatsapp_display', sa.String(length=50), nullable=True))
+        batch_op.add_column(sa.Column('instagram_handle', sa.String(length=255), nullable=True))
+        batch_op.add_column(sa.Column('telegram_handle', sa.String(length=255), nullable=True))
+        batch_op.add_column(sa.Column('vk_handle', sa.String(length=255), nullable=True))
+
+    socials = sa.table('socials', *(sa.column(name) for name in (
+        'uuid', 'phone_number', 'viber', 'whatsapp', 'instagram', 'telegram', 'vk',
+        'phone_number_display', 'viber_display', 'whatsapp_display',
+        'instagram_handle', 'telegram_handle', 'vk_handle')))
+    connection = op.get_bind()
+    rows = connection.execute(sa.select(socials).where(sa.or_(
+        socials.c.phone_number.is_not(None), socials.c.viber.is_not(None), socials.c.whatsapp.is_not(None),
+        socials.c.instagram.is_not(None), socials.c.telegram.is_not(None), socials.c.vk.is_not(None)))).all()
+    updates = {row.uuid: {} for row in rows}
+    for attr in ('phone_number', 'viber', 'whatsapp'):
+        claims = {}
+        for row in rows:
+            if getattr(row, attr):
+                try:
+                    parsed = phonenumbers.parse(getattr(row, attr))
+                except phonenumbers.phonenumberutil.NumberParseException:
+                    continue
+                number = phonenumbers.format_number(parsed, phonenumbers.PhoneNumberFormat.E164)
+                claims.setdefault(number, []).append((row, parsed))
+        for number, claimants in claims.items():
+            claimants.sort(key=lambda claim: (getattr(claim[0], attr) != number, str(claim[0].uuid)))
+            (row, parsed), duplicates = claimants[0], claimants[1:]
+            updates[row.uuid][attr] = number
+            updates[row.uuid][f'{attr}_display'] = phonenumbers.format_number(
+                parsed, phonenumbers.PhoneNumberFormat.INTERNATIONAL)
+            for duplicate, _ in duplicates:
+                logger.warning('Clearing %s %r on socials %s: it is the same number as socials %s '
+                               '(the original is kept in socials_phone_backup)',
+                               attr, getattr(duplicate, attr), duplicate.uuid, row.uuid)
+                updates[duplicate.uuid][attr] = None
+    backup = op.create_table('socials_phone_backup',
+    sa.Column('uuid', postgresql.UUID(as_uuid=True), nullable=False),
+    sa.Column('phone_number', sa.String(length=50), nullable=True),
+    sa.Column('viber', sa.String(length=50), nullable=True),
+    sa.Column('whatsapp', sa.String(length=50), nullable=True),
+    sa.PrimaryKeyConstraint('uuid')
+    )
+    originals = [{'uuid': row.uuid, 'phone_number': row.phone_number, 'viber': row.viber, 'whatsapp': row.whatsapp}
+                 for row in rows
+                 if any(attr in updates[row.uuid] and updates[row.uuid][attr] != getattr(row, attr)
+                        for attr in ('phone_number', 'viber', 'whatsapp'))]
+    if originals:
+        op.bulk_insert(backup, originals)
+        logger.warning('Saved the original phone numbers of %s socials rows to socials_phone_backup',
+                       len(originals))
+    for row in rows:
+        values = updates[row.uuid]
+        for attr in ('vk', 'telegram', 'instagram'):
+            if getattr(row, attr):
+                values[f'{attr}_handle'] = urlparse(getattr(row, attr)).path.strip('/')
+        if values:
+            connection.execute(sa.update(socials).where(socials.c.uuid == row.uuid).values(**values))
+
+
+def downgrade():
+    if sa.inspect(op.get_bind()).has_table('socials_phone_backup'):
+        op.execute('UPDATE socials SET phone_number = backup.phone_number, viber = backup.viber, '
+                   'whatsapp = backup.whatsapp FROM socials_phone_backup AS backup '
+                   'WHERE socials.uuid = backup.uuid')
+        op.drop_table('socials_phone_backup')
+
+    with op.batch_alter_table('socials', schema=None) as batch_op:
+        batch_op.drop_column('vk_handle')
+        batch_op.drop_column('telegram_handle')
+        batch_op.drop_column('instagram_handle')
+        batch_op.drop_column('whatsapp_display')
+        batch_op.drop_column('viber_display')
+        batch_op.drop_column('phone_number_display')
@@ -0,0 +1,26 @@
+"""empty message
+
+Revision ID: b6c1f4e8d257
+Revises: a4d7e2f91c38
+Create Date: 2026-10-18 22:41:18.093574
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b6c1f4e8d257'
+down_revision = 'a4d7e2f91c38'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('entries', schema=None) as batch_op:
+        batch_op.create_index('ix_entries_user_id_date_time', ['user_id', 'date', 'time'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('entries', schema=None) as batch_op:
+        batch_op.drop_index('ix_entries_user_id_date_time')
@@ -0,0 +1,28 @@
+"""empty message
+
+Revision ID: b82d5f3e1c07
+Revises: a4c71e2f8b35
+Create Date: 2026-10-18 17:12:30.508214
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b82d5f3e1c07'
+down_revision = 'a4c71e2f8b35'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.create_index('ix_users_lower_username', [sa.text('lower(username)')], unique=True)
+        batch_op.create_index('ix_users_lower_email', [sa.text('lower(email)')], unique=True)
+
+
+def downgrade():
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.drop_index('ix_users_lower_email')
+        batch_op.drop_index('ix_users_lower_username')
@@ -0,0 +1,34 @@
+"""empty message
+
+Revision ID: c8e3f1a7b942
+Revises: b6c1f4e8d257
+Create Date: 2026-10-18 23:52:07.418305
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c8e3f1a7b942'
+down_revision = 'b6c1f4e8d257'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('login_buckets',
+    sa.Column('key', sa.Text(), nullable=False),
+    sa.Column('tokens', sa.Float(), nullable=False),
+    sa.Column('updated_on', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.PrimaryKeyConstraint('key')
+    )
+    with op.batch_alter_table('login_buckets', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_login_buckets_updated_on'), ['updated_on'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('login_buckets', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_login_buckets_updated_on'))
+
+    op.drop_table('login_buckets')
@@ -0,0 +1,36 @@
+"""empty message
+
+Revision ID: d61b8e2a4f70
+Revises: c3f9a6d4e218
+Create Date: 2026-10-18 19:52:41.318206
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd61b8e2a4f70'
+down_revision = 'c3f9a6d4e218'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('posts', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('image_width', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('image_height', sa.Integer(), nullable=True))
+
+    with op.batch_alter_table('socials', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('avatar_width', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('avatar_height', sa.Integer(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('socials', schema=None) as batch_op:
+        batch_op.drop_column('avatar_height')
+        batch_op.drop_column('avatar_width')
+
+    with op.batch_alter_table('posts', schema=None) as batch_op:
+        batch_op.drop_column('image_height')
+        batch_op.drop_column('image_width')
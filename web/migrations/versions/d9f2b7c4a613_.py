@@ -0,0 +1,37 @@
+"""empty message
+
+Revision ID: d9f2b7c4a613
+Revises: c8e3f1a7b942
+Create Date: 2026-10-19 00:41:26.193047
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd9f2b7c4a613'
+down_revision = 'c8e3f1a7b942'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('email_outbox', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('status', sa.String(length=16), server_default='pending', nullable=False))
+        batch_op.drop_index('ix_email_outbox_pending', postgresql_where=sa.text('sent_on IS NULL'))
+
+    op.execute("UPDATE email_outbox SET status = 'sent' WHERE sent_on IS NOT NULL")
+
+    with op.batch_alter_table('email_outbox', schema=None) as batch_op:
+        batch_op.alter_column('status', server_default=None)
+        batch_op.create_index('ix_email_outbox_pending', ['send_after'], unique=False,
+                              postgresql_where=sa.text("status = 'pending'"))
+
+
+def downgrade():
+    with op.batch_alter_table('email_outbox', schema=None) as batch_op:
+        batch_op.drop_index('ix_email_outbox_pending', postgresql_where=sa.text("status = 'pending'"))
+        batch_op.create_index('ix_email_outbox_pending', ['send_after'], unique=False,
+                              postgresql_where=sa.text('sent_on IS NULL'))
+        batch_op.drop_column('status')
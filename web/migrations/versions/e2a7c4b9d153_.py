@@ -0,0 +1,40 @@
+"""empty message
+
+Revision ID: e2a7c4b9d153
+Revises: d61b8e2a4f70
+Create Date: 2026-10-18 20:31:07.584129
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e2a7c4b9d153'
+down_revision = 'd61b8e2a4f70'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('image_jobs',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('path', sa.String(length=20), nullable=False),
+    sa.Column('upload', sa.String(length=64), nullable=False),
+    sa.Column('target_id', sa.String(length=36), nullable=False),
+    sa.Column('status', sa.String(length=16), nullable=False),
+    sa.Column('created_on', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.Column('finished_on', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('last_error', sa.Text(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('image_jobs', schema=None) as batch_op:
+        batch_op.create_index('ix_image_jobs_pending', ['path', 'target_id'], unique=False,
+                              postgresql_where=sa.text("status = 'pending'"))
+
+
+def downgrade():
+    with op.batch_alter_table('image_jobs', schema=None) as batch_op:
+        batch_op.drop_index('ix_image_jobs_pending', postgresql_where=sa.text("status = 'pending'"))
+
+    op.drop_table('image_jobs')
@@ -0,0 +1,29 @@
+"""empty message
+
+Revision ID: f3b8d1c6a9e4
+Revises: e2a7c4b9d153
+Create Date: 2026-10-18 21:14:07.529361
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3b8d1c6a9e4'
+down_revision = 'e2a7c4b9d153'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('posts', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('updated_on', sa.DateTime(timezone=True),
+                                      server_default=sa.text('now()'), nullable=False))
+
+    op.execute('UPDATE posts SET updated_on = posted_on')
+
+
+def downgrade():
+    with op.batch_alter_table('posts', schema=None) as batch_op:
+        batch_op.drop_column('updated_on')
@@ -1,16 +1,21 @@
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 import os
 import random
-from typing import Generator
+import socketserver
+from threading import Thread
+from typing import IO, Generator, Iterator
 
 from apifairy.fields import FileStorage
 from flask import Flask, current_app
 from flask.testing import FlaskClient
 import pytest
+import sqlalchemy as sa
+from sqlalchemy.engine import Connection
 
 from .test_api.test_users import TESTING_USER
 from website import create_app, db
 from website.models import User, SocialMedia, Service, Post, Entry
+from website.storage import S3Storage
 
 
 @pytest.fixture(scope='session')
@@ -63,6 +68,27 @@ def token(client: FlaskClient) -> str:
     return token
 
 
+@pytest.fixture
+def captured_statements(app: Flask) -> Generator[list[str], None, None]:
+    statements: list[str] = []
+
+    def log_statement(conn: Connection, cursor: object, statement: str, *args: object) -> None:
+        statements.append(statement)
+
+    sa.event.listen(db.engine, 'before_cursor_execute', log_statement)
+    yield statements
+    sa.event.remove(db.engine, 'before_cursor_execute', log_statement)
+
+
+@pytest.fixture
+def logged_in_web(app: Flask) -> FlaskClient:
+    web = app.test_client()
+    with web.session_transaction() as session:
+        session['_user_id'] = TESTING_USER
+        session['_fresh'] = True
+    return web
+
+
 @pytest.fixture(scope='session')
 def image_file() -> Generator[FileStorage, None, None]:
     file_path = os.path.join(
@@ -76,3 +102,92 @@ def image_file() -> Generator[FileStorage, None, None]:
         yield file
     finally:
         file.close()
+
+
+class SMTPHandler(socketserver.StreamRequestHandler):
+    def handle(self) -> None:
+        self.wfile.write(b'220 localhost ESMTP\r\n')
+        data: list[bytes] | None = None
+        while line := self.rfile.readline():
+            if data is not None:
+                if line == b'.\r\n':
+                    self.server.messages.append(b''.join(data))  # type: ignore[attr-defined]
+                    data = None
+                    self.wfile.write(b'250 OK\r\n')
+                else:
+                    data.append(line[1:] if line.startswith(b'..') else line)
+                continue
+            command = line[:4].upper()
+            if command == b'DATA':
+                data = []
+                self.wfile.write(b'354 End data with <CR><LF>.<CR><LF>\r\n')
+            elif command == b'QUIT':
+                self.wfile.write(b'221 Bye\r\n')
+                break
+            else:
+                self.wfile.write(b'250 OK\r\n')
+
+
+@pytest.fixture()
+def smtp_server(app: Flask) -> Generator[list[bytes], None, None]:
+    server = socketserver.ThreadingTCPServer(('localhost', 0), SMTPHandler)
+    server.messages = []  # type: ignore[attr-defined]
+    thread = Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    state = app.extensions['mail']
+    settings = (state.server, state.port, state.suppress)
+    state.server, state.port, state.suppress = 'localhost', server.server_address[1], False
+    try:
+        yield server.messages  # type: ignore[attr-defined]
+    finally:
+        state.server, state.port, state.suppress = settings
+        server.shutdown()
+        server.server_close()
+
+
+class FakeS3Client:
+    class exceptions:
+        class ClientError(Exception):
+            def __init__(self, code: str) -> None:
+                super().__init__(code)
+                self.response = {'Error': {'Code': code}}
+
+    def __init__(self) -> None:
+        self.objects: dict[tuple[str, str], tuple[bytes, dict, datetime]] = {}
+
+    def upload_fileobj(self, Fileobj: IO[bytes], Bucket: str, Key: str, ExtraArgs: dict | None = None) -> None:
+        self.objects[Bucket, Key] = (Fileobj.read(), ExtraArgs or {}, datetime.now(timezone.utc))
+
+    def download_fileobj(self, Bucket: str, Key: str, Fileobj: IO[bytes]) -> None:
+        Fileobj.write(self._get(Bucket, Key)[0])
+
+    def head_object(self, Bucket: str, Key: str) -> dict:
+        return {'ContentLength': len(self._get(Bucket, Key)[0])}
+
+    def delete_object(self, Bucket: str, Key: str) -> None:
+        self.objects.pop((Bucket, Key), None)
+
+    def get_paginator(self, operation: str) -> 'FakeS3Client':
+        return self
+
+    def paginate(self, Bucket: str, Prefix: str) -> Iterator[dict]:
+        yield {'Contents': [{'Key': key, 'Size': len(data), 'LastModified': modified}
+                            for (bucket, key), (data, _, modified) in sorted(self.objects.items())
+                            if bucket == Bucket and key.startswith(Prefix)]}
+
+    def _get(self, bucket: str, key: str) -> tuple[bytes, dict, datetime]:
+        if (bucket, key) not in self.objects:
+            raise self.exceptions.ClientError('404')
+        return self.objects[bucket, key]
+
+
+@pytest.fixture()
+def s3_storage(app: Flask) -> Generator[S3Storage, None, None]:
+    storage = S3Storage(FakeS3Client(), 'media', 'http://minio.local/media', prefix='test/',
+                        cache_control='public, max-age=31536000, immutable')
+    backend = app.extensions['storage']
+    app.extensions['storage'] = storage
+    try:
+        yield storage
+    finally:
+        app.extensions['storage'] = backend
@@ -1,4 +1,14 @@
+from datetime import datetime, timedelta
+from threading import Event, Thread
+
+from flask import Flask
 from flask.testing import FlaskClient
+import pytest
+import sqlalchemy as sa
+
+from website import db, login_limiter
+from website.hashing import HashingPool, PoolExhausted, TokenBucketLimiter
+from website.models import User, Token
 
 
 def test_no_auth(client: FlaskClient) -> None:
@@ -14,3 +24,103 @@ def test_get_auth_token(client: FlaskClient) -> None:
     assert response.status_code == 200
     response = client.get('/api/v1/users', headers={'Authorization': f'Bearer {token[:-1]}'})
     assert response.status_code == 401
+
+
+def test_get_auth_token_case_insensitive(client: FlaskClient) -> None:
+    for login in ['TEST', 'Test@Example.com']:
+        response = client.post('/api/v1/get-auth-token', auth=(login, 'foo1#Bar#'))
+        assert response.status_code == 200
+
+
+def test_revoke_auth_token(client: FlaskClient) -> None:
+    response = client.post('/api/v1/get-auth-token', auth=('test', 'foo1#Bar#'))
+    token = response.get_json()['token']
+    assert response.get_json()['expires_at']
+    response = client.get('/api/v1/users', headers={'Authorization': f'Bearer {token}'})
+    assert response.status_code == 200
+    response = client.post('/api/v1/revoke-auth-token', headers={'Authorization': f'Bearer {token}'})
+    assert response.status_code == 204
+    response = client.get('/api/v1/users', headers={'Authorization': f'Bearer {token}'})
+    assert response.status_code == 401
+
+
+def test_cleanup_tokens(app: Flask) -> None:
+    user = db.session.scalar(sa.select(User).filter_by(username='test'))
+    assert user is not None
+    token, record = Token.issue(user)
+    record.expires_at = datetime.now().astimezone() - timedelta(minutes=1)
+    db.session.commit()
+    result = app.test_cli_runner().invoke(args=['api', 'cleanup-tokens'])
+    assert 'Deleted' in result.output
+    assert db.session.scalar(sa.select(Token).filter_by(token_hash=Token.digest(token))) is None
+
+
+def test_login_rate_limit(client: FlaskClient) -> None:
+    login_limiter.clear()
+    try:
+        for _ in range(int(login_limiter.capacity)):
+            response = client.post('/api/v1/get-auth-token', auth=('nobody', 'wrong'))
+            assert response.status_code == 401
+        response = client.post('/api/v1/get-auth-token', auth=('nobody', 'wrong'))
+        assert response.status_code == 429
+    finally:
+        login_limiter.clear()
+
+
+def test_login_rate_limit_successful_logins(client: FlaskClient) -> None:
+    login_limiter.clear()
+    try:
+        for _ in range(int(login_limiter.capacity) + 1):
+            response = client.post('/api/v1/get-auth-token', auth=('test', 'foo1#Bar#'))
+            assert response.status_code == 200
+    finally:
+        login_limiter.clear()
+
+
+def test_login_rate_limit_forwarded_for(client: FlaskClient) -> None:
+    login_limiter.clear()
+    try:
+        for _ in range(int(login_limiter.capacity)):
+            client.post('/api/v1/get-auth-token', auth=('nobody', 'wrong'),
+                        headers={'X-Forwarded-For': '203.0.113.1'})
+        response = client.post('/api/v1/get-auth-token', auth=('somebody', 'wrong'),
+                               headers={'X-Forwarded-For': '203.0.113.2'})
+        assert response.status_code == 401
+    finally:
+        login_limiter.clear()
+
+
+def test_login_rate_limit_shared() -> None:
+    other_process = TokenBucketLimiter(capacity=login_limiter.capacity, rate=login_limiter.rate)
+    login_limiter.clear()
+    try:
+        for _ in range(int(login_limiter.capacity)):
+            assert login_limiter.allow(('ip', '203.0.113.3'))
+        assert not other_process.allow(('ip', '203.0.113.3'))
+    finally:
+        login_limiter.clear()
+
+
+def test_password_pool_slots(app: Flask) -> None:
+    pool = HashingPool(slots=1, max_wait=0)
+    started, release = Event(), Event()
+
+    def wait() -> None:
+        started.set()
+        release.wait()
+
+    def hold() -> None:
+        try:
+            pool.run(wait)
+        finally:
+            db.session.remove()
+
+    worker = Thread(target=hold)
+    worker.start()
+    started.wait()
+    with pytest.raises(PoolExhausted):
+        pool.run(bool)
+    release.set()
+    worker.join()
+    assert pool.run(bool) is False
+    assert pool.stats()['rejected'] == 1
@@ -0,0 +1,47 @@
+from datetime import date, timedelta
+
+from flask.testing import FlaskClient
+
+from tests.test_api.test_users import TESTING_USER
+from website import db
+from website.models import Entry, Service
+
+
+def test_availability(client: FlaskClient, token: str) -> None:
+    day = date.today() + timedelta(days=60)
+    entry = Entry(user_id=TESTING_USER, date=day, time='12:00')
+    service = db.session.get(Service, 77)
+    assert service is not None
+    entry.services.append(service)
+    db.session.add(entry)
+    db.session.commit()
+    response = client.get(f'/api/v1/availability?date_from={day}&services=77',
+                          headers={'Authorization': f'Bearer {token}'})
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data['duration'] == '3.0'
+    assert data['date_to'] == data['date_from'] == day.isoformat()
+    slots = [(slot['start'], slot['end']) for slot in data['slots']]
+    assert slots == [('09:00:00', '12:00:00'), ('15:00:00', '21:00:00')]
+    response = client.get(f'/api/v1/availability?date_from={day}&date_to={day + timedelta(days=1)}&services=77,77',
+                          headers={'Authorization': f'Bearer {token}'})
+    assert response.status_code == 200
+    assert len(response.get_json()['slots']) == 3
+    db.session.delete(entry)
+    db.session.commit()
+
+
+def test_invalid_availability(client: FlaskClient, token: str) -> None:
+    day = date.today() + timedelta(days=60)
+    response = client.get(f'/api/v1/availability?date_from={day}',
+                          headers={'Authorization': f'Bearer {token}'})
+    assert response.status_code == 400
+    response = client.get(f'/api/v1/availability?date_from={day}&services=9999',
+                          headers={'Authorization': f'Bearer {token}'})
+    assert response.status_code == 400
+    response = client.get(f'/api/v1/availability?date_from={day}&date_to={day - timedelta(days=1)}&services=77',
+                          headers={'Authorization': f'Bearer {token}'})
+    assert response.status_code == 400
+    response = client.get(f'/api/v1/availability?date_from={date.today() - timedelta(days=1)}&services=77',
+                          headers={'Authorization': f'Bearer {token}'})
+    assert response.status_code == 400
@@ -1,12 +1,15 @@
+from datetime import date, timedelta
 import random
 
+from flask import Flask
 from flask.testing import FlaskClient
 import sqlalchemy as sa
 from werkzeug.test import TestResponse
 
 from tests.test_api.test_users import TESTING_USER
 from website import db
-from website.models import Entry, Service
+from website.api.common import save_entry
+from website.models import MIN_SLOT_MINUTES, Entry, Service
 
 
 def test_all_entries(client: FlaskClient, token: str) -> None:
@@ -65,6 +68,37 @@ def test_create_entry(client: FlaskClient, token: str) -> None:
     assert response_next.status_code == 400
 
 
+def test_create_overlapping_entry(client: FlaskClient, token: str) -> None:
+    day = (date.today() + timedelta(days=90)).isoformat()
+    response, _ = create_entry(client, token, {'date': day, 'time': '10:00', 'services': [77]})
+    assert response.status_code == 201
+    response_overlap, _ = create_entry(client, token, {'date': day, 'time': '12:30', 'services': [77]})
+    assert response_overlap.status_code == 400
+    assert 'datetime' in response_overlap.get_json()['description']['json']
+    response_adjacent, _ = create_entry(client, token, {'date': day, 'time': '13:00', 'services': [77]})
+    assert response_adjacent.status_code == 201
+    entry_id = response.get_json()['uuid']
+    response = client.put(f'/api/v1/entries/{entry_id}', json={'time': '11:00'},
+                          headers={'Authorization': f'Bearer {token}'})
+    assert response.status_code == 400
+    response = client.put(f'/api/v1/entries/{entry_id}', json={'time': '9:00'},
+                          headers={'Authorization': f'Bearer {token}'})
+    assert response.status_code == 200
+
+
+def test_empty_entry_slot(app: Flask) -> None:
+    day = date.today() + timedelta(days=95)
+    entry = Entry(user_id=TESTING_USER, date=day, time='10:00')
+    assert save_entry(entry)
+    try:
+        assert entry.period.upper is not None and entry.period.lower is not None
+        assert entry.period.upper - entry.period.lower == timedelta(minutes=MIN_SLOT_MINUTES)
+        assert not save_entry(Entry(user_id=TESTING_USER, date=day, time='10:15'))
+    finally:
+        db.session.delete(entry)
+        db.session.commit()
+
+
 def test_update_entry(client: FlaskClient, token: str) -> None:
     payload = {
         'date': '2023-08-24',
@@ -141,3 +175,41 @@ def create_entry_payload() -> dict:
         'time': f'{hour}:{minutes}0',
     }
     return payload
+
+
+def test_my_entries_page(app: Flask, captured_statements: list[str], logged_in_web: FlaskClient) -> None:
+    service = db.session.get(Service, 77)
+    today = date.today()
+    entries = [Entry(user_id=TESTING_USER, date=today + timedelta(days=days), time='12:00', services=[service])
+               for days in (-400, -300, 300, 301, 302)]
+    db.session.add_all(entries)
+    db.session.commit()
+    ids = [str(entry.uuid) for entry in entries]
+    per_page = app.config['ENTRIES_PER_PAGE']
+    app.config['ENTRIES_PER_PAGE'] = 2
+    captured_statements.clear()
+    try:
+        pages = []
+        url = '/users/test/profile/my-entries'
+        while url:
+            captured_statements.clear()
+            with app.app_context():
+                response = logged_in_web.get(url)
+            assert response.status_code == 200
+            page = response.get_data(as_text=True)
+            pages.append([uuid for uuid in ids if uuid in page])
+            assert len([statement for statement in captured_statements if 'association_table' in statement]) <= 1
+            _, _, rest = page.partition('cursor=')
+            url = f'/users/test/profile/my-entries?cursor={rest.partition(chr(34))[0]}' if rest else ''
+        assert len(pages) >= 2
+        assert [uuid for page in pages for uuid in page] == ids[2:]
+        with app.app_context():
+            page = logged_in_web.get('/users/test/profile/my-entries?view=past').get_data(as_text=True)
+        assert page.index(ids[1]) < page.index(ids[0])
+        with app.app_context():
+            response = logged_in_web.get('/users/test/profile/my-entries?view=foo', headers={'Accept': 'text/html'})
+            assert response.status_code == 404
+    finally:
+        app.config['ENTRIES_PER_PAGE'] = per_page
+        db.session.execute(sa.delete(Entry).where(Entry.uuid.in_(ids)))
+        db.session.commit()
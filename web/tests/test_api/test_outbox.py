@@ -0,0 +1,72 @@
+from datetime import datetime
+
+from flask import Flask
+import sqlalchemy as sa
+
+from website import db
+from website.models import EmailOutbox
+from website.outbox import outbox
+from website.utils import send_email
+
+
+def test_outbox_delivery(app: Flask, smtp_server: list[bytes]) -> None:
+    db.session.execute(sa.delete(EmailOutbox))
+    db.session.commit()
+    try:
+        with app.test_request_context():
+            for i in range(3):
+                send_email(f'outbox_{i}@example.com', 'Please confirm your email', 'auth/email/confirm_email',
+                           confirm_url='http://localhost/confirm')
+        assert outbox.drain() == 3
+        assert len(smtp_server) == 3
+        assert b'outbox_0@example.com' in b''.join(smtp_server)
+        assert db.session.scalar(sa.select(sa.func.count()).select_from(EmailOutbox).filter_by(status='pending')) == 0
+    finally:
+        db.session.execute(sa.delete(EmailOutbox))
+        db.session.commit()
+
+
+def test_outbox_retry(app: Flask) -> None:
+    state = app.extensions['mail']
+    settings = (state.server, state.port, state.suppress)
+    state.server, state.port, state.suppress = 'localhost', 1, False
+    try:
+        with app.test_request_context():
+            send_email('retry@example.com', 'Reset your password', 'auth/email/reset_password',
+                       reset_url='http://localhost/reset')
+        assert outbox.drain() == 0
+        email = db.session.scalar(sa.select(EmailOutbox).filter_by(recipient='retry@example.com'))
+        assert email is not None
+        assert email.sent_on is None
+        assert email.status == 'pending'
+        assert email.attempts == 1
+        assert email.last_error
+        assert email.send_after > datetime.now().astimezone()
+    finally:
+        state.server, state.port, state.suppress = settings
+        db.session.execute(sa.delete(EmailOutbox))
+        db.session.commit()
+
+
+def test_outbox_gives_up(app: Flask) -> None:
+    state = app.extensions['mail']
+    settings = (state.server, state.port, state.suppress)
+    state.server, state.port, state.suppress = 'localhost', 1, False
+    try:
+        with app.test_request_context():
+            send_email('gives_up@example.com', 'Reset your password', 'auth/email/reset_password',
+                       reset_url='http://localhost/reset')
+        email = db.session.scalar(sa.select(EmailOutbox).filter_by(recipient='gives_up@example.com'))
+        assert email is not None
+        email.attempts = app.config['MAIL_MAX_ATTEMPTS'] - 1
+        db.session.commit()
+        assert outbox.drain() == 0
+        db.session.refresh(email)
+        assert email.status == 'failed'
+        assert email.attempts == app.config['MAIL_MAX_ATTEMPTS']
+        assert email.last_error
+        assert email.sent_on is None
+    finally:
+        state.server, state.port, state.suppress = settings
+        db.session.execute(sa.delete(EmailOutbox))
+        db.session.commit()
@@ -1,16 +1,23 @@
+from datetime import datetime, timedelta, timezone
+import hashlib
+import io
 import os
 import secrets
 
 from apifairy.fields import FileStorage
-from flask import current_app
+from flask import Flask, current_app
 from flask.testing import FlaskClient
+from PIL import Image
+import pytest
 import sqlalchemy as sa
 from werkzeug.test import TestResponse
 
 from tests.test_api.test_users import TESTING_USER
-from website import db
-from website.models import Post
-from website.utils import delete_image
+from website import db, fragment_cache, image_cache
+from website.images import image_processor
+from website.models import Post, ImageJob
+from website.storage import S3Storage
+from website.utils import empty_image
 
 
 def test_all_posts(client: FlaskClient, token: str) -> None:
@@ -74,6 +81,92 @@ def test_delete_post(client: FlaskClient, token: str) -> None:
     assert response.status_code == 404
 
 
+def test_home_feed(app: Flask, client: FlaskClient, captured_statements: list[str]) -> None:
+    posted_on = datetime(2023, 1, 1, tzinfo=timezone.utc)
+    posts = [Post(author_id=TESTING_USER, title=f'feed {i}', content='feed', posted_on=posted_on) for i in range(5)]
+    db.session.add_all(posts)
+    db.session.commit()
+    per_page = app.config['POSTS_PER_PAGE']
+    app.config['POSTS_PER_PAGE'] = 2
+    captured_statements.clear()
+    try:
+        response = client.get('/home')
+        assert response.status_code == 200
+        assert response.data.count(b'<article') == 2
+        assert b'data-url="/home/posts?cursor=' in response.data
+        titles: list[str] = []
+        url = '/home/posts'
+        while url is not None:
+            db.session.expire_all()
+            captured_statements.clear()
+            response = client.get(url)
+            assert response.status_code == 200
+            page = response.get_json()
+            assert page['html'].count('<article') <= 2
+            titles += [title for title in page['html'].split('"article-link"')[1:]]
+            assert any('JOIN socials' in statement for statement in captured_statements)
+            assert not any(statement.lstrip().startswith('SELECT socials') for statement in captured_statements)
+            url = page['next_url']
+        expected = db.session.scalar(sa.select(sa.func.count()).select_from(Post))
+        assert len(titles) == expected
+        assert all(sum(f'>feed {i}</a>' in title for title in titles) == 1 for i in range(5))
+        response = client.get('/home/posts?cursor=foo', headers={'Accept': 'application/json'})
+        assert response.status_code == 400
+    finally:
+        app.config['POSTS_PER_PAGE'] = per_page
+        for post in posts:
+            db.session.delete(post)
+        db.session.commit()
+
+
+class FakeRedis:
+    def __init__(self) -> None:
+        self.data: dict[str, bytes] = {}
+
+    def get(self, key: str) -> bytes | None:
+        return self.data.get(key)
+
+    def set(self, key: str, value: str, ex: int | None = None) -> None:
+        self.data[key] = value.encode()
+
+    def incr(self, key: str) -> int:
+        self.data[key] = str(int(self.data.get(key, b'0')) + 1).encode()
+        return int(self.data[key])
+
+
+def test_fragment_cache(app: Flask, captured_statements: list[str]) -> None:
+    client = app.test_client()
+    post = db.session.scalar(sa.select(Post).filter_by(title='foo'))
+    assert post is not None
+    fragment_cache.clear()
+    captured_statements.clear()
+    try:
+        body = client.get('/home').data
+        assert any('FROM posts' in statement for statement in captured_statements)
+        captured_statements.clear()
+        assert client.get('/home').data == body
+        assert not any('FROM posts' in statement for statement in captured_statements)
+        assert any(key.startswith('post:') for key in fragment_cache.keys())
+        assert client.get('/home?utm_source=newsletter').data == body
+        assert sum(key.startswith('page:') for key in fragment_cache.keys()) == 1
+        post.title = 'cached foo'
+        db.session.commit()
+        assert b'cached foo' in client.get('/home').data
+        fragment_cache.backend = FakeRedis()
+        client.get('/home/posts')
+        fragment_cache.local.clear()
+        captured_statements.clear()
+        assert b'cached foo' in client.get('/home/posts').data
+        assert not any('FROM posts' in statement for statement in captured_statements)
+        post.title = 'foo'
+        db.session.commit()
+        assert fragment_cache.backend.data['fragments:generation'] == b'1'
+        assert b'cached foo' not in client.get('/home/posts').data
+    finally:
+        fragment_cache.backend = None
+        fragment_cache.clear()
+
+
 def test_update_image(client: FlaskClient, token: str, image_file: FileStorage) -> None:
     post = db.session.scalar(sa.select(Post).filter_by(title='foo'))
     assert post is not None
@@ -82,14 +175,17 @@ def test_update_image(client: FlaskClient, token: str, image_file: FileStorage)
                           headers={
                               'Authorization': f'Bearer {token}'})
     assert response.status_code == 200
-    new_image = response.get_json()['image']
+    assert response.get_json()['image'] == current_app.config['IMAGE_PLACEHOLDERS']['posts']
+    assert image_processor.drain() == 1
+    db.session.refresh(post)
+    new_image = post.image
     assert old_image != new_image
-    assert post.image == new_image
     image_path = os.path.join(
         current_app.root_path,
         current_app.config['UPLOAD_FOLDER'], 'posts', new_image)
     assert os.path.exists(image_path)
-    delete_image(new_image, path='posts')
+    response = client.delete(f'api/v1/posts/{post.id}/image', headers={'Authorization': f'Bearer {token}'})
+    assert response.status_code == 204
     assert not os.path.exists(image_path)
 
 
@@ -112,6 +208,194 @@ def test_delete_image(client: FlaskClient, token: str, image_file: FileStorage)
     assert not os.path.exists(image_path)
 
 
+def test_image_variants(client: FlaskClient, token: str) -> None:
+    post = db.session.scalar(sa.select(Post).filter_by(title='foo'))
+    assert post is not None
+    exif = Image.Exif()
+    exif[0x0112] = 6
+    buffer = io.BytesIO()
+    Image.new('RGB', (1000, 600), 'red').save(buffer, 'JPEG', exif=exif)
+    buffer.seek(0)
+    response = client.put(f'api/v1/posts/{post.id}/image',
+                          data={'image': (buffer, 'photo.jpg', 'image/jpeg')},
+                          headers={'Authorization': f'Bearer {token}'})
+    assert response.status_code == 200
+    assert image_processor.drain() == 1
+    data = client.get(f'api/v1/posts/{post.id}', headers={'Authorization': f'Bearer {token}'}).get_json()
+    assert (data['image_width'], data['image_height']) == (600, 1000)
+    assert data['srcset']['webp'].split(', ')[0].endswith('-320w.webp 320w')
+    assert data['srcset']['jpeg'].split(', ')[1].endswith('-600w.jpeg 600w')
+    folder = os.path.join(current_app.root_path, current_app.config['UPLOAD_FOLDER'], 'posts')
+    stem, _ = os.path.splitext(data['image'])
+    variants = sorted(name for name in os.listdir(folder) if name.startswith(f'{stem}-'))
+    assert variants == [f'{stem}-{width}w.{fmt}' for width in (320, 600) for fmt in ('jpeg', 'webp')]
+    with Image.open(os.path.join(folder, data['image'])) as image:
+        assert image.size == (600, 1000)
+        assert not image.getexif()
+    response = client.delete(f'api/v1/posts/{post.id}/image', headers={'Authorization': f'Bearer {token}'})
+    assert response.status_code == 204
+    assert not any(name.startswith(stem) for name in os.listdir(folder))
+
+
+def test_image_deduplication(client: FlaskClient, token: str) -> None:
+    posts = [create_post(client, token)[0].get_json()['id'] for _ in range(2)]
+    buffer = io.BytesIO()
+    Image.new('RGB', (200, 100), 'blue').save(buffer, 'PNG')
+    for post_id in posts:
+        response = client.put(f'api/v1/posts/{post_id}/image',
+                              data={'image': (io.BytesIO(buffer.getvalue()), 'photo.png', 'image/png')},
+                              headers={'Authorization': f'Bearer {token}'})
+        assert response.status_code == 200
+    assert image_processor.drain() == 2
+    images = {db.session.get(Post, post_id).image for post_id in posts}  # type: ignore[union-attr]
+    assert len(images) == 1
+    image = images.pop()
+    assert image == hashlib.sha256(buffer.getvalue()).hexdigest()[:16] + '.png'
+    response = client.get(f'/static/images/posts/{image}', buffered=True)
+    assert response.status_code == 200
+    assert response.headers['Cache-Control'] == 'public, max-age=31536000, immutable'
+    image_path = os.path.join(current_app.root_path, current_app.config['UPLOAD_FOLDER'], 'posts', image)
+    client.delete(f'api/v1/posts/{posts[0]}/image', headers={'Authorization': f'Bearer {token}'})
+    assert os.path.exists(image_path)
+    client.delete(f'api/v1/posts/{posts[1]}', headers={'Authorization': f'Bearer {token}'})
+    assert not os.path.exists(image_path)
+
+
+def test_image_resize(app: Flask, client: FlaskClient, monkeypatch: pytest.MonkeyPatch) -> None:
+    url = '/img/profiles/default.jpg?w=100&fmt=webp'
+    response = client.get(url, buffered=True)
+    assert response.status_code == 200
+    assert response.mimetype == 'image/webp'
+    assert response.headers['ETag'] == '"profiles/default-150w.webp"'
+    assert response.headers['Cache-Control'] == 'public, max-age=31536000, immutable'
+    with Image.open(io.BytesIO(response.data)) as image:
+        assert image.size == (148, 150)
+    assert os.path.exists(image_cache.path('profiles/default-150w.webp'))
+    etag = response.headers['ETag']
+    response = client.get(url, headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    with monkeypatch.context() as patch:
+        patch.setattr('website.main.routes.storage.exists', lambda key: False)
+        response = client.get(url, headers={'If-None-Match': etag, 'Accept': 'text/html'})
+        assert response.status_code == 404
+        assert client.get(url, headers={'Accept': 'text/html'}).status_code == 404
+    assert client.get('/img/profiles/missing.jpg', headers={'Accept': 'text/html'}).status_code == 404
+    assert client.get('/img/secrets/default.jpg', headers={'Accept': 'text/html'}).status_code == 404
+    app.config['IMAGE_ACCEL_REDIRECT'] = '/_image_cache/'
+    try:
+        response = client.get('/img/profiles/default.jpg?w=75&fmt=jpeg')
+    finally:
+        app.config['IMAGE_ACCEL_REDIRECT'] = None
+    assert response.headers['X-Accel-Redirect'] == '/_image_cache/profiles/default-75w.jpeg'
+    assert response.data == b''
+    assert client.get('/img/profiles/default.jpg?fmt=gif', headers={'Accept': 'text/html'}).status_code == 400
+    image_cache.max_bytes, max_bytes = 1, image_cache.max_bytes
+    try:
+        client.get('/img/profiles/default.jpg?w=320', buffered=True)
+    finally:
+        image_cache.max_bytes = max_bytes
+    assert len(image_cache) == 1
+    assert not os.path.exists(image_cache.path('profiles/default-150w.webp'))
+    image_cache.clear()
+
+
+def test_s3_storage(client: FlaskClient, token: str, s3_storage: S3Storage) -> None:
+    post_id = create_post(client, token)[0].get_json()['id']
+    buffer = io.BytesIO()
+    Image.new('RGB', (800, 400), 'green').save(buffer, 'PNG')
+    buffer.seek(0)
+    response = client.put(f'api/v1/posts/{post_id}/image', data={'image': (buffer, 'photo.png', 'image/png')},
+                          headers={'Authorization': f'Bearer {token}'})
+    assert response.status_code == 200
+    assert image_processor.drain() == 1
+    data = client.get(f'api/v1/posts/{post_id}', headers={'Authorization': f'Bearer {token}'}).get_json()
+    stem, _ = os.path.splitext(data['image'])
+    assert {key for key, _, _ in s3_storage.list('posts/')} == {
+        f'posts/{data["image"]}', *(f'posts/{stem}-{width}w.{fmt}' for width in (320, 640, 800) for fmt in ('jpeg', 'webp'))}
+    assert data['image_url'] == f'http://minio.local/media/test/posts/{data["image"]}'
+    assert data['srcset']['webp'].startswith(f'http://minio.local/media/test/posts/{stem}-320w.webp 320w')
+    _, extra, _ = s3_storage.client.objects['media', f'test/posts/{data["image"]}']  # type: ignore[attr-defined]
+    assert extra == {'ContentType': 'image/png', 'CacheControl': 'public, max-age=31536000, immutable'}
+    response = client.get(f'/img/posts/{data["image"]}?w=320', buffered=True)
+    assert response.status_code == 200
+    with Image.open(io.BytesIO(response.data)) as image:
+        assert image.size == (320, 160)
+    image_cache.clear()
+    response = client.delete(f'api/v1/posts/{post_id}', headers={'Authorization': f'Bearer {token}'})
+    assert response.status_code == 204
+    assert list(s3_storage.list('posts/')) == []
+
+
+def test_image_gc(app: Flask, s3_storage: S3Storage) -> None:
+    post = db.session.scalar(sa.select(Post).filter_by(title='foo'))
+    assert post is not None
+    post.update({'image': 'kept.png', 'image_width': 320, 'image_height': 160})
+    db.session.commit()
+    old = datetime.now(timezone.utc) - timedelta(days=2)
+    for key, modified in [('posts/kept.png', old), ('posts/kept-320w.webp', old), ('posts/orphan.png', old),
+                          ('posts/orphan-320w.webp', old), ('posts/fresh.png', None), ('profiles/default.jpg', old),
+                          ('profiles/stale.jpg.upload', old)]:
+        s3_storage.save(key, io.BytesIO(b'x' * 10))
+        if modified is not None:
+            data, extra, _ = s3_storage.client.objects['media', f'test/{key}']  # type: ignore[attr-defined]
+            s3_storage.client.objects['media', f'test/{key}'] = (data, extra, modified)  # type: ignore[attr-defined]
+    runner = app.test_cli_runner()
+    result = runner.invoke(args=['images', 'gc', '--dry-run'])
+    assert 'posts: 2 orphaned file(s), 20 bytes' in result.output
+    assert 'profiles: 1 orphaned file(s), 10 bytes' in result.output
+    assert 'Would reclaim 30 bytes' in result.output
+    assert len(list(s3_storage.list())) == 7
+    result = runner.invoke(args=['images', 'gc'])
+    assert 'Reclaimed 30 bytes' in result.output
+    assert {key for key, _, _ in s3_storage.list()} == {
+        'posts/kept.png', 'posts/kept-320w.webp', 'posts/fresh.png', 'profiles/default.jpg'}
+    post.update(empty_image())
+    db.session.commit()
+
+
+def test_image_job_failure(client: FlaskClient, token: str) -> None:
+    post = db.session.scalar(sa.select(Post).filter_by(title='foo'))
+    assert post is not None
+    response = client.put(f'api/v1/posts/{post.id}/image',
+                          data={'image': (io.BytesIO(b'not an image'), 'broken.jpg', 'image/jpeg')},
+                          headers={'Authorization': f'Bearer {token}'})
+    assert response.status_code == 200
+    job = db.session.scalar(sa.select(ImageJob).order_by(ImageJob.id.desc()))
+    assert job is not None and job.status == 'pending'
+    assert image_processor.drain() == 0
+    db.session.refresh(job)
+    db.session.refresh(post)
+    assert job.status == 'failed'
+    assert job.last_error
+    assert post.image is None
+    folder = os.path.join(current_app.root_path, current_app.config['UPLOAD_FOLDER'], 'posts')
+    assert not os.path.exists(os.path.join(folder, job.upload))
+
+
+def test_image_job_unexpected_error(client: FlaskClient, token: str, monkeypatch: pytest.MonkeyPatch) -> None:
+    post = db.session.scalar(sa.select(Post).filter_by(title='foo'))
+    assert post is not None
+    response = client.put(f'api/v1/posts/{post.id}/image',
+                          data={'image': (io.BytesIO(b'not an image'), 'broken.jpg', 'image/jpeg')},
+                          headers={'Authorization': f'Bearer {token}'})
+    assert response.status_code == 200
+    job = db.session.scalar(sa.select(ImageJob).order_by(ImageJob.id.desc()))
+    assert job is not None and job.status == 'pending'
+
+    def explode(upload: str, path: str) -> dict:
+        raise RuntimeError('unexpected')
+
+    monkeypatch.setattr('website.images.process_image', explode)
+    job_id, post_id = job.id, post.id
+    image_processor.run(job_id)
+    job = db.session.get(ImageJob, job_id)
+    post = db.session.get(Post, post_id)
+    assert job is not None and post is not None
+    assert job.status == 'failed'
+    assert job.last_error == 'unexpected'
+    assert post.image is None
+
+
 def create_post(
         client: FlaskClient,
         token: str,
@@ -3,6 +3,7 @@ from datetime import datetime, timedelta
 from flask.testing import FlaskClient
 import sqlalchemy as sa
 
+from tests.test_api.test_users import TESTING_USER
 from website import db
 from website.models import User
 
@@ -31,6 +32,77 @@ def test_pagination(client: FlaskClient, token: str) -> None:
     assert response.status_code == 400
 
 
+def test_cursor_pagination(client: FlaskClient, token: str) -> None:
+    users = db.session.scalars(sa.select(User)).all()
+    for sort in ['username', '-registered_on', 'confirmed_on,-username']:
+        usernames: list[str] = []
+        cursor = ''
+        while cursor is not None:
+            response = client.get(f'/api/v1/users?per_page=3&sort={sort}&cursor={cursor}',
+                                  headers={'Authorization': f'Bearer {token}'})
+            assert response.status_code == 200
+            pagination = response.get_json()['pagination']
+            assert 'page' not in pagination and 'total' not in pagination
+            usernames.extend(result['username'] for result in response.get_json()['results'])
+            cursor = pagination['next_cursor']
+        assert sorted(usernames) == sorted(user.username for user in users)
+        if sort == 'username':
+            assert usernames == sorted(usernames)
+    response = client.get('/api/v1/users?cursor=foo', headers={'Authorization': f'Bearer {token}'})
+    assert response.status_code == 400
+    response = client.get('/api/v1/users?per_page=3&cursor=', headers={'Authorization': f'Bearer {token}'})
+    cursor = response.get_json()['pagination']['next_cursor']
+    response = client.get(f'/api/v1/users?sort=username&cursor={cursor}',
+                          headers={'Authorization': f'Bearer {token}'})
+    assert response.status_code == 400
+
+
+def test_count(client: FlaskClient, token: str) -> None:
+    users = db.session.scalars(sa.select(User)).all()
+    response = client.get('/api/v1/users?per_page=2', headers={'Authorization': f'Bearer {token}'})
+    pagination = response.get_json()['pagination']
+    assert pagination['count'] == 'exact'
+    assert pagination['total'] == len(users)
+    assert pagination['has_next'] is True
+    response = client.get('/api/v1/users?count=estimate&username=test',
+                          headers={'Authorization': f'Bearer {token}'})
+    assert response.status_code == 200
+    pagination = response.get_json()['pagination']
+    assert pagination['count'] == 'estimate'
+    assert isinstance(pagination['total'], int)
+    response = client.get(f'/api/v1/users/{TESTING_USER}/entries?count=estimate&date[gte]=2023-01-01',
+                          headers={'Authorization': f'Bearer {token}'})
+    assert response.status_code == 200
+    assert isinstance(response.get_json()['pagination']['total'], int)
+    response = client.get(f'/api/v1/users?count=none&per_page=2&page={len(users) // 2}',
+                          headers={'Authorization': f'Bearer {token}'})
+    assert response.status_code == 200
+    pagination = response.get_json()['pagination']
+    assert pagination['count'] == 'none'
+    assert 'total' not in pagination and 'last_page' not in pagination
+    assert pagination['has_next'] is bool(len(users) % 2)
+    response = client.get('/api/v1/users?count=none&page=999', headers={'Authorization': f'Bearer {token}'})
+    assert response.get_json()['results'] == []
+    assert response.get_json()['pagination']['has_next'] is False
+    response = client.get('/api/v1/users?cursor=&count=exact', headers={'Authorization': f'Bearer {token}'})
+    assert response.get_json()['pagination']['total'] == len(users)
+    response = client.get('/api/v1/users?count=foo', headers={'Authorization': f'Bearer {token}'})
+    assert response.status_code == 400
+
+
+def test_count_window(client: FlaskClient, token: str, captured_statements: list[str]) -> None:
+    response = client.get('/api/v1/users?per_page=2', headers={'Authorization': f'Bearer {token}'})
+    assert response.status_code == 200
+    assert len([statement for statement in captured_statements if 'count(*) OVER ()' in statement]) == 1
+    assert not any('FROM (SELECT' in statement for statement in captured_statements)
+    captured_statements.clear()
+    response = client.get('/api/v1/users?per_page=2&page=999', headers={'Authorization': f'Bearer {token}'})
+    pagination = response.get_json()['pagination']
+    assert pagination['page'] == pagination['last_page']
+    assert len(response.get_json()['results']) > 0
+    assert any('FROM (SELECT' in statement for statement in captured_statements)
+
+
 def test_fields(client: FlaskClient, token: str) -> None:
     response = client.get('/api/v1/users', headers={'Authorization': f'Bearer {token}'})
     assert response.status_code == 200
@@ -50,6 +122,46 @@ def test_fields(client: FlaskClient, token: str) -> None:
     assert 'uuid' and 'url' in results[0].keys()
 
 
+def test_sparse_fields(client: FlaskClient, token: str, captured_statements: list[str]) -> None:
+    response = client.get('/api/v1/posts?fields=id,title', headers={'Authorization': f'Bearer {token}'})
+    assert response.status_code == 200
+    assert all(set(result) == {'id', 'title'} for result in response.get_json()['results'])
+    assert not any('posts.content' in statement for statement in captured_statements)
+    assert not any('posts.author_id' in statement for statement in captured_statements)
+    captured_statements.clear()
+    response = client.get('/api/v1/posts?fields=title,author', headers={'Authorization': f'Bearer {token}'})
+    assert response.status_code == 200
+    assert all('username' in result['author'] for result in response.get_json()['results'])
+    assert not any('posts.content' in statement for statement in captured_statements)
+    assert not any('users_1.password_hash' in statement for statement in captured_statements)
+    captured_statements.clear()
+    response = client.get('/api/v1/entries?fields=uuid,duration', headers={'Authorization': f'Bearer {token}'})
+    assert response.status_code == 200
+    assert all('duration' in result for result in response.get_json()['results'])
+    assert not any('entries.ends_at' in statement for statement in captured_statements)
+
+
+def test_eager_loading(client: FlaskClient, token: str, captured_statements: list[str]) -> None:
+    counts = []
+    for per_page in [1, 10]:
+        captured_statements.clear()
+        response = client.get(f'/api/v1/entries?per_page={per_page}',
+                              headers={'Authorization': f'Bearer {token}'})
+        assert response.status_code == 200
+        assert all('username' in result['user'] for result in response.get_json()['results'])
+        counts.append(len(captured_statements))
+    assert counts[0] == counts[1]
+    captured_statements.clear()
+    response = client.get('/api/v1/entries?include=services', headers={'Authorization': f'Bearer {token}'})
+    assert response.status_code == 200
+    assert all('user' not in result and 'services' in result for result in response.get_json()['results'])
+    assert not any('users_1' in statement for statement in captured_statements)
+    captured_statements.clear()
+    response = client.get('/api/v1/posts?fields=id,author&include=', headers={'Authorization': f'Bearer {token}'})
+    assert response.status_code == 200
+    assert all(set(result) == {'id'} for result in response.get_json()['results'])
+
+
 def test_sort(client: FlaskClient, token: str) -> None:
     response = client.get('/api/v1/users', headers={'Authorization': f'Bearer {token}'})
     assert response.status_code == 200
@@ -82,6 +194,24 @@ def test_sort(client: FlaskClient, token: str) -> None:
                for i in range(len(results) - 1))
 
 
+def test_sort_tiebreaker(client: FlaskClient, token: str) -> None:
+    response = client.get('/api/v1/entries?sort=date,-time&per_page=50', headers={'Authorization': f'Bearer {token}'})
+    assert response.status_code == 200
+    results: list[dict] = response.get_json()['results']
+    assert all((results[i]['date'], results[i+1]['time']) <= (results[i+1]['date'], results[i]['time'])
+               for i in range(len(results) - 1))
+    seen: list[str] = []
+    page = 1
+    while True:
+        response = client.get(f'/api/v1/entries?sort=date&per_page=1&page={page}',
+                              headers={'Authorization': f'Bearer {token}'})
+        seen.extend(result['uuid'] for result in response.get_json()['results'])
+        if not response.get_json()['pagination']['has_next']:
+            break
+        page += 1
+    assert len(seen) == len(set(seen)) == response.get_json()['pagination']['total']
+
+
 def test_filters(client: FlaskClient, token: str) -> None:
     response = client.get('/api/v1/users', headers={'Authorization': f'Bearer {token}'})
     assert response.status_code == 200
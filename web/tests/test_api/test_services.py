@@ -1,3 +1,4 @@
+from datetime import date, timedelta
 import secrets
 
 from flask.testing import FlaskClient
@@ -56,6 +57,52 @@ def test_update_service(client: FlaskClient, token: str) -> None:
     assert response.status_code == 400
 
 
+def test_update_service_duration(client: FlaskClient, token: str) -> None:
+    resp, _ = create_service(client, token, {'name': f'service_{secrets.token_hex(4)}', 'duration': 1})
+    service_id = resp.get_json()['id']
+    payload = {
+        'date': (date.today() + timedelta(days=120)).isoformat(),
+        'time': '10:00',
+        'services': [service_id]
+    }
+    response = client.post('/api/v1/entries', json=payload, headers={'Authorization': f'Bearer {token}'})
+    assert response.status_code == 201
+    entry = response.get_json()
+    assert entry['duration'] == '1.0'
+    response = client.put(f'/api/v1/services/{service_id}', json={'name': f'service_{secrets.token_hex(4)}', 'duration': '2.5'},
+                          headers={'Authorization': f'Bearer {token}'})
+    assert response.status_code == 200
+    response = client.get(f'/api/v1/entries/{entry["uuid"]}', headers={'Authorization': f'Bearer {token}'})
+    assert response.get_json()['duration'] == '2.5'
+    assert response.get_json()['ending_time'] - response.get_json()['timestamp'] == 2.5 * 3600
+
+
+def test_update_service_duration_conflict(client: FlaskClient, token: str) -> None:
+    services = [create_service(client, token, {'name': f'service_{secrets.token_hex(4)}', 'duration': 1})[0]
+                .get_json()['id'] for _ in range(2)]
+    day = (date.today() + timedelta(days=125)).isoformat()
+    entries = []
+    for time, service_id in [('10:00', services[0]), ('11:30', services[1]), ('13:00', services[0])]:
+        response = client.post('/api/v1/entries', json={'date': day, 'time': time, 'services': [service_id]},
+                               headers={'Authorization': f'Bearer {token}'})
+        assert response.status_code == 201
+        entries.append(response.get_json()['uuid'])
+    response = client.put(f'/api/v1/services/{services[0]}', json={'name': f'service_{secrets.token_hex(4)}', 'duration': 3},
+                          headers={'Authorization': f'Bearer {token}'})
+    assert response.status_code == 400
+    conflicts = response.get_json()['description']['json']['duration']
+    assert len(conflicts) == 1
+    assert entries[0] in conflicts[0] and entries[1] in conflicts[0]
+    response = client.put(f'/api/v1/services/{services[0]}', json={'name': f'service_{secrets.token_hex(4)}', 'duration': 3.5},
+                          headers={'Authorization': f'Bearer {token}'})
+    assert response.status_code == 400
+    conflicts = response.get_json()['description']['json']['duration']
+    assert len(conflicts) == 2
+    assert entries[0] in conflicts[1] and entries[2] in conflicts[1]
+    response = client.get(f'/api/v1/services/{services[0]}', headers={'Authorization': f'Bearer {token}'})
+    assert response.get_json()['duration'] == '1.0'
+
+
 def test_delete_service(client: FlaskClient, token: str) -> None:
     resp, _ = create_service(client, token)
     service = db.session.scalar(sa.select(Service).filter_by(name=resp.get_json()['name']))
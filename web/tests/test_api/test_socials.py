@@ -1,13 +1,13 @@
 import os
 
 from apifairy.fields import FileStorage
-from flask import current_app
+from flask import Flask, current_app
 from flask.testing import FlaskClient
 import sqlalchemy as sa
 
 from tests.test_api.test_users import TESTING_USER
 from website import db
-from website.models import SocialMedia
+from website.models import SocialMedia, User
 from website.utils import delete_image
 
 
@@ -71,6 +71,58 @@ def test_update_my_socials(client: FlaskClient, token: str) -> None:
     assert len(response.get_json()['errors']['json']) == len(invalid_payload)
 
 
+def test_social_handles(app: Flask, client: FlaskClient, token: str, captured_statements: list[str],
+                        logged_in_web: FlaskClient) -> None:
+    payload = {
+        "phone_number": "+1 650 253 0000",
+        "telegram": "https://t.me/handle",
+        "vk": "https://vk.com/handle",
+    }
+    response = client.put('api/v1/me/socials', json=payload,
+                          headers={'Authorization': f'Bearer {token}'})
+    assert response.status_code == 200
+    socials = response.get_json()
+    assert socials['phone_number'] == '+16502530000'
+    assert socials['phone_number_display'] == '+1 650-253-0000'
+    assert socials['telegram_handle'] == 'handle'
+    assert socials['vk_handle'] == 'handle'
+    captured_statements.clear()
+    with app.app_context():
+        response = logged_in_web.get('/users/test/profile')
+    assert response.status_code == 200
+    assert b'+1 650-253-0000' in response.data
+    assert b'@handle' in response.data
+    assert b'Your previous entry was on' in response.data
+    assert len([statement for statement in captured_statements if 'UNION ALL' in statement]) == 1
+    assert len([statement for statement in captured_statements if 'entries.date' in statement]) == 1
+    social = db.session.scalar(sa.select(SocialMedia).filter_by(user_id=TESTING_USER))
+    assert social is not None
+    social.update({'phone_number': None, 'telegram': None, 'vk': None})
+    db.session.commit()
+    assert social.phone_number_display is None
+    assert social.telegram_handle is None
+
+
+def test_duplicate_phone_number(client: FlaskClient, token: str) -> None:
+    headers = {'Authorization': f'Bearer {token}'}
+    response = client.put('api/v1/me/socials', json={'phone_number': '+16502530000'}, headers=headers)
+    assert response.status_code == 200
+    other = db.session.scalar(sa.select(User).filter_by(username='user_0'))
+    assert other is not None
+    social = SocialMedia(user_id=other.uuid)
+    db.session.add(social)
+    db.session.commit()
+    try:
+        response = client.put(f'api/v1/socials/{social.uuid}', json={'phone_number': '+1 650 253 0000'},
+                              headers=headers)
+        assert response.status_code == 400
+        assert 'phone_number' in response.get_json()['description']['json']
+    finally:
+        db.session.delete(social)
+        db.session.commit()
+        response = client.put('api/v1/me/socials', json={'phone_number': None}, headers=headers)
+
+
 def test_update_avatar(client: FlaskClient, token: str, image_file: FileStorage) -> None:
     response = client.get('api/v1/me/socials', headers={'Authorization': f'Bearer {token}'})
     assert response.status_code == 200
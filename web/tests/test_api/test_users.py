@@ -1,8 +1,13 @@
 import secrets
+from uuid import UUID
 
 from flask.testing import FlaskClient
+import sqlalchemy as sa
 from werkzeug.test import TestResponse
 
+from website import db
+from website.models import User
+
 
 TESTING_USER = '594d00de-82b0-4ac0-8beb-9b2a9e7c919e'
 
@@ -129,6 +134,29 @@ def test_delete_user(client: FlaskClient, token: str) -> None:
     assert response.status_code == 403
 
 
+def test_token_cache(client: FlaskClient, token: str, captured_statements: list[str]) -> None:
+    user_response, payload = create_user(client)
+    uuid = user_response.get_json()['uuid']
+    response = client.post('/api/v1/get-auth-token', auth=(payload['username'], payload['password']))
+    user_token = response.get_json()['token']
+    client.get('/api/v1/services', headers={'Authorization': f'Bearer {user_token}'})
+    db.session.remove()
+    captured_statements.clear()
+    response = client.get('/api/v1/services', headers={'Authorization': f'Bearer {user_token}'})
+    assert response.status_code == 200
+    assert not any('FROM users' in statement for statement in captured_statements)
+    response = client.put(f'/api/v1/users/{uuid}', json={'username': f'{payload["username"]}_2'},
+                          headers={'Authorization': f'Bearer {token}'})
+    assert response.status_code == 200
+    response = client.get('/api/v1/me', headers={'Authorization': f'Bearer {user_token}'})
+    assert response.get_json()['username'] == f'{payload["username"]}_2'
+    user = db.session.get(User, UUID(uuid))
+    db.session.delete(user)
+    db.session.commit()
+    response = client.get('/api/v1/services', headers={'Authorization': f'Bearer {user_token}'})
+    assert response.status_code == 401
+
+
 def create_user_payload() -> dict:
     user = secrets.token_hex(4)
     payload = {
@@ -1,5 +1,7 @@
+import os
+
 from apifairy import APIFairy
-from flask import Flask
+from flask import Flask, Response, request
 from flask_admin import Admin
 from flask_bcrypt import Bcrypt
 from flask_ckeditor import CKEditor
@@ -8,8 +10,12 @@ from flask_login import LoginManager
 from flask_mail import Mail
 from flask_marshmallow import Marshmallow
 from flask_migrate import Migrate
+from werkzeug.middleware.proxy_fix import ProxyFix
 
+from .cache import DiskCache, FragmentCache, TTLCache
 from .database import SQLAlchemy
+from .hashing import HashingPool, TokenBucketLimiter
+from .storage import init_storage
 from config import config
 
 db = SQLAlchemy()
@@ -25,11 +31,17 @@ apifairy = APIFairy()
 ma = Marshmallow()
 basic_auth = HTTPBasicAuth()
 token_auth = HTTPTokenAuth()
+token_cache = TTLCache()
+image_cache = DiskCache()
+fragment_cache = FragmentCache()
+password_pool = HashingPool()
+login_limiter = TokenBucketLimiter()
 
 
 def create_app(config_name: str) -> Flask:
     app = Flask(__name__)
     app.config.from_object(config[config_name])
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['PROXY_FIX_X_FOR'])  # type: ignore[method-assign]
     db.init_app(app)
     bcrypt.init_app(app)
     migrate.init_app(app, db)
@@ -39,22 +51,46 @@ def create_app(config_name: str) -> Flask:
     ckeditor.init_app(app)
     apifairy.init_app(app)
     ma.init_app(app)
+    token_cache.init_app(app, 'TOKEN_CACHE')
+    image_cache.init_app(app, 'IMAGE_CACHE')
+    fragment_cache.init_app(app, 'FRAGMENT_CACHE')
+    init_storage(app)
+    password_pool.init_app(app)
+    login_limiter.init_app(app, 'LOGIN_RATE')
+
+    from .outbox import outbox
+    outbox.init_app(app)
 
     from .api.v1 import api as api_v1, auth as api_auth, errors
+    from .api.v1.availability import for_availability
     from .api.v1.entries import for_entries
     from .api.v1.posts import for_posts
     from .api.v1.services import for_services
     from .api.v1.socials import for_socials
     from .api.v1.users import for_users
     from .auth.routes import auth
-    from .main.routes import main, handle_error
+    from .images import image_processor
+    from .main.routes import main, handle_error, post_fragment
     from .models import add_admin_views, User, UUID_, AnonymousUser
     from .users.routes import users
+    from .utils import image_srcset, image_url
 
     @app.before_request
     def before_request() -> None:
         db.session()
 
+    @app.after_request
+    def cache_images(response: Response) -> Response:
+        filename = (request.view_args or {}).get('filename', '')
+        placeholders = {app.config['DEFAULT_AVATAR'], *app.config['IMAGE_PLACEHOLDERS'].values()}
+        if request.endpoint == 'static' and filename.startswith('images/') and \
+                os.path.basename(filename) not in placeholders:
+            response.cache_control.no_cache = None
+            response.cache_control.public = True
+            response.cache_control.max_age = app.config['IMAGE_CACHE_MAX_AGE']
+            response.cache_control.immutable = True
+        return response
+
     @app.teardown_appcontext
     def shutdown_session(response_or_exc) -> None:  # type: ignore[no-untyped-def]
         db.session.remove()
@@ -64,7 +100,12 @@ def create_app(config_name: str) -> Flask:
         return db.session.get(User, user_id)
 
     login_manager.anonymous_user = AnonymousUser
+    image_processor.init_app(app)
+    app.add_template_global(image_srcset)
+    app.add_template_global(image_url)
+    app.add_template_global(post_fragment)
     add_admin_views(db.session)
+    api_v1.register_blueprint(for_availability)
     api_v1.register_blueprint(for_entries)
     api_v1.register_blueprint(for_posts)
     api_v1.register_blueprint(for_services)
@@ -1,18 +1,34 @@
-from typing import Type, Any
+from datetime import date as date_, datetime, time as time_, timedelta
+from decimal import Decimal
+from functools import lru_cache, partial
+import operator
+from typing import Type, Any, Callable
 
+from flask import current_app, abort
+from itsdangerous import URLSafeSerializer, BadData
 from marshmallow import Schema
+from marshmallow.fields import Nested, String
+from psycopg2 import errorcodes
 import sqlalchemy as sa
-from sqlalchemy.sql.schema import Sequence
+from sqlalchemy.exc import IntegrityError
+import sqlalchemy.orm as so
+from sqlalchemy.ext.compiler import compiles
 from sqlalchemy.orm.decl_api import DeclarativeMeta
-from sqlalchemy.orm import WriteOnlyCollection
+from sqlalchemy.orm import WriteOnlyCollection, InstrumentedAttribute
+from sqlalchemy.sql.compiler import SQLCompiler
 
 from .. import db, apifairy
-from ..models import Entry
+from ..models import MIN_SLOT_MINUTES, Entry
+
+PARAMETERS = ('fields', 'include', 'filter', 'sort')
+OPERATORS = {'_gte': operator.ge, '_lte': operator.le, '_gt': operator.gt, '_lt': operator.lt}
+resources: dict[str, dict[str, Any]] = {}
 
 
 @apifairy.process_apispec
 def fields(spec: dict[str, dict | Any]) -> dict[str, dict]:
-    paths = ['/api/v1/posts',
+    paths = ['/api/v1/availability',
+             '/api/v1/posts',
              '/api/v1/users',
              '/api/v1/entries',
              '/api/v1/services',
@@ -28,7 +44,7 @@ def fields(spec: dict[str, dict | Any]) -> dict[str, dict]:
             parameters = operation['get']['parameters']
             if parameters:
                 for parameter in parameters:
-                    if parameter['name'] in ['fields', 'sort']:
+                    if parameter['name'] in ['fields', 'include', 'sort', 'services']:
                         parameter['explode'] = False
             get_responses = operation['get']['responses']
             if '204' in get_responses:
@@ -40,28 +56,140 @@ def fields(spec: dict[str, dict | Any]) -> dict[str, dict]:
     return spec
 
 
-def sanitize_fields(fields: dict[str, list[str]] | dict[str, str],
-                    schema: Type[Schema],
-                    param: str = 'fields'
-                    ) -> list | dict:
-    formatted_fields = set()
-    if param == 'fields':
-        for field in fields[param]:
-            if field in schema().fields.keys() and field != param:
-                formatted_fields.add(field)
-    elif param == 'filter':
-        filters = {}
-        for field, value in fields.items():
-            if field in schema().fields.keys():
-                filters.update({field: value})
-        return filters  # type: ignore[return-value]
-    elif param == 'sort':
-        for field in fields[param]:
-            if field.lstrip('-') in schema().fields.keys() and field.lstrip('-') != param:
-                if field.startswith('-'):
-                    field = field.lstrip('-') + ' DESC'
-                formatted_fields.add(field)
-    return list(formatted_fields)
+def register_resource(name: str,
+                      model: Type[DeclarativeMeta],
+                      fields: Type[Schema],
+                      filter: Type[Schema],
+                      sort: Type[Schema]) -> None:
+    mapper = so.class_mapper(model)
+    filters: dict[str, Callable[[Any], sa.ColumnElement]] = {}
+    for key, field in filter().fields.items():
+        suffix = next((suffix for suffix in OPERATORS if key.endswith(suffix)), None)
+        if suffix is not None:
+            filters[key] = partial(OPERATORS[suffix], getattr(model, key[:-len(suffix)]))
+        elif isinstance(field, String):
+            filters[key] = getattr(model, key).ilike
+        else:
+            filters[key] = partial(operator.eq, getattr(model, key))
+    field_schema = fields()
+    resources[name] = {
+        'model': model,
+        'schema': fields,
+        'fields': frozenset(key for key in field_schema.fields if key not in PARAMETERS),
+        'nested': frozenset(key for key, field in field_schema.fields.items() if isinstance(field, Nested)),
+        'filters': filters,
+        'sort': {key: getattr(model, key) for key in sort().fields if key not in PARAMETERS},
+        'primary_key': getattr(model, mapper.primary_key[0].key),
+    }
+
+
+@lru_cache(maxsize=256)
+def resource_options(name: str, only: tuple[str, ...] | None) -> list:
+    return loader_options(resources[name]['model'], resources[name]['schema'](only=only))
+
+
+def loader_options(model: Type[DeclarativeMeta], schema: Schema) -> list:
+    mapper = so.class_mapper(model)
+    property_columns: dict[str, tuple[str, ...]] = getattr(model, 'property_columns', {})
+    columns = {column.key for column in mapper.primary_key}
+    options = []
+    restrict = True
+    for name, field in schema.dump_fields.items():
+        attr = field.attribute or name
+        if attr in mapper.column_attrs:
+            columns.add(attr)
+        elif attr in mapper.relationships:
+            relationship = mapper.relationships[attr]
+            columns.update(mapper.get_property_by_column(column).key for column in relationship.local_columns)
+            if isinstance(field, Nested) and relationship.lazy != 'write_only':
+                strategy = so.selectinload if relationship.uselist else so.joinedload
+                options.append(strategy(getattr(model, attr)).options(
+                    *loader_options(relationship.mapper.class_, field.schema)))
+        elif attr in property_columns:
+            columns.update(property_columns[attr])
+        elif isinstance(getattr(model, attr, None), property):
+            restrict = False
+    if restrict:
+        options.append(so.load_only(*(getattr(model, column) for column in columns)))
+    return options
+
+
+def sort_order(sort: dict[str, list[str]] | None,
+               resource: dict[str, Any]
+               ) -> list[tuple[InstrumentedAttribute, bool]]:
+    order: list[tuple[InstrumentedAttribute, bool]] = []
+    for field in (sort or {}).get('sort', []):
+        column = resource['sort'].get(field.lstrip('-'))
+        if column is not None and column.key not in (column.key for column, _ in order):
+            order.append((column, field.startswith('-')))
+    primary_key = resource['primary_key']
+    if primary_key.key not in (column.key for column, _ in order):
+        order.append((primary_key, order[-1][1] if order else False))
+    return order
+
+
+def keyset_condition(order: list[tuple[InstrumentedAttribute, bool]], values: list[Any]) -> sa.ColumnElement:
+    if (len({desc for _, desc in order}) == 1 and
+            not any(value is None or column.expression.nullable for (column, _), value in zip(order, values))):
+        columns = sa.tuple_(*(column for column, _ in order))
+        bounds = sa.tuple_(*(sa.literal(value, column.type) for (column, _), value in zip(order, values)))
+        return columns < bounds if order[0][1] else columns > bounds
+    conditions = []
+    for i, ((column, desc), value) in enumerate(zip(order, values)):
+        equals = [prev.is_(None) if prev_value is None else prev == prev_value
+                  for (prev, _), prev_value in zip(order[:i], values[:i])]
+        if value is None:
+            follows = column.is_not(None) if desc else sa.false()
+        elif desc:
+            follows = column < value
+        else:
+            follows = sa.or_(column > value, column.is_(None))
+        conditions.append(sa.and_(*equals, follows))
+    return sa.or_(*conditions)
+
+
+def encode_cursor(order: list[tuple[InstrumentedAttribute, bool]], row: Any) -> str:
+    values = []
+    for column, _ in order:
+        value = getattr(row, column.key)
+        values.append(value if value is None else value.isoformat() if hasattr(value, 'isoformat') else str(value))
+    serializer = URLSafeSerializer(current_app.config['SECRET_KEY'], salt='pagination-cursor')
+    return serializer.dumps({'keys': [column.key for column, _ in order], 'values': values})  # type: ignore[return-value]
+
+
+def decode_cursor(cursor: str, order: list[tuple[InstrumentedAttribute, bool]]) -> list[Any]:
+    serializer = URLSafeSerializer(current_app.config['SECRET_KEY'], salt='pagination-cursor')
+    try:
+        data: dict = serializer.loads(cursor)
+    except BadData:
+        abort(400, {'query': {'cursor': ['Invalid cursor']}})
+    if data.get('keys') != [column.key for column, _ in order]:
+        abort(400, {'query': {'cursor': ['Cursor does not match requested sort order']}})
+    values = []
+    for (column, _), value in zip(order, data['values']):
+        python_type = column.type.python_type
+        if value is not None:
+            value = python_type.fromisoformat(value) if hasattr(python_type, 'fromisoformat') else python_type(value)
+        values.append(value)
+    return values
+
+
+def build_query(fields: dict[str, list[str]] | None,
+                filter: dict[str, Any] | None,
+                sort: dict[str, list[str]] | None,
+                obj: Type[DeclarativeMeta] | WriteOnlyCollection,
+                resource: str
+                ) -> tuple[sa.Select, list | None, list[tuple[InstrumentedAttribute, bool]]]:
+    registry = resources[resource]
+    only = list(dict.fromkeys(key for key in (fields or {}).get('fields', []) if key in registry['fields'])) or None
+    if fields and 'include' in fields:
+        only = [key for key in only or registry['fields'] if key not in registry['nested'] or key in fields['include']]
+    data = obj.select() if isinstance(obj, WriteOnlyCollection) else sa.select(obj)
+    data = data.options(*resource_options(resource, None if only is None else tuple(sorted(only))))
+    conditions = [registry['filters'][key](value) for key, value in (filter or {}).items() if key in registry['filters']]
+    if conditions:
+        data = data.filter(*conditions)
+    return data, only, sort_order(sort, registry)
 
 
 def sanitize_query(fields: dict[str, list[str]] | None,
@@ -69,79 +197,123 @@ def sanitize_query(fields: dict[str, list[str]] | None,
                    sort: dict[str, list[str]] | None,
                    pagination: dict[str, int],
                    obj: Type[DeclarativeMeta] | WriteOnlyCollection,
-                   model: Type[DeclarativeMeta],
-                   mapping: dict[str, Type[Schema]]
-                   ) -> tuple[Sequence, list | None, dict[str, int]]:
-    if not fields or not (only := sanitize_fields(fields, mapping['fields'])):
-        only = None
-    data = obj.select() if isinstance(obj, WriteOnlyCollection) else sa.select(obj)
-    if filter:
-        filters: dict[str, str] = sanitize_fields(filter, mapping['filter'], param='filter')  # type: ignore[assignment]
-        mapped_filters: list[tuple] = []
-        for param, value in filters.items():
-            if param.endswith(('_gte', '_lte')):
-                mapped_filters.append((getattr(model, param[:-4]), value, param[-4:]))
-            elif param.endswith(('_gt', '_lt')):
-                mapped_filters.append((getattr(model, param[:-3]), value, param[-3:]))
-            else:
-                mapped_filters.append((getattr(model, param), value))
-        conditions = []
-        for mapped_filter in mapped_filters:
-            if len(mapped_filter) == 3:
-                criterion, value, operator = mapped_filter
-                if operator == '_gte':
-                    conditions.append(criterion >= value)
-                elif operator == '_lte':
-                    conditions.append(criterion <= value)
-                elif operator == '_gt':
-                    conditions.append(criterion > value)
-                elif operator == '_lt':
-                    conditions.append(criterion < value)
-            else:
-                criterion, value = mapped_filter
-                if isinstance(value, str):
-                    conditions.append(criterion.ilike(value))
-                else:
-                    conditions.append(criterion == value)
-        data = data.filter(sa.and_(*conditions))
-    if sort:
-        criteria = sanitize_fields(sort, mapping['sort'], param='sort')
-        data = data.order_by(sa.text(', '.join(criterion for criterion in criteria)))
-    count = db.session.scalar(sa.select(sa.func.count()).select_from(data.subquery()))
-    if not count:
-        pagination['total'] = 0
-        pagination['last_page'] = 1
-        offset = 0
+                   resource: str
+                   ) -> tuple[list, list | None, dict[str, int]]:
+    data, only, order = build_query(fields, filter, sort, obj, resource)
+    count = str(pagination.get('count') or ('none' if 'cursor' in pagination else 'exact'))
+    pagination['count'] = count  # type: ignore[assignment]
+    per_page = pagination['per_page']
+    if 'cursor' in pagination:
+        total = count_rows(data, count)
+        cursor = pagination.pop('cursor')  # type: ignore[arg-type]
+        if cursor:
+            data = data.filter(keyset_condition(order, decode_cursor(cursor, order)))  # type: ignore[arg-type]
+        data = data.order_by(*(column.desc() if desc else column.asc() for column, desc in order))
+        results = db.session.scalars(data.limit(per_page + 1)).all()
+        pagination.pop('page', None)
+        pagination['has_next'] = len(results) > per_page
+        pagination['next_cursor'] = (encode_cursor(order, results[per_page - 1])  # type: ignore[assignment]
+                                     if pagination['has_next'] else None)
     else:
-        pagination['total'] = count
-        quotient, remainder = divmod(pagination['total'], pagination['per_page'])
-        pagination['last_page'] = quotient + 1 if remainder else quotient
-        if pagination['page'] > pagination['last_page']:
-            pagination['page'] = pagination['last_page']
-        offset = (pagination['page'] - 1) * pagination['per_page']
-    data = data.limit(pagination['per_page']).offset(offset)
-    data = db.session.scalars(data).all()  # type: ignore[assignment]
-    return data, only, pagination  # type: ignore[return-value]
-
-
-def can_create_entry(entry: Entry, context: str = 'create') -> bool:
-    filters = [Entry.date == entry.date, Entry.time <= entry.time]
-    if context == 'update':
-        filters.append(Entry.uuid != entry.uuid)
-    prev_entry = db.session.scalar(
-        sa.select(Entry)
-        .filter(
-            sa.and_(*filters))
-        .order_by(Entry.date.desc(), Entry.time.desc()))
-    if prev_entry and prev_entry.ending_time > entry.timestamp:
-        return False
-    next_entry = db.session.scalar(
-        sa.select(Entry)
-        .filter(
-            sa.and_(
-                Entry.date == entry.date,
-                Entry.time > entry.time))
-        .order_by(Entry.date, Entry.time))
-    if next_entry and next_entry.timestamp < entry.ending_time:
-        return False
+        data = data.order_by(*(column.desc() if desc else column.asc() for column, desc in order))
+        if count == 'exact':
+            results, total = fetch_page(data, pagination['page'], per_page)
+            if not results and pagination['page'] > 1:
+                total = count_rows(data, count)
+                pagination['page'] = last_page(total, per_page)  # type: ignore[arg-type]
+                if total:
+                    results, _ = fetch_page(data, pagination['page'], per_page)
+            pagination['has_next'] = pagination['page'] < last_page(total, per_page)  # type: ignore[arg-type]
+        else:
+            total = count_rows(data, count)
+            offset = (pagination['page'] - 1) * per_page
+            results = db.session.scalars(data.limit(per_page + 1).offset(offset)).all()
+            pagination['has_next'] = len(results) > per_page
+        if total is not None:
+            pagination['last_page'] = last_page(total, per_page)
+    if total is not None:
+        pagination['total'] = total
+    return list(results[:per_page]), only, pagination
+
+
+def last_page(total: int, per_page: int) -> int:
+    quotient, remainder = divmod(total, per_page)
+    return max(quotient + 1 if remainder else quotient, 1)
+
+
+def fetch_page(query: sa.Select[Any], page: int, per_page: int) -> tuple[list, int]:
+    query = query.add_columns(sa.func.count().over()).limit(per_page).offset((page - 1) * per_page)
+    rows = db.session.execute(query).all()
+    return [row[0] for row in rows], rows[0][1] if rows else 0
+
+
+class Explain(sa.Executable, sa.ClauseElement):
+    inherit_cache = False
+
+    def __init__(self, statement: sa.Select[Any]) -> None:
+        self.statement = statement
+
+
+@compiles(Explain, 'postgresql')
+def compile_explain(element: Explain, compiler: SQLCompiler, **kwargs: Any) -> str:
+    return f'EXPLAIN (FORMAT JSON) {compiler.process(element.statement, **kwargs)}'
+
+
+def count_rows(query: sa.Select[Any], count: str) -> int | None:
+    if count == 'exact':
+        return db.session.scalar(sa.select(sa.func.count()).select_from(query.subquery()))
+    if count == 'estimate':
+        plan = db.session.connection().scalar(Explain(query))
+        if plan is None:
+            return count_rows(query, 'exact')
+        return int(plan[0]['Plan']['Plan Rows'])
+    return None
+
+
+def save_entry(entry: Entry) -> bool:
+    db.session.add(entry)
+    try:
+        db.session.commit()
+    except IntegrityError as error:
+        db.session.rollback()
+        if getattr(error.orig, 'pgcode', None) == errorcodes.EXCLUSION_VIOLATION:
+            return False
+        raise
     return True
+
+
+def to_minutes(value: time_) -> int:
+    return value.hour * 60 + value.minute
+
+
+def from_minutes(value: int) -> time_:
+    return time_(*divmod(value, 60))
+
+
+def get_availability(date_from: date_, date_to: date_, duration: Decimal) -> list[dict[str, date_ | time_]]:
+    opening = to_minutes(time_.fromisoformat(current_app.config['OPENING_TIME']))
+    closing = to_minutes(time_.fromisoformat(current_app.config['CLOSING_TIME']))
+    length = int(duration * 60)
+    entries = db.session.execute(
+        sa.select(Entry.date, Entry.time, Entry.duration_minutes)
+        .filter(Entry.date.between(date_from, date_to))
+        .order_by(Entry.date, Entry.time)).all()
+    busy: dict[date_, list[tuple[int, int]]] = {}
+    for day, time, duration_minutes in entries:
+        start = to_minutes(time)
+        busy.setdefault(day, []).append((start, start + max(duration_minutes, MIN_SLOT_MINUTES)))
+    now = datetime.now()
+    slots: list[dict[str, date_ | time_]] = []
+    day = date_from
+    while day <= date_to:
+        cursor = opening
+        if day == now.date():
+            cursor = max(cursor, to_minutes(now.time()) + 1)
+        for start, end in sorted(busy.get(day, [])):
+            if min(start, closing) - cursor >= length:
+                slots.append({'date': day, 'start': from_minutes(cursor), 'end': from_minutes(start)})
+            cursor = max(cursor, end)
+        if closing - cursor >= length:
+            slots.append({'date': day, 'start': from_minutes(cursor), 'end': from_minutes(closing)})
+        day += timedelta(days=1)
+    return slots
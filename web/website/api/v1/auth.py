@@ -1,9 +1,16 @@
-from apifairy import authenticate, response
+from datetime import datetime
+from typing import cast
+
+from apifairy import authenticate, response, other_responses
+import click
+from flask import abort, request
 import sqlalchemy as sa
+import sqlalchemy.orm as so
+from sqlalchemy.engine import CursorResult
 
 from . import api
-from ... import db, basic_auth, token_auth
-from ...models import User, current_user
+from ... import db, basic_auth, token_auth, token_cache, login_limiter
+from ...models import User, Token, current_user
 from ...schemas import TokenSchema
 
 
@@ -13,10 +20,12 @@ token_schema = TokenSchema()
 @basic_auth.verify_password
 def verify_password(username: str, password: str) -> User | None:
     if username and password:
-        user = db.session.scalar(sa.select(User).filter_by(username=username))
-        if not user:
-            user = db.session.scalar(sa.select(User).filter_by(email=username))
+        keys = ('ip', request.remote_addr), ('account', username.lower())
+        if not login_limiter.allow(*keys):
+            abort(429)
+        user = User.find(username)
         if user and user.verify_password(password):
+            login_limiter.refund(*keys)
             return user
     return None
 
@@ -27,15 +36,54 @@ def verify_password(username: str, password: str) -> User | None:
 def get_auth_token() -> dict:
     """Get auth token"""
     user: User = basic_auth.current_user()
-    token = user.generate_token(context='auth', salt_context='auth-token')
-    return dict(token=token)
+    token, record = Token.issue(user)
+    db.session.commit()
+    return dict(token=token, expires_at=record.expires_at, scopes=record.scopes)
+
+
+@api.route('/revoke-auth-token', methods=['POST'])
+@authenticate(token_auth)
+@other_responses({204: 'Token revoked'})
+def revoke_auth_token() -> tuple[str, int]:
+    """Revoke the token used to authenticate this request"""
+    auth = token_auth.get_auth()
+    if auth and auth.get('token'):
+        digest = Token.digest(auth['token'])
+        db.session.execute(sa.delete(Token).where(Token.token_hash == digest))
+        db.session.commit()
+        token_cache.delete(digest)
+    return '', 204
 
 
 @token_auth.verify_token
 def verify_token(token: str | bytes) -> User | None:
     user = None
     if token:
-        user = User.verify_token(token, context='auth', salt_context='auth-token')
+        digest = Token.digest(token)
+        if (snapshot := token_cache.get(digest)) is not None:
+            user = User.from_snapshot(snapshot)
+        else:
+            user = load_token(digest)
     elif current_user.is_authenticated:
         user = current_user
     return user
+
+
+def load_token(digest: str) -> User | None:
+    record = db.session.scalar(
+        sa.select(Token)
+        .where(Token.token_hash == digest, Token.expires_at > sa.func.now())
+        .options(so.joinedload(Token.user)))
+    if record is None:
+        return None
+    remaining = (record.expires_at - datetime.now().astimezone()).total_seconds()
+    token_cache.set(digest, record.user.snapshot(), ttl=remaining)
+    return record.user
+
+
+@api.cli.command('cleanup-tokens')
+def cleanup_tokens() -> None:
+    """Delete expired API tokens."""
+    result = cast(CursorResult, db.session.execute(sa.delete(Token).where(Token.expires_at <= sa.func.now())))
+    db.session.commit()
+    click.echo(f'Deleted {result.rowcount} expired tokens')
@@ -0,0 +1,35 @@
+from datetime import date
+from decimal import Decimal
+from typing import Any
+
+from apifairy import authenticate, response, arguments
+from flask import Blueprint, abort
+import sqlalchemy as sa
+
+from ..common import get_availability
+from ... import db, token_auth
+from ...models import Service
+from ...schemas import AvailabilitySchema, FreeSlotsSchema
+
+for_availability = Blueprint('for_availability', __name__)
+
+free_slots_schema = FreeSlotsSchema()
+
+
+@for_availability.route('/availability', methods=['GET'])
+@authenticate(token_auth)
+@arguments(AvailabilitySchema())
+@response(free_slots_schema)
+def get_all(kwargs: dict[str, Any]) -> dict[str, Any]:
+    """Get free time slots for requested services"""
+    services = db.session.scalars(sa.select(Service).filter(Service.id.in_(kwargs['services']))).all()
+    if not services:
+        abort(400, {'json': {'services': ['Please choose at least one existing service']}})
+    date_from: date = kwargs['date_from']
+    date_to: date = kwargs.get('date_to', date_from)
+    duration = sum((service.duration for service in services), Decimal(0))
+    return dict(date_from=date_from,
+                date_to=date_to,
+                duration=duration,
+                services=services,
+                slots=get_availability(date_from, date_to, duration))
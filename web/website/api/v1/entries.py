@@ -5,13 +5,14 @@ from apifairy import authenticate, body, response, other_responses, arguments
 from flask import Blueprint, abort, jsonify, url_for
 from flask.wrappers import Response
 
-from ..common import sanitize_query, can_create_entry
+from ..common import register_resource, sanitize_query, save_entry
 from ... import db, token_auth
 from ...models import Entry, User, Service, get_or_404
 from ...schemas import (EntrySchema, CreateEntrySchema, EntryFieldSchema, EntrySortSchema, EntryFilterSchema,
                         NotFoundSchema, ForbiddenSchema, PaginationSchema, PaginatedSchema)
 
 for_entries = Blueprint('for_entries', __name__)
+register_resource('entries', Entry, EntryFieldSchema, EntryFilterSchema, EntrySortSchema)
 
 entry_schema = EntrySchema()
 entries_schema = PaginatedSchema(EntrySchema(many=True))
@@ -34,14 +35,11 @@ def create_one(kwargs: dict) -> Response:
     entry.services.extend(service for service in services if service)
     entry.date = kwargs['date']
     entry.time = kwargs['time']
-    available = can_create_entry(entry)
-    if not available:
-        link = url_for('api.for_entries.get_all', date=entry.date.strftime("%Y-%m-%d"))
+    link = url_for('api.for_entries.get_all', date=entry.date.strftime("%Y-%m-%d"))
+    if not save_entry(entry):
         message = f'Please choose different date or time. See all entries for this date: {link}'
         messages = {'json': {'datetime': [message]}}
         abort(400, messages)
-    db.session.add(entry)
-    db.session.commit()
     response = jsonify(entry_schema.dump(entry))
     response.status_code = 201
     response.headers['Location'] = url_for('api.for_entries.get_one', entry_id=entry.uuid, _external=True)
@@ -50,7 +48,7 @@ def create_one(kwargs: dict) -> Response:
 
 @for_entries.route('/entries', methods=['GET'])
 @authenticate(token_auth)
-@arguments(EntryFieldSchema(only=['fields']))
+@arguments(EntryFieldSchema(only=['fields', 'include']))
 @arguments(EntryFilterSchema())
 @arguments(EntrySortSchema(only=['sort']))
 @arguments(PaginationSchema())
@@ -63,14 +61,12 @@ def get_all(fields: dict[str, list[str]],
             sort: dict[str, list[str]],
             pagination: dict[str, int]) -> Response:
     """Get all entries"""
-    mapping = {'fields': EntryFieldSchema, 'filter': EntryFilterSchema, 'sort': EntrySortSchema}
     entries, only, pagination = sanitize_query(fields=fields,
                                                filter=filter,
                                                sort=sort,
                                                pagination=pagination,
                                                obj=Entry,
-                                               model=Entry,
-                                               mapping=mapping)  # type: ignore[arg-type]
+                                               resource='entries')
     return PaginatedSchema(EntrySchema(many=True, only=only))().dump({'results': entries,
                                                                       'pagination': pagination})
 
@@ -116,14 +112,11 @@ def update_one(kwargs: dict, entry_id: UUID) -> Response:
         entry.date = kwargs['date']
     if 'time' in kwargs:
         entry.time = kwargs['time']
-    available = can_create_entry(entry, context='update')
-    if not available:
-        link = url_for('api.for_entries.get_all', date=entry.date.strftime("%Y-%m-%d"))
+    link = url_for('api.for_entries.get_all', date=entry.date.strftime("%Y-%m-%d"))
+    if not save_entry(entry):
         message = f'Please choose different date or time. See all entries for this date: {link}'
         messages = {'json': {'datetime': [message]}}
         abort(400, messages)
-    db.session.add(entry)
-    db.session.commit()
     return entry
 
 
@@ -146,7 +139,7 @@ def delete_one(entry_id: UUID) -> tuple[str, int]:
 
 @for_entries.route('/users/<uuid:user_id>/entries', methods=['GET'])
 @authenticate(token_auth)
-@arguments(EntryFieldSchema(only=['fields']))
+@arguments(EntryFieldSchema(only=['fields', 'include']))
 @arguments(EntryFilterSchema())
 @arguments(EntrySortSchema(only=['sort']))
 @arguments(PaginationSchema())
@@ -162,21 +155,19 @@ def get_user_entries(fields: dict[str, list[str]],
                      user_id: UUID) -> Response:
     """Retrieve user's entries"""
     user = get_or_404(User, user_id)
-    mapping = {'fields': EntryFieldSchema, 'filter': EntryFilterSchema, 'sort': EntrySortSchema}
     entries, only, pagination = sanitize_query(fields=fields,
                                                filter=filter,
                                                sort=sort,
                                                pagination=pagination,
                                                obj=user.entries,
-                                               model=Entry,
-                                               mapping=mapping)  # type: ignore[arg-type]
+                                               resource='entries')
     return PaginatedSchema(EntrySchema(many=True, only=only))().dump({'results': entries,
                                                                       'pagination': pagination})
 
 
 @for_entries.route('/services/<int:service_id>/entries', methods=['GET'])
 @authenticate(token_auth)
-@arguments(EntryFieldSchema(only=['fields']))
+@arguments(EntryFieldSchema(only=['fields', 'include']))
 @arguments(EntryFilterSchema())
 @arguments(EntrySortSchema(only=['sort']))
 @arguments(PaginationSchema())
@@ -192,21 +183,19 @@ def get_service_entries(fields: dict[str, list[str]],
                         service_id: int) -> Response:
     """Retrieve service's entries"""
     service = get_or_404(Service, service_id)
-    mapping = {'fields': EntryFieldSchema, 'filter': EntryFilterSchema, 'sort': EntrySortSchema}
     entries, only, pagination = sanitize_query(fields=fields,
                                                filter=filter,
                                                sort=sort,
                                                pagination=pagination,
                                                obj=service.entries,
-                                               model=Entry,
-                                               mapping=mapping)  # type: ignore[arg-type]
+                                               resource='entries')
     return PaginatedSchema(EntrySchema(many=True, only=only))().dump({'results': entries,
                                                                       'pagination': pagination})
 
 
 @for_entries.route('/me/entries', methods=['GET'])
 @authenticate(token_auth)
-@arguments(EntryFieldSchema(only=['fields']))
+@arguments(EntryFieldSchema(only=['fields', 'include']))
 @arguments(EntryFilterSchema())
 @arguments(EntrySortSchema(only=['sort']))
 @arguments(PaginationSchema())
@@ -217,13 +206,11 @@ def my_entries(fields: dict[str, list[str]],
                pagination: dict[str, int]) -> Response:
     """Retrieve my entries"""
     user: User = token_auth.current_user()
-    mapping = {'fields': EntryFieldSchema, 'filter': EntryFilterSchema, 'sort': EntrySortSchema}
     entries, only, pagination = sanitize_query(fields=fields,
                                                filter=filter,
                                                sort=sort,
                                                pagination=pagination,
                                                obj=user.entries,
-                                               model=Entry,
-                                               mapping=mapping)  # type: ignore[arg-type]
+                                               resource='entries')
     return PaginatedSchema(EntrySchema(many=True, only=only))().dump({'results': entries,
                                                                       'pagination': pagination})
@@ -5,14 +5,16 @@ from apifairy import authenticate, body, response, other_responses, arguments
 from flask import Blueprint, url_for, jsonify
 from flask.wrappers import Response
 
-from ..common import sanitize_query
+from ..common import register_resource, sanitize_query
 from ... import db, token_auth
 from ...models import Post, User, get_or_404
 from ...schemas import (PostSchema, PostFieldSchema, PostSortSchema, PostFilterSchema,
                         NotFoundSchema, ForbiddenSchema, PaginationSchema, PaginatedSchema, PostImageSchema)
-from ...utils import admin_required, delete_image
+from ...images import image_processor
+from ...utils import admin_required, delete_image, empty_image
 
 for_posts = Blueprint('for_posts', __name__)
+register_resource('posts', Post, PostFieldSchema, PostFilterSchema, PostSortSchema)
 
 post_schema = PostSchema()
 posts_schema = PaginatedSchema(PostSchema(many=True))
@@ -41,7 +43,7 @@ def create_one(kwargs: dict[str, str]) -> Response:
 
 @for_posts.route('/posts', methods=['GET'])
 @authenticate(token_auth)
-@arguments(PostFieldSchema(only=['fields']))
+@arguments(PostFieldSchema(only=['fields', 'include']))
 @arguments(PostFilterSchema())
 @arguments(PostSortSchema(only=['sort']))
 @arguments(PaginationSchema())
@@ -51,14 +53,12 @@ def get_all(fields: dict[str, list[str]],
             sort: dict[str, list[str]],
             pagination: dict[str, int]) -> Response:
     """Get all posts"""
-    mapping = {'fields': PostFieldSchema, 'filter': PostFilterSchema, 'sort': PostSortSchema}
     posts, only, pagination = sanitize_query(fields=fields,
                                              filter=filter,
                                              sort=sort,
                                              pagination=pagination,
                                              obj=Post,
-                                             model=Post,
-                                             mapping=mapping)  # type: ignore[arg-type]
+                                             resource='posts')
     return PaginatedSchema(PostSchema(many=True, only=only))().dump({'results': posts,
                                                                     'pagination': pagination})
 
@@ -100,9 +100,10 @@ def update_one(kwargs: dict, post_id: int) -> Response:
 def delete_one(post_id: int) -> tuple[str, int]:
     """Delete post"""
     post = get_or_404(Post, post_id)
-    delete_image(post.image)
+    image = post.image
     db.session.delete(post)
     db.session.commit()
+    delete_image(image)
     return '', 204
 
 
@@ -118,9 +119,10 @@ def delete_one(post_id: int) -> tuple[str, int]:
 def update_post_image(kwargs: dict, post_id: int) -> Response:
     """Update post image"""
     post = get_or_404(Post, post_id)
-    delete_image(post.image, path='posts')
-    post.image = kwargs['image']
-    db.session.commit()
+    if 'image' in kwargs:
+        image = post.image
+        image_processor.submit(post, kwargs['image'])
+        delete_image(image, path='posts')
     return post
 
 
@@ -134,15 +136,16 @@ def update_post_image(kwargs: dict, post_id: int) -> Response:
 def delete_post_image(post_id: int) -> tuple[str, int]:
     """Delete post image"""
     post = get_or_404(Post, post_id)
-    delete_image(post.image)
-    post.image = None  # type: ignore[assignment]
+    image = post.image
+    post.update(empty_image())
     db.session.commit()
+    delete_image(image)
     return '', 204
 
 
 @for_posts.route('/users/<uuid:user_id>/posts', methods=['GET'])
 @authenticate(token_auth)
-@arguments(PostFieldSchema(only=['fields']))
+@arguments(PostFieldSchema(only=['fields', 'include']))
 @arguments(PostFilterSchema())
 @arguments(PostSortSchema(only=['sort']))
 @arguments(PaginationSchema())
@@ -157,21 +160,19 @@ def get_user_posts(fields: dict[str, list[str]],
                    user_id: UUID) -> Response:
     """Retrieve user's posts"""
     user = get_or_404(User, user_id)
-    mapping = {'fields': PostFieldSchema, 'filter': PostFilterSchema, 'sort': PostSortSchema}
     posts, only, pagination = sanitize_query(fields=fields,
                                              filter=filter,
                                              sort=sort,
                                              pagination=pagination,
                                              obj=user.posts,
-                                             model=Post,
-                                             mapping=mapping)  # type: ignore[arg-type]
+                                             resource='posts')
     return PaginatedSchema(PostSchema(many=True, only=only))().dump({'results': posts,
                                                                     'pagination': pagination})
 
 
 @for_posts.route('/me/posts', methods=['GET'])
 @authenticate(token_auth)
-@arguments(PostFieldSchema(only=['fields']))
+@arguments(PostFieldSchema(only=['fields', 'include']))
 @arguments(PostFilterSchema())
 @arguments(PostSortSchema(only=['sort']))
 @arguments(PaginationSchema())
@@ -182,13 +183,11 @@ def my_posts(fields: dict[str, list[str]],
              pagination: dict[str, int]) -> Response:
     """Retrieve my posts"""
     user: User = token_auth.current_user()
-    mapping = {'fields': PostFieldSchema, 'filter': PostFilterSchema, 'sort': PostSortSchema}
     posts, only, pagination = sanitize_query(fields=fields,
                                              filter=filter,
                                              sort=sort,
                                              pagination=pagination,
                                              obj=user.posts,
-                                             model=Post,
-                                             mapping=mapping)  # type: ignore[arg-type]
+                                             resource='posts')
     return PaginatedSchema(PostSchema(many=True, only=only))().dump({'results': posts,
                                                                     'pagination': pagination})
@@ -1,10 +1,12 @@
 from typing import Any
 
 from apifairy import authenticate, body, response, other_responses, arguments
-from flask import Blueprint, jsonify, url_for
+from flask import Blueprint, abort, jsonify, url_for
 from flask.wrappers import Response
+from psycopg2 import errorcodes
+from sqlalchemy.exc import IntegrityError
 
-from ..common import sanitize_query
+from ..common import register_resource, sanitize_query
 from ... import db, token_auth
 from ...models import Service, get_or_404
 from ...schemas import (ServiceSchema, ServiceFieldSchema, ServiceSortSchema, ServiceFilterSchema,
@@ -12,6 +14,7 @@ from ...schemas import (ServiceSchema, ServiceFieldSchema, ServiceSortSchema, Se
 from ...utils import admin_required
 
 for_services = Blueprint('for_services', __name__)
+register_resource('services', Service, ServiceFieldSchema, ServiceFilterSchema, ServiceSortSchema)
 
 service_schema = ServiceSchema()
 services_schema = PaginatedSchema(ServiceSchema(many=True))
@@ -48,14 +51,12 @@ def get_all(fields: dict[str, list[str]],
             sort: dict[str, list[str]],
             pagination: dict[str, int]) -> Response:
     """Get all services"""
-    mapping = {'fields': ServiceFieldSchema, 'filter': ServiceFilterSchema, 'sort': ServiceSortSchema}
     services, only, pagination = sanitize_query(fields=fields,
                                                 filter=filter,
                                                 sort=sort,
                                                 pagination=pagination,
                                                 obj=Service,
-                                                model=Service,
-                                                mapping=mapping)  # type: ignore[arg-type]
+                                                resource='services')
     return PaginatedSchema(ServiceSchema(many=True, only=only))().dump({'results': services,
                                                                         'pagination': pagination})
 
@@ -83,7 +84,16 @@ def update_one(kwargs: dict, service_id: int) -> Response:
     """Update service"""
     service = get_or_404(Service, service_id)
     service.update(kwargs)
-    db.session.commit()
+    if conflicts := service.schedule_conflicts():
+        db.session.rollback()
+        abort(400, {'json': {'duration': conflicts}})
+    try:
+        db.session.commit()
+    except IntegrityError as error:
+        db.session.rollback()
+        if getattr(error.orig, 'pgcode', None) == errorcodes.EXCLUSION_VIOLATION:
+            abort(400, {'json': {'duration': ['Entries using this service would overlap']}})
+        raise
     return service
 
 
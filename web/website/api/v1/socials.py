@@ -2,27 +2,41 @@ from typing import Any
 from uuid import UUID
 
 from apifairy import authenticate, body, response, other_responses, arguments
-from flask import Blueprint, current_app
+from flask import Blueprint, abort
 from flask.wrappers import Response
+from sqlalchemy.exc import IntegrityError
 
-from ..common import sanitize_query
+from ..common import register_resource, sanitize_query
 from ... import db, token_auth
 from ...models import SocialMedia, User, get_or_404
 from ...schemas import (SocialMediaSchema, SocialsFieldSchema, SocialsFilterSchema, SocialsSortSchema,
                         NotFoundSchema, ForbiddenSchema, PaginationSchema, PaginatedSchema, UserAvatarSchema)
-from ...utils import admin_required, delete_image
+from ...images import image_processor
+from ...utils import admin_required, delete_image, empty_image
 
 for_socials = Blueprint('for_socials', __name__)
+register_resource('socials', SocialMedia, SocialsFieldSchema, SocialsFilterSchema, SocialsSortSchema)
 
 social_schema = SocialMediaSchema()
 avatar_schema = UserAvatarSchema()
 socials_schema = PaginatedSchema(SocialMediaSchema(many=True))
 
 
+def commit_socials() -> None:
+    try:
+        db.session.commit()
+    except IntegrityError as error:
+        db.session.rollback()
+        field = SocialMedia.duplicate_field(error)
+        if field is None:
+            raise
+        abort(400, {'json': {field: ['Already exists. Please choose a different one.']}})
+
+
 @for_socials.route('/socials', methods=['GET'])
 @authenticate(token_auth)
 @admin_required
-@arguments(SocialsFieldSchema(only=['fields']))
+@arguments(SocialsFieldSchema(only=['fields', 'include']))
 @arguments(SocialsFilterSchema())
 @arguments(SocialsSortSchema(only=['sort']))
 @arguments(PaginationSchema())
@@ -36,14 +50,12 @@ def get_all(
         sort: dict[str, list[str]],
         pagination: dict[str, int]) -> Response:
     """Retrieve all socials"""
-    mapping = {'fields': SocialsFieldSchema, 'filter': SocialsFilterSchema, 'sort': SocialsSortSchema}
     socials, only, pagination = sanitize_query(fields=fields,
                                                filter=filter,
                                                sort=sort,
                                                pagination=pagination,
                                                obj=SocialMedia,
-                                               model=SocialMedia,
-                                               mapping=mapping)  # type: ignore[arg-type]
+                                               resource='socials')
     return PaginatedSchema(SocialMediaSchema(many=True, only=only))().dump({'results': socials,
                                                                             'pagination': pagination})
 
@@ -75,7 +87,7 @@ def update_one(kwargs: dict, social_id: UUID) -> Response:
     """Update social page"""
     social = get_or_404(SocialMedia, social_id)
     social.update(kwargs)
-    db.session.commit()
+    commit_socials()
     return social
 
 
@@ -122,8 +134,10 @@ def update_user_socials(kwargs: dict, user_id: UUID) -> Response:
 def update_user_avatar(kwargs: dict, user_id: UUID) -> Response:
     """Update user's avatar"""
     user = get_or_404(User, user_id)
-    user.socials.avatar = kwargs['avatar']
-    db.session.commit()
+    if 'avatar' in kwargs:
+        avatar = user.socials.avatar
+        image_processor.submit(user.socials, kwargs['avatar'])
+        delete_image(avatar, path='profiles')
     return user.socials
 
 
@@ -137,9 +151,10 @@ def update_user_avatar(kwargs: dict, user_id: UUID) -> Response:
 def delete_user_avatar(user_id: UUID) -> tuple[str, int]:
     """Delete user's avatar"""
     user = get_or_404(User, user_id)
-    delete_image(user.socials.avatar, path='profiles')
-    user.socials.avatar = current_app.config['DEFAULT_AVATAR']
+    avatar = user.socials.avatar
+    user.socials.update(empty_image('profiles'))
     db.session.commit()
+    delete_image(avatar, path='profiles')
     return '', 204
 
 
@@ -160,7 +175,7 @@ def update_my_socials(kwargs: dict) -> Response:
     """Update my socials"""
     user: User = token_auth.current_user()
     user.socials.update(kwargs)
-    db.session.commit()
+    commit_socials()
     return user.socials  # type: ignore[return-value]
 
 
@@ -171,8 +186,10 @@ def update_my_socials(kwargs: dict) -> Response:
 def update_my_avatar(kwargs: dict) -> Response:
     """Update my avatar"""
     user: User = token_auth.current_user()
-    user.socials.avatar = kwargs['avatar']
-    db.session.commit()
+    if 'avatar' in kwargs:
+        avatar = user.socials.avatar
+        image_processor.submit(user.socials, kwargs['avatar'])
+        delete_image(avatar, path='profiles')
     return user.socials  # type: ignore[return-value]
 
 
@@ -181,7 +198,8 @@ def update_my_avatar(kwargs: dict) -> Response:
 def delete_my_avatar() -> tuple[str, int]:
     """Delete my avatar"""
     user: User = token_auth.current_user()
-    delete_image(user.socials.avatar, path='profiles')
-    user.socials.avatar = current_app.config['DEFAULT_AVATAR']
+    avatar = user.socials.avatar
+    user.socials.update(empty_image('profiles'))
     db.session.commit()
+    delete_image(avatar, path='profiles')
     return '', 204
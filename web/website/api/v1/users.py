@@ -6,7 +6,7 @@ from flask import abort, Blueprint, jsonify, url_for
 from flask.wrappers import Response
 import sqlalchemy as sa
 
-from ..common import sanitize_query
+from ..common import register_resource, sanitize_query
 from ... import db, token_auth
 from ...models import User, SocialMedia, get_or_404
 from ...schemas import (UserSchema, UpdateUserSchema, AdminUserSchema, UserFieldSchema,
@@ -15,6 +15,7 @@ from ...schemas import (UserSchema, UpdateUserSchema, AdminUserSchema, UserField
 from ...utils import admin_required, delete_image
 
 for_users = Blueprint('for_users', __name__)
+register_resource('users', User, UserFieldSchema, UserFilterSchema, UserSortSchema)
 
 user_schema = UserSchema()
 users_schema = PaginatedSchema(UserSchema(many=True))
@@ -53,14 +54,12 @@ def get_all(fields: dict[str, list[str]],
             sort: dict[str, list[str]],
             pagination: dict[str, int]) -> Response:
     """Get all users"""
-    mapping = {'fields': UserFieldSchema, 'filter': UserFilterSchema, 'sort': UserSortSchema}
     users, only, pagination = sanitize_query(fields=fields,
                                              filter=filter,
                                              sort=sort,
                                              pagination=pagination,
                                              obj=User,
-                                             model=User,
-                                             mapping=mapping)  # type: ignore[arg-type]
+                                             resource='users')
     return PaginatedSchema(UserSchema(many=True, only=only))().dump({'results': users,
                                                                     'pagination': pagination})
 
@@ -104,9 +103,10 @@ def delete_one(user_id: UUID) -> tuple[str, int]:
     user = get_or_404(User, user_id)
     if user.admin:
         abort(403, 'Attempt to delete admin user')
-    delete_image(user.socials.avatar, path='profiles')
+    avatar = user.socials.avatar
     db.session.delete(user)
     db.session.commit()
+    delete_image(avatar, path='profiles')
     return '', 204
 
 
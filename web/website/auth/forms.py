@@ -8,7 +8,7 @@ from wtforms import StringField, PasswordField, SubmitField, BooleanField, Field
 from wtforms.validators import DataRequired, Length, Email, EqualTo, ValidationError, Regexp
 
 from .. import bcrypt, db
-from ..models import User, SocialMedia, current_user
+from ..models import User, SocialMedia, current_user, format_phone
 from ..utils import PATTERNS
 
 
@@ -68,14 +68,15 @@ class IntegrityCheck:
 
     def __call__(self, form: FlaskForm, field: Field) -> None:
         if self.model == SocialMedia:
-            query = db.session.scalar(sa.select(self.model).filter_by(**{field.name: field.data}))
-            if query and query.user_id != current_user.uuid:
+            value = format_phone(field.data)[0] if field.name in ('phone_number', 'viber', 'whatsapp') else field.data
+            social = db.session.scalar(sa.select(self.model).filter_by(**{field.name: value}))
+            if social and social.user_id != current_user.uuid:
                 raise ValidationError(self.message)
         elif self.model == User:
-            query = db.session.scalar(sa.select(self.model)
-                                      .filter(self.model.username
-                                              .ilike(field.data)))
-            if query:
+            uuid = db.session.scalar(sa.select(self.model.uuid)
+                                     .filter(sa.func.lower(getattr(self.model, field.name))
+                                             == field.data.lower()))
+            if uuid:
                 raise ValidationError(self.message)
 
 
@@ -7,7 +7,7 @@ from werkzeug.wrappers.response import Response
 
 from .forms import (RegistrationForm, LoginForm, PasswordResetRequestForm,
                     PasswordResetForm)
-from .. import db
+from .. import db, login_limiter
 from ..models import User, SocialMedia, current_user
 from ..utils import send_email
 
@@ -49,15 +49,18 @@ def register() -> Response | str:
 
 
 @auth.route("/login", methods=['GET', 'POST'])
-def login() -> Response | str:
+def login() -> Response | str | tuple[str, int]:
     if current_user.is_authenticated:
         return redirect(url_for('main.home'))
     form = LoginForm()
     if form.validate_on_submit():
-        user = db.session.scalar(sa.select(User).filter(User.username.ilike(form.login.data.strip())))
-        if not user:
-            user = db.session.scalar(sa.select(User).filter(User.email.ilike(form.login.data.strip())))
+        keys = ('ip', request.remote_addr), ('account', form.login.data.strip().lower())
+        if not login_limiter.allow(*keys):
+            flash('Too many login attempts. Please try again later.', 'danger')
+            return render_template('auth/login.html', title='Login', legend='Login', form=form), 429
+        user = User.find(form.login.data)
         if user and user.verify_password(form.password.data):
+            login_limiter.refund(*keys)
             login_user(user, remember=form.remember.data)
             next_page = request.args.get('next')
             if not is_safe_url(next_page):
@@ -116,13 +119,13 @@ def password_reset_request() -> Response | str:
     form = PasswordResetRequestForm()
     if form.validate_on_submit():
         flash('An email with instructions to reset your password has been sent.', 'info')
-        user = db.session.scalar(sa.select(User).filter_by(email=form.email.data.lower()))
+        user = db.session.scalar(sa.select(User).filter(sa.func.lower(User.email) == form.email.data.lower()))
         if user:
             token = user.generate_token(
                 context='reset',
                 salt_context='reset-password')
             reset_url = url_for('auth.password_reset_token', token=token, _external=True)
-            template = 'auth/reset_password'
+            template = 'auth/email/reset_password'
             subject = 'Reset your password'
             send_email(user.email, subject, template, reset_url=reset_url)
             return redirect(url_for('auth.login'))
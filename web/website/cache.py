@@ -0,0 +1,207 @@
+from collections import OrderedDict
+from collections.abc import Callable, Hashable
+import os
+import secrets
+from threading import Lock
+from time import monotonic
+from typing import Any
+
+from flask import Flask
+
+
+class TTLCache:
+    def __init__(self, maxsize: int = 1024, ttl: float = 60) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self._lock = Lock()
+
+    def init_app(self, app: Flask, prefix: str) -> None:
+        self.maxsize = app.config.get(f'{prefix}_SIZE', self.maxsize)
+        self.ttl = app.config.get(f'{prefix}_TTL', self.ttl)
+        self.clear()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            if item[0] <= monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return item[1]
+
+    def set(self, key: Hashable, value: Any, ttl: float | None = None) -> None:
+        expires = monotonic() + (self.ttl if ttl is None else min(ttl, self.ttl))
+        with self._lock:
+            self._data[key] = (expires, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key: Hashable) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def evict(self, match: Callable[[Any], bool]) -> None:
+        with self._lock:
+            for key in [key for key, (_, value) in self._data.items() if match(value)]:
+                del self._data[key]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def keys(self) -> list[Hashable]:
+        now = monotonic()
+        with self._lock:
+            return [key for key, (expires, _) in self._data.items() if expires > now]
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class FragmentCache:
+    def __init__(self, maxsize: int = 1024, ttl: float = 300) -> None:
+        self.local = TTLCache(maxsize, ttl)
+        self.backend: Any = None
+        self.prefix = 'fragments:'
+        self._errors: tuple[type[Exception], ...] = ()
+        self._generation = 0
+
+    def init_app(self, app: Flask, prefix: str) -> None:
+        self.local.init_app(app, prefix)
+        self.backend = None
+        if url := app.config.get(f'{prefix}_URL'):
+            import redis  # type: ignore[import]
+            self.backend = redis.Redis.from_url(url)
+            self._errors = (redis.RedisError,)
+        self._generation = 0
+
+    def get(self, key: str) -> str | None:
+        value = self.local.get(key)
+        if value is None and self.backend is not None:
+            try:
+                value = self.backend.get(self.prefix + key)
+            except self._errors:
+                return None
+            if value is not None:
+                value = value.decode()
+                self.local.set(key, value)
+        return value
+
+    def set(self, key: str, value: str) -> None:
+        self.local.set(key, value)
+        if self.backend is not None:
+            try:
+                self.backend.set(self.prefix + key, value, ex=int(self.local.ttl))
+            except self._errors:
+                pass
+
+    def generation(self) -> int:
+        if self.backend is not None:
+            try:
+                return int(self.backend.get(self.prefix + 'generation') or 0)
+            except self._errors:
+                pass
+        return self._generation
+
+    def invalidate(self) -> None:
+        self._generation += 1
+        if self.backend is not None:
+            try:
+                self.backend.incr(self.prefix + 'generation')
+            except self._errors:
+                pass
+
+    def keys(self) -> list[str]:
+        return [key for key in self.local.keys() if isinstance(key, str)]
+
+    def clear(self) -> None:
+        self.local.clear()
+
+
+class DiskCache:
+    def __init__(self, directory: str = '', max_bytes: int = 256 * 2 ** 20) -> None:
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[str, int] | None = None
+        self._size = 0
+        self._lock = Lock()
+
+    def init_app(self, app: Flask, prefix: str) -> None:
+        self.directory = os.path.join(app.root_path, app.config[f'{prefix}_DIR'])
+        self.max_bytes = app.config.get(f'{prefix}_MAX_BYTES', self.max_bytes)
+        with self._lock:
+            self._entries = None
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, key)
+
+    def get(self, key: str) -> str | None:
+        path = self.path(key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            with self._lock:
+                self._size -= self._load().pop(key, 0)
+            return None
+        with self._lock:
+            entries = self._load()
+            if key not in entries:
+                entries[key] = os.path.getsize(path)
+                self._size += entries[key]
+            entries.move_to_end(key)
+        return path
+
+    def put(self, key: str, write: Callable[[str], None]) -> str:
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp = f'{path}.{secrets.token_hex(4)}.tmp'
+        try:
+            write(temp)
+            os.replace(temp, path)
+        finally:
+            if os.path.exists(temp):
+                os.unlink(temp)
+        with self._lock:
+            entries = self._load()
+            self._size -= entries.pop(key, 0)
+            entries[key] = os.path.getsize(path)
+            self._size += entries[key]
+            while self._size > self.max_bytes and len(entries) > 1:
+                evicted, size = entries.popitem(last=False)
+                self._size -= size
+                try:
+                    os.unlink(self.path(evicted))
+                except FileNotFoundError:
+                    pass
+        return path
+
+    def _load(self) -> OrderedDict[str, int]:
+        if self._entries is None:
+            files = []
+            for root, _, names in os.walk(self.directory):
+                for name in names:
+                    if not name.endswith('.tmp'):
+                        stat = os.stat(os.path.join(root, name))
+                        files.append((stat.st_mtime, os.path.relpath(os.path.join(root, name), self.directory),
+                                      stat.st_size))
+            self._entries = OrderedDict((key, size) for _, key, size in sorted(files))
+            self._size = sum(self._entries.values())
+        return self._entries
+
+    def clear(self) -> None:
+        with self._lock:
+            for key in self._load():
+                try:
+                    os.unlink(self.path(key))
+                except FileNotFoundError:
+                    pass
+            self._entries = OrderedDict()
+            self._size = 0
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._load())
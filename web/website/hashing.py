@@ -0,0 +1,146 @@
+from collections.abc import Callable, Hashable
+from threading import Lock
+from time import perf_counter, sleep
+from typing import Any, TypeVar
+
+from flask import Flask
+import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql import insert
+from werkzeug.exceptions import ServiceUnavailable
+
+R = TypeVar("R")
+
+LOCK_NAMESPACE = 0x6A6E
+
+
+class PoolExhausted(ServiceUnavailable):
+    description = 'Too many password checks in progress, please retry shortly.'
+
+
+class HashingPool:
+    """Caps concurrent password hashing across every worker process sharing the database.
+
+    Each hash holds one of ``slots`` PostgreSQL advisory locks, so a burst of logins can
+    occupy at most ``slots`` gunicorn workers; callers wait up to ``max_wait`` seconds for
+    a free slot and are rejected before bcrypt starts.
+    """
+    calls: int
+    rejected: int
+    total_wait: float
+    max_wait_seen: float
+
+    def __init__(self, slots: int = 2, max_wait: float = 0.5) -> None:
+        self.slots = slots
+        self.max_wait = max_wait
+        self._lock = Lock()
+        self.app: Flask | None = None
+        self.reset_stats()
+
+    def init_app(self, app: Flask) -> None:
+        self.slots = app.config['PASSWORD_HASH_SLOTS']
+        self.max_wait = app.config['PASSWORD_HASH_MAX_WAIT']
+        self.app = app
+
+    def run(self, func: Callable[..., R], *args: Any) -> R:
+        from . import db
+        connection = db.session.connection()
+        submitted = perf_counter()
+        while (slot := self._acquire(connection)) is None:
+            if perf_counter() - submitted >= self.max_wait:
+                with self._lock:
+                    self.rejected += 1
+                raise PoolExhausted()
+            sleep(0.02)
+        self._record(perf_counter() - submitted)
+        try:
+            return func(*args)
+        finally:
+            connection.scalar(sa.select(sa.func.pg_advisory_unlock(LOCK_NAMESPACE, slot)))
+
+    def _acquire(self, connection: sa.Connection) -> int | None:
+        for slot in range(self.slots):
+            if connection.scalar(sa.select(sa.func.pg_try_advisory_lock(LOCK_NAMESPACE, slot))):
+                return slot
+        return None
+
+    def _record(self, waited: float) -> None:
+        with self._lock:
+            self.calls += 1
+            self.total_wait += waited
+            self.max_wait_seen = max(self.max_wait_seen, waited)
+            calls = self.calls
+        if self.app is not None:
+            self.app.logger.debug('Password hashing waited %.1f ms for a slot', waited * 1000)
+            if calls % 100 == 0:
+                self.app.logger.info('Password hashing slots: %s', self.stats())
+
+    def stats(self) -> dict[str, float]:
+        with self._lock:
+            return {
+                'slots': self.slots,
+                'calls': self.calls,
+                'rejected': self.rejected,
+                'mean_wait_ms': self.total_wait / self.calls * 1000 if self.calls else 0.0,
+                'max_wait_ms': self.max_wait_seen * 1000,
+            }
+
+    def reset_stats(self) -> None:
+        with self._lock:
+            self.calls = 0
+            self.rejected = 0
+            self.total_wait = 0.0
+            self.max_wait_seen = 0.0
+
+
+class TokenBucketLimiter:
+    """Token buckets kept in the login_buckets table, shared by every worker process."""
+
+    def __init__(self, capacity: float = 10, rate: float = 0.1) -> None:
+        self.capacity = capacity
+        self.rate = rate
+
+    def init_app(self, app: Flask, prefix: str) -> None:
+        self.capacity = app.config.get(f'{prefix}_CAPACITY', self.capacity)
+        self.rate = app.config.get(f'{prefix}_RATE', self.rate)
+
+    def allow(self, *keys: Hashable) -> bool:
+        from . import db
+        from .models import LoginBucket
+        names = sorted({bucket_name(key) for key in keys})
+        with db.engine.begin() as connection:
+            connection.execute(insert(LoginBucket)
+                               .values([{'key': name, 'tokens': self.capacity} for name in names])
+                               .on_conflict_do_nothing())
+            elapsed = sa.extract('epoch', sa.func.now() - LoginBucket.updated_on)
+            levels = connection.execute(
+                sa.select(LoginBucket.key, sa.func.least(self.capacity, LoginBucket.tokens + elapsed * self.rate))
+                .where(LoginBucket.key.in_(names))
+                .order_by(LoginBucket.key)
+                .with_for_update()).all()
+            allowed = all(tokens >= 1 for _, tokens in levels)
+            connection.execute(sa.update(LoginBucket)
+                               .where(LoginBucket.key == sa.bindparam('name'))
+                               .values(tokens=sa.bindparam('level'), updated_on=sa.func.now()),
+                               [{'name': name, 'level': tokens - 1 if allowed else tokens} for name, tokens in levels])
+            connection.execute(sa.delete(LoginBucket).where(
+                LoginBucket.updated_on < sa.func.now() - sa.func.make_interval(0, 0, 0, 0, 0, 0,
+                                                                               self.capacity / self.rate)))
+        return allowed
+
+    def refund(self, *keys: Hashable) -> None:
+        from . import db
+        from .models import LoginBucket
+        with db.engine.begin() as connection:
+            connection.execute(sa.update(LoginBucket)
+                               .where(LoginBucket.key.in_({bucket_name(key) for key in keys}))
+                               .values(tokens=sa.func.least(self.capacity, LoginBucket.tokens + 1)))
+
+    def clear(self) -> None:
+        from . import db
+        from .models import LoginBucket
+        with db.engine.begin() as connection:
+            connection.execute(sa.delete(LoginBucket))
+
+
+def bucket_name(key: Hashable) -> str:
+    return ':'.join(map(str, key)) if isinstance(key, tuple) else str(key)
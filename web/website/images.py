@@ -0,0 +1,188 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+import os
+import re
+from typing import Any
+
+import click
+from flask import Flask, current_app
+from flask.cli import AppGroup
+from flask_wtf.file import FileStorage
+from PIL import Image
+import sqlalchemy as sa
+import sqlalchemy.orm as so
+from sqlalchemy.sql.selectable import ForUpdateArg
+
+from . import db
+from .models import ImageJob, Post, SocialMedia
+from .storage import storage
+from .utils import IMAGE_COLUMNS, save_image, process_image, pending_image, empty_image, delete_image, image_key
+
+images_cli = AppGroup('images', help='Image processing commands.')
+
+VARIANT = re.compile(r'-\d+w\.\w+$')
+
+
+class ImageProcessor:
+    def __init__(self) -> None:
+        self.app: Flask | None = None
+        self._executor: ThreadPoolExecutor | None = None
+
+    def init_app(self, app: Flask) -> None:
+        self.app = app
+        app.cli.add_command(images_cli)
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+        if app.config['IMAGE_PROCESSING_THREAD']:
+            self._executor = ThreadPoolExecutor(max_workers=app.config['IMAGE_WORKERS'],
+                                                thread_name_prefix='image-worker')
+
+    def submit(self, target: Post | SocialMedia, file: FileStorage) -> None:
+        path = image_folder(target)
+        upload = save_image(file, path)
+        if so.attributes.instance_state(target).identity is None:
+            db.session.add(target)
+            db.session.flush()
+        target_id = str(so.object_mapper(target).primary_key_from_instance(target)[0])
+        db.session.execute(sa.update(ImageJob)
+                           .where(ImageJob.path == path,
+                                  ImageJob.target_id == target_id,
+                                  ImageJob.status == 'pending')
+                           .values(status='cancelled', finished_on=sa.func.now()))
+        target.update(pending_image(path))
+        job = ImageJob(path=path, upload=upload, target_id=target_id)
+        db.session.add(job)
+        db.session.commit()
+        if self._executor is not None:
+            self._executor.submit(self.run, job.id)
+
+    def run(self, job_id: int) -> None:
+        app = self.app if self.app is not None else current_app._get_current_object()  # type: ignore[attr-defined]
+        with app.app_context():
+            try:
+                self.process(job_id)
+            except Exception as exc:
+                app.logger.exception('Image job %s failed', job_id)
+                db.session.rollback()
+                self.abandon(job_id, str(exc))
+            finally:
+                db.session.remove()
+
+    def process(self, job_id: int) -> bool:
+        job = db.session.get(ImageJob, job_id)
+        if job is None or job.status != 'pending':
+            return False
+        path, upload = job.path, job.upload
+        db.session.commit()
+        image, error = None, None
+        try:
+            image = process_image(upload, path)
+        except (OSError, ValueError, Image.DecompressionBombError) as exc:
+            current_app.logger.warning('Processing image %s failed: %s', upload, exc)
+            error = str(exc)
+        finally:
+            storage.delete(image_key(upload, path))
+        return self.finish(job, image, error)
+
+    def finish(self, job: ImageJob, image: dict[str, Any] | None, error: str | None) -> bool:
+        path = job.path
+        db.session.refresh(job, with_for_update=ForUpdateArg())
+        target = db.session.get(IMAGE_MODELS[path], job.target_id, with_for_update=ForUpdateArg())
+        placeholder = pending_image(path)[IMAGE_COLUMNS[path]]
+        applied = False
+        if job.status == 'pending' and target is not None and getattr(target, IMAGE_COLUMNS[path]) == placeholder:
+            target.update(image or empty_image(path))
+            applied = True
+        elif image is not None:
+            delete_image(image[IMAGE_COLUMNS[path]], path)
+        if job.status == 'pending':
+            job.status = 'done' if image is not None else 'failed'
+            if error is not None:
+                job.last_error = error
+        job.finished_on = datetime.now().astimezone()
+        db.session.commit()
+        return applied and image is not None
+
+    def abandon(self, job_id: int, error: str) -> None:
+        try:
+            job = db.session.get(ImageJob, job_id)
+            if job is not None and job.status == 'pending':
+                self.finish(job, None, error)
+        except Exception:
+            db.session.rollback()
+            current_app.logger.exception('Could not mark image job %s as failed', job_id)
+
+    def drain(self) -> int:
+        processed = 0
+        for job_id in db.session.scalars(sa.select(ImageJob.id)
+                                         .where(ImageJob.status == 'pending')
+                                         .order_by(ImageJob.id)).all():
+            processed += self.process(job_id)
+        return processed
+
+
+IMAGE_MODELS: dict[str, type[Post] | type[SocialMedia]] = {'posts': Post, 'profiles': SocialMedia}
+
+
+def image_folder(target: Post | SocialMedia) -> str:
+    return next(path for path, model in IMAGE_MODELS.items() if isinstance(target, model))
+
+
+def collect_garbage(grace: timedelta, dry_run: bool = False, batch: int = 1000) -> dict[str, tuple[int, int]]:
+    placeholders = {current_app.config['DEFAULT_AVATAR'], *current_app.config['IMAGE_PLACEHOLDERS'].values()}
+    cutoff = datetime.now(timezone.utc) - grace
+    report = {}
+    for path, model in IMAGE_MODELS.items():
+        column = getattr(model, IMAGE_COLUMNS[path])
+        referenced = set(placeholders)
+        referenced.update(db.session.scalars(sa.select(column).where(column.is_not(None)).distinct()
+                                             .execution_options(yield_per=batch)))
+        referenced.update(db.session.scalars(sa.select(ImageJob.upload)
+                                             .where(ImageJob.path == path, ImageJob.status == 'pending')
+                                             .execution_options(yield_per=batch)))
+        stems = {os.path.splitext(filename)[0] for filename in referenced}
+        files = reclaimed = 0
+        for key, size, modified in storage.list(f'{path}/'):
+            filename = key.removeprefix(f'{path}/')
+            if filename in referenced or VARIANT.sub('', filename) in stems or modified > cutoff:
+                continue
+            if not dry_run:
+                storage.delete(key)
+            files += 1
+            reclaimed += size
+        report[path] = (files, reclaimed)
+    return report
+
+
+@images_cli.command('gc')
+@click.option('--grace', default=24, show_default=True, help='Keep unreferenced files younger than this many hours.')
+@click.option('--batch', default=1000, show_default=True, help='Rows fetched per database round trip.')
+@click.option('--dry-run', is_flag=True, help='Report orphaned files without deleting them.')
+def gc(grace: int, batch: int, dry_run: bool) -> None:
+    """Delete uploaded files that no post or profile references."""
+    report = collect_garbage(timedelta(hours=grace), dry_run=dry_run, batch=batch)
+    for path, (files, reclaimed) in report.items():
+        click.echo(f'{path}: {files} orphaned file(s), {reclaimed} bytes')
+    total = sum(reclaimed for _, reclaimed in report.values())
+    click.echo(f'{"Would reclaim" if dry_run else "Reclaimed"} {total} bytes')
+
+
+@images_cli.command('process')
+def process() -> None:
+    """Process pending image uploads."""
+    click.echo(f'Processed {image_processor.drain()} image(s).')
+
+
+@images_cli.command('seed')
+def seed() -> None:
+    """Copy the bundled placeholder images into storage."""
+    folder = os.path.join(current_app.root_path, 'static', 'images')
+    for path, filename in current_app.config['IMAGE_PLACEHOLDERS'].items():
+        if not storage.exists(image_key(filename, path)):
+            with open(os.path.join(folder, path, filename), 'rb') as file:
+                storage.save(image_key(filename, path), file, 'image/jpeg')
+            click.echo(f'Uploaded {path}/{filename}')
+
+
+image_processor = ImageProcessor()
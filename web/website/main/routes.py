@@ -1,22 +1,86 @@
-from flask import render_template, Blueprint, flash, redirect, url_for, abort, request, jsonify
+from collections.abc import Callable
+from functools import partial
+
+from flask import (render_template, Blueprint, flash, redirect, url_for, abort, request, jsonify, current_app, send_file,
+                   session)
+from markupsafe import Markup
 import sqlalchemy as sa
+import sqlalchemy.orm as so
 from sqlalchemy.sql import text
 from werkzeug.exceptions import HTTPException
+from werkzeug.utils import secure_filename
 from werkzeug.wrappers.response import Response
 
-from .. import db
+from .. import db, image_cache, fragment_cache
 from .forms import PostForm, EditPostForm
-from .. models import Post, current_user
-from .. utils import admin_required, save_image, delete_image
+from .. api.common import decode_cursor, encode_cursor, keyset_condition
+from .. models import Post, User, current_user
+from .. images import image_processor
+from .. storage import storage
+from .. utils import (IMAGE_COLUMNS, IMAGE_FORMATS, admin_required, delete_image, empty_image, image_key,
+                      render_variant, variant_name)
 
 main = Blueprint('main', __name__)
 
+FEED_ORDER = [(Post.posted_on, True), (Post.id, True)]
+
+
+def feed_page(cursor: str | None) -> tuple[list[Post], str | None]:
+    per_page = current_app.config['POSTS_PER_PAGE']
+    query = (sa.select(Post)
+             .options(so.joinedload(Post.author).joinedload(User.socials))
+             .order_by(Post.posted_on.desc(), Post.id.desc())
+             .limit(per_page + 1))
+    if cursor:
+        query = query.where(keyset_condition(FEED_ORDER, decode_cursor(cursor, FEED_ORDER)))  # type: ignore[arg-type]
+    posts = db.session.scalars(query).all()
+    next_cursor = encode_cursor(FEED_ORDER, posts[per_page - 1]) if len(posts) > per_page else None  # type: ignore[arg-type]
+    return list(posts[:per_page]), next_cursor
+
+
+def post_fragment(post: Post) -> Markup:
+    key = f'post:{post.id}:{post.updated_on.timestamp()}'
+    html = fragment_cache.get(key)
+    if html is None:
+        html = render_template('_post_content.html', post=post)
+        fragment_cache.set(key, html)
+    return Markup(html)
+
+
+def cached_page(render: Callable[[], str]) -> str:
+    if current_user.is_authenticated or session.get('_flashes'):
+        return render()
+    key = f'page:{fragment_cache.generation()}:{request.path}:{request.args.get("cursor", "")}'
+    body = fragment_cache.get(key)
+    if body is None:
+        body = render()
+        fragment_cache.set(key, body)
+    return body
+
+
+def render_home() -> str:
+    posts, next_cursor = feed_page(request.args.get('cursor'))
+    return render_template('home.html', title='Home', posts=posts, next_cursor=next_cursor)
+
+
+def render_feed() -> str:
+    posts, next_cursor = feed_page(request.args.get('cursor'))
+    return jsonify({
+        'html': render_template('_posts.html', posts=posts),
+        'next_cursor': next_cursor,
+        'next_url': url_for('main.feed', cursor=next_cursor) if next_cursor else None,
+    }).get_data(as_text=True)
+
 
 @main.route("/")
 @main.route("/home")
 def home() -> str:
-    posts = db.session.scalars(sa.select(Post).order_by(Post.posted_on.desc()))
-    return render_template('home.html', title='Home', posts=posts)
+    return cached_page(render_home)
+
+
+@main.route("/home/posts")
+def feed() -> Response:
+    return Response(cached_page(render_feed), mimetype='application/json')
 
 
 @main.route("/about")
@@ -24,6 +88,40 @@ def about() -> str:
     return render_template('about.html', title='About')
 
 
+@main.route('/img/<folder>/<filename>')
+def image(folder: str, filename: str) -> Response:
+    config = current_app.config
+    fmt = request.args.get('fmt', 'webp')
+    if folder not in IMAGE_COLUMNS or filename != secure_filename(filename):
+        abort(404)
+    if fmt not in IMAGE_FORMATS:
+        abort(400, f'Unsupported format: {fmt}')
+    requested = request.args.get('w', type=int) or 0
+    widths = config['IMAGE_RESIZE_WIDTHS']
+    width = next((width for width in widths if width >= requested), widths[-1])
+    key = f'{folder}/{variant_name(filename, width, fmt)}'
+    source = image_key(filename, folder)
+    if not storage.exists(source):
+        abort(404)
+    if request.if_none_match.contains(key):
+        response = Response(status=304)
+    else:
+        path = image_cache.get(key)
+        if path is None:
+            path = image_cache.put(key, partial(render_variant, source, width, fmt))
+        if config['IMAGE_ACCEL_REDIRECT']:
+            response = Response(mimetype=f'image/{fmt}')
+            response.headers['X-Accel-Redirect'] = config['IMAGE_ACCEL_REDIRECT'] + key
+        else:
+            response = send_file(path, mimetype=f'image/{fmt}', etag=False)
+    response.set_etag(key)
+    response.cache_control.no_cache = None
+    response.cache_control.public = True
+    response.cache_control.max_age = config['IMAGE_CACHE_MAX_AGE']
+    response.cache_control.immutable = True
+    return response
+
+
 def handle_error(error: HTTPException) -> Response | tuple[str, int]:
     if (request.mimetype or request.headers['accept']) == 'application/json':
         response = jsonify({
@@ -42,9 +140,10 @@ def handle_error(error: HTTPException) -> Response | tuple[str, int]:
 def create_post() -> Response | str:
     form = PostForm()
     if form.validate_on_submit():
-        image = save_image(form.image.data) if form.image.data else None
-        post = Post(title=form.title.data, image=image, content=form.content.data, author=current_user)
+        post = Post(title=form.title.data, content=form.content.data, author=current_user, **empty_image())
         db.session.add(post)
+        if form.image.data:
+            image_processor.submit(post, form.image.data)
         db.session.commit()
         flash('Your post has been created!', 'success')
         return redirect(url_for('main.home'))
@@ -57,19 +156,17 @@ def edit_post(post_id: int) -> Response | str:
     form = EditPostForm()
     post = db.session.get(Post, post_id) or abort(404)
     if form.validate_on_submit():
+        image = post.image
         if form.delete_image.data:
-            image = None
-            delete_image(post.image)
+            post.update(empty_image())
         elif form.image.data:
-            image = save_image(form.image.data)
-            delete_image(post.image)
-        else:
-            image = post.image
+            image_processor.submit(post, form.image.data)
         post.title = form.title.data
-        post.image = image  # type: ignore[assignment]
         post.content = form.content.data
         db.session.add(post)
         db.session.commit()
+        if form.delete_image.data or form.image.data:
+            delete_image(image)
         flash('Your post has been updated!', 'success')
         return redirect(url_for('main.home'))
     form.title.data = post.title
@@ -81,9 +178,10 @@ def edit_post(post_id: int) -> Response | str:
 @admin_required
 def delete_post(post_id: int) -> Response:
     post = db.session.get(Post, post_id) or abort(404)
-    delete_image(post.image)
+    image = post.image
     db.session.delete(post)
     db.session.commit()
+    delete_image(image)
     flash('Your post has been deleted!', 'success')
     return redirect(url_for('main.home'))
 
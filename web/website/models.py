@@ -1,6 +1,9 @@
 from datetime import datetime, date as date_, time as time_, timedelta
 from decimal import Decimal
-from typing import Union, TypeVar, Type, Literal
+import hashlib
+import secrets
+from typing import Union, TypeVar, Type
+from urllib.parse import urlparse
 import uuid
 from uuid import UUID as UUID_
 
@@ -10,21 +13,25 @@ from flask_admin.form import SecureForm, BaseForm
 from flask_login import UserMixin, current_user, AnonymousUserMixin
 from flask_wtf.file import FileAllowed, FileField
 from itsdangerous import URLSafeTimedSerializer
+import phonenumbers
+from psycopg2 import errorcodes
 import sqlalchemy as sa
 import sqlalchemy.orm as so
-from sqlalchemy.dialects.postgresql import UUID
-from sqlalchemy.exc import DataError
+from sqlalchemy.dialects.postgresql import ARRAY, UUID, TSTZRANGE, Range, ExcludeConstraint
+from sqlalchemy.exc import DataError, IntegrityError
 from sqlalchemy.orm import scoped_session
 from sqlalchemy.sql import func
 from werkzeug.local import LocalProxy
 from wtforms import StringField
 from wtforms.validators import ValidationError
 
-from . import db, bcrypt
-from .utils import save_image, delete_image
+from . import db, bcrypt, token_cache, fragment_cache, password_pool
+from .utils import delete_image
 
 T = TypeVar('T', bound=db.Model)  # type: ignore[name-defined]
 
+MIN_SLOT_MINUTES = 30
+
 current_user: Union['User', LocalProxy] = current_user
 
 association_table = sa.Table('association_table', db.metadata,
@@ -50,6 +57,9 @@ class AnonymousUser(AnonymousUserMixin):
 class User(UserMixin, UpdateMixin, db.Model):  # type: ignore[name-defined]
 
     __tablename__ = 'users'
+    __table_args__ = (
+        sa.Index('ix_users_registered_on_uuid', 'registered_on', 'uuid'),
+    )
 
     uuid: so.Mapped[UUID_] = so.mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     username: so.Mapped[str] = so.mapped_column(sa.String(20), unique=True, nullable=False, index=True)
@@ -66,6 +76,8 @@ class User(UserMixin, UpdateMixin, db.Model):  # type: ignore[name-defined]
         back_populates='author', cascade="all, delete-orphan", passive_deletes=True)
     socials: so.Mapped['SocialMedia'] = so.relationship(
         back_populates='user', cascade="all, delete-orphan")
+    tokens: so.WriteOnlyMapped['Token'] = so.relationship(
+        back_populates='user', cascade="all, delete-orphan", passive_deletes=True)
 
     def __repr__(self) -> str:
         return self.username
@@ -76,14 +88,23 @@ class User(UserMixin, UpdateMixin, db.Model):  # type: ignore[name-defined]
 
     @password.setter
     def password(self, candidate: str) -> None:
-        self.password_hash = bcrypt.generate_password_hash(candidate).decode('UTF-8')
+        self.password_hash = password_pool.run(bcrypt.generate_password_hash, candidate).decode('UTF-8')
 
     def verify_password(self, candidate: str) -> bool:
-        return bcrypt.check_password_hash(self.password_hash, candidate)
+        return password_pool.run(bcrypt.check_password_hash, self.password_hash, candidate)
 
     def get_id(self) -> UUID_:
         return self.uuid
 
+    def snapshot(self) -> dict:
+        return {'uuid': self.uuid, 'username': self.username, 'admin': self.admin, 'confirmed': self.confirmed}
+
+    @staticmethod
+    def from_snapshot(snapshot: dict) -> 'User':
+        user = User(**snapshot)
+        so.make_transient_to_detached(user)
+        return db.session.merge(user, load=False)
+
     def generate_token(
         self,
         context: str = 'confirm',
@@ -133,6 +154,64 @@ class User(UserMixin, UpdateMixin, db.Model):  # type: ignore[name-defined]
         user = db.session.get(User, (data.get(context)))
         return user
 
+    @staticmethod
+    def find(login: str) -> Union['User', None]:
+        login = login.strip().lower()
+        return db.session.scalar(sa.select(User).where(
+            sa.or_(sa.func.lower(User.username) == login, sa.func.lower(User.email) == login)))
+
+
+sa.Index('ix_users_lower_username', sa.func.lower(User.username), unique=True)
+sa.Index('ix_users_lower_email', sa.func.lower(User.email), unique=True)
+
+
+class Token(db.Model):  # type: ignore[name-defined]
+
+    __tablename__ = 'tokens'
+
+    id: so.Mapped[int] = so.mapped_column(primary_key=True)
+    token_hash: so.Mapped[str] = so.mapped_column(sa.String(64), unique=True, nullable=False)
+    user_id: so.Mapped[UUID_] = so.mapped_column(
+        UUID(as_uuid=True), sa.ForeignKey('users.uuid', ondelete='CASCADE'), nullable=False, index=True)
+    issued_on: so.Mapped[datetime] = so.mapped_column(sa.DateTime(timezone=True), nullable=False, server_default=func.now())
+    expires_at: so.Mapped[datetime] = so.mapped_column(sa.DateTime(timezone=True), nullable=False, index=True)
+    scopes: so.Mapped[list[str]] = so.mapped_column(ARRAY(sa.String(32)), nullable=False, default=list)
+    user: so.Mapped['User'] = so.relationship(back_populates='tokens')
+
+    def __repr__(self) -> str:
+        return f'Token({self.id}, {self.user_id}, {self.expires_at})'
+
+    @staticmethod
+    def digest(token: str | bytes) -> str:
+        return hashlib.sha256(token.encode() if isinstance(token, str) else token).hexdigest()
+
+    @staticmethod
+    def issue(user: User, scopes: list[str] | None = None) -> tuple[str, 'Token']:
+        token = secrets.token_urlsafe(32)
+        expires_at = datetime.now().astimezone() + timedelta(seconds=current_app.config['TOKEN_EXPIRATION'])
+        record = Token(token_hash=Token.digest(token), user_id=user.uuid, expires_at=expires_at, scopes=scopes or [])
+        db.session.add(record)
+        return token, record
+
+
+class LoginBucket(db.Model):  # type: ignore[name-defined]
+
+    __tablename__ = 'login_buckets'
+
+    key: so.Mapped[str] = so.mapped_column(sa.Text, primary_key=True)
+    tokens: so.Mapped[float] = so.mapped_column(nullable=False)
+    updated_on: so.Mapped[datetime] = so.mapped_column(
+        sa.DateTime(timezone=True), nullable=False, server_default=func.now(), index=True)
+
+
+def format_phone(number: str) -> tuple[str, str | None]:
+    try:
+        parsed = phonenumbers.parse(number)
+    except phonenumbers.phonenumberutil.NumberParseException:
+        return number, None
+    return (phonenumbers.format_number(parsed, phonenumbers.PhoneNumberFormat.E164),
+            phonenumbers.format_number(parsed, phonenumbers.PhoneNumberFormat.INTERNATIONAL))
+
 
 class SocialMedia(UpdateMixin, db.Model):  # type: ignore[name-defined]
 
@@ -143,6 +222,8 @@ class SocialMedia(UpdateMixin, db.Model):  # type: ignore[name-defined]
         UUID(as_uuid=True), sa.ForeignKey('users.uuid', ondelete='CASCADE'), nullable=False)
     user: so.Mapped['User'] = so.relationship(back_populates='socials')
     avatar: so.Mapped[str] = so.mapped_column(sa.String(20), nullable=False, default='default.jpg')
+    avatar_width: so.Mapped[int] = so.mapped_column(nullable=True)
+    avatar_height: so.Mapped[int] = so.mapped_column(nullable=True)
     first_name: so.Mapped[str] = so.mapped_column(sa.String(50), nullable=True)
     last_name: so.Mapped[str] = so.mapped_column(sa.String(50), nullable=True)
     phone_number: so.Mapped[str] = so.mapped_column(sa.String(50), unique=True, nullable=True)
@@ -154,6 +235,17 @@ class SocialMedia(UpdateMixin, db.Model):  # type: ignore[name-defined]
     website: so.Mapped[str] = so.mapped_column(sa.String(255), unique=True, nullable=True)
     vk: so.Mapped[str] = so.mapped_column(sa.String(255), unique=True, nullable=True)
     about: so.Mapped[str] = so.mapped_column(sa.String(255), nullable=True)
+    phone_number_display: so.Mapped[str] = so.mapped_column(sa.String(50), nullable=True)
+    viber_display: so.Mapped[str] = so.mapped_column(sa.String(50), nullable=True)
+    whatsapp_display: so.Mapped[str] = so.mapped_column(sa.String(50), nullable=True)
+    instagram_handle: so.Mapped[str] = so.mapped_column(sa.String(255), nullable=True)
+    telegram_handle: so.Mapped[str] = so.mapped_column(sa.String(255), nullable=True)
+    vk_handle: so.Mapped[str] = so.mapped_column(sa.String(255), nullable=True)
+
+    property_columns = {
+        'avatar_url': ('avatar',),
+        'srcset': ('avatar', 'avatar_width'),
+    }
 
     def __repr__(self) -> str:
         return ", ".join(f'{item}: {val}' for item, val in self.to_dict().items() if val is not None)
@@ -175,20 +267,94 @@ class SocialMedia(UpdateMixin, db.Model):  # type: ignore[name-defined]
         }
         return dict_social
 
+    def sync_handles(self) -> None:
+        for attr in ('phone_number', 'viber', 'whatsapp'):
+            number, display = getattr(self, attr), None
+            if number:
+                number, display = format_phone(number)
+            setattr(self, attr, number)
+            setattr(self, f'{attr}_display', display)
+        for attr in ('vk', 'telegram', 'instagram'):
+            url = getattr(self, attr)
+            setattr(self, f'{attr}_handle', urlparse(url).path.strip('/') if url else None)
+
+    @staticmethod
+    def duplicate_field(error: IntegrityError) -> str | None:
+        if getattr(error.orig, 'pgcode', None) != errorcodes.UNIQUE_VIOLATION:
+            return None
+        constraint = getattr(getattr(error.orig, 'diag', None), 'constraint_name', None) or ''
+        return constraint.removeprefix('socials_').removesuffix('_key') or None
+
+
+class EmailOutbox(db.Model):  # type: ignore[name-defined]
+
+    __tablename__ = 'email_outbox'
+    __table_args__ = (
+        sa.Index('ix_email_outbox_pending', 'send_after', postgresql_where=sa.text("status = 'pending'")),
+    )
+
+    id: so.Mapped[int] = so.mapped_column(primary_key=True)
+    sender: so.Mapped[str] = so.mapped_column(sa.String(100), nullable=False)
+    recipient: so.Mapped[str] = so.mapped_column(sa.String(100), nullable=False)
+    subject: so.Mapped[str] = so.mapped_column(sa.String(255), nullable=False)
+    body: so.Mapped[str] = so.mapped_column(sa.Text, nullable=False)
+    html: so.Mapped[str] = so.mapped_column(sa.Text, nullable=True)
+    status: so.Mapped[str] = so.mapped_column(sa.String(16), nullable=False, default='pending')
+    created_on: so.Mapped[datetime] = so.mapped_column(sa.DateTime(timezone=True), nullable=False, server_default=func.now())
+    send_after: so.Mapped[datetime] = so.mapped_column(sa.DateTime(timezone=True), nullable=False, server_default=func.now())
+    sent_on: so.Mapped[datetime] = so.mapped_column(sa.DateTime(timezone=True), nullable=True)
+    attempts: so.Mapped[int] = so.mapped_column(nullable=False, default=0)
+    last_error: so.Mapped[str] = so.mapped_column(sa.Text, nullable=True)
+
+    def __repr__(self) -> str:
+        return f'EmailOutbox({self.id}, "{self.subject}", {self.recipient})'
+
+
+class ImageJob(db.Model):  # type: ignore[name-defined]
+
+    __tablename__ = 'image_jobs'
+    __table_args__ = (
+        sa.Index('ix_image_jobs_pending', 'path', 'target_id', postgresql_where=sa.text("status = 'pending'")),
+    )
+
+    id: so.Mapped[int] = so.mapped_column(primary_key=True)
+    path: so.Mapped[str] = so.mapped_column(sa.String(20), nullable=False)
+    upload: so.Mapped[str] = so.mapped_column(sa.String(64), nullable=False)
+    target_id: so.Mapped[str] = so.mapped_column(sa.String(36), nullable=False)
+    status: so.Mapped[str] = so.mapped_column(sa.String(16), nullable=False, default='pending')
+    created_on: so.Mapped[datetime] = so.mapped_column(sa.DateTime(timezone=True), nullable=False, server_default=func.now())
+    finished_on: so.Mapped[datetime] = so.mapped_column(sa.DateTime(timezone=True), nullable=True)
+    last_error: so.Mapped[str] = so.mapped_column(sa.Text, nullable=True)
+
+    def __repr__(self) -> str:
+        return f'ImageJob({self.id}, {self.path}, {self.target_id}, {self.status})'
+
 
 class Post(UpdateMixin, db.Model):  # type: ignore[name-defined]
 
     __tablename__ = 'posts'
+    __table_args__ = (
+        sa.Index('ix_posts_posted_on_id', 'posted_on', 'id'),
+    )
 
     id: so.Mapped[int] = so.mapped_column(primary_key=True)
     title: so.Mapped[str] = so.mapped_column(sa.String(100), nullable=False)
     posted_on: so.Mapped[datetime] = so.mapped_column(sa.DateTime(timezone=True), nullable=False, default=func.now())
+    updated_on: so.Mapped[datetime] = so.mapped_column(sa.DateTime(timezone=True), nullable=False,
+                                                       server_default=func.now(), onupdate=func.now())
     image: so.Mapped[str] = so.mapped_column(sa.String(20), nullable=True)
+    image_width: so.Mapped[int] = so.mapped_column(nullable=True)
+    image_height: so.Mapped[int] = so.mapped_column(nullable=True)
     content: so.Mapped[str] = so.mapped_column(sa.Text, nullable=False)
     author_id: so.Mapped[UUID_] = so.mapped_column(
         UUID(as_uuid=True), sa.ForeignKey('users.uuid', ondelete='CASCADE'), nullable=False)
     author: so.Mapped['User'] = so.relationship(back_populates='posts')
 
+    property_columns = {
+        'image_url': ('image',),
+        'srcset': ('image', 'image_width'),
+    }
+
     def __repr__(self) -> str:
         return f'Post({self.id}, "{self.title}", {self.posted_on}, {self.author.username})'
 
@@ -196,6 +362,11 @@ class Post(UpdateMixin, db.Model):  # type: ignore[name-defined]
 class Entry(db.Model):  # type: ignore[name-defined]
 
     __tablename__ = 'entries'
+    __table_args__ = (
+        ExcludeConstraint(('period', '&&'), using='gist', name='entries_period_excl'),
+        sa.Index('ix_entries_date_time_uuid', 'date', 'time', 'uuid'),
+        sa.Index('ix_entries_user_id_date_time', 'user_id', 'date', 'time'),
+    )
 
     uuid: so.Mapped[UUID_] = so.mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     services: so.Mapped[list['Service']] = so.relationship(
@@ -207,6 +378,15 @@ class Entry(db.Model):  # type: ignore[name-defined]
     user_id: so.Mapped[UUID_] = so.mapped_column(
         UUID(as_uuid=True), sa.ForeignKey('users.uuid', ondelete='CASCADE'), nullable=False)
     user: so.Mapped['User'] = so.relationship(back_populates='entries')
+    period: so.Mapped[Range[datetime]] = so.mapped_column(TSTZRANGE, nullable=False)
+    duration_minutes: so.Mapped[int] = so.mapped_column(nullable=False, default=0)
+    ends_at: so.Mapped[datetime] = so.mapped_column(sa.DateTime(timezone=True), nullable=False, index=True)
+
+    property_columns = {
+        'timestamp': ('date', 'time'),
+        'duration': ('duration_minutes',),
+        'ending_time': ('ends_at',),
+    }
 
     def __repr__(self) -> str:
         return f'Entry({self.uuid}, {self.date}, {self.time}, {self.services}, {self.user.username})'
@@ -216,12 +396,30 @@ class Entry(db.Model):  # type: ignore[name-defined]
         return datetime.combine(self.date, self.time).timestamp()
 
     @property
-    def duration(self) -> Decimal | Literal[0]:
-        return sum(service.duration for service in self.services)
+    def duration(self) -> Decimal:
+        return round(Decimal(self.duration_minutes) / 60, 1)
 
     @property
     def ending_time(self) -> float:
-        return self.timestamp + timedelta(hours=float(self.duration)).total_seconds()
+        return self.ends_at.timestamp()
+
+    @staticmethod
+    def schedule(date: sa.ColumnElement | so.QueryableAttribute,
+                 time: sa.ColumnElement | so.QueryableAttribute,
+                 minutes: sa.ColumnElement) -> dict:
+        start = sa.cast(date, sa.Date) + sa.cast(time, sa.Time(timezone=True))
+        minutes = sa.func.greatest(minutes, MIN_SLOT_MINUTES)
+        end = start + sa.func.make_interval(0, 0, 0, 0, 0, minutes, type_=sa.Interval)
+        return {
+            'ends_at': end,
+            'period': sa.func.tstzrange(start, end, '[)', type_=TSTZRANGE),
+        }
+
+    def sync_schedule(self) -> None:
+        self.duration_minutes = int(sum(service.duration for service in self.services) * 60)
+        schedule = self.schedule(sa.literal(self.date), sa.literal(self.time), sa.literal(self.duration_minutes))
+        for attr, value in schedule.items():
+            setattr(self, attr, value)
 
 
 class Service(UpdateMixin, db.Model):  # type: ignore[name-defined]
@@ -237,6 +435,98 @@ class Service(UpdateMixin, db.Model):  # type: ignore[name-defined]
     def __repr__(self) -> str:
         return self.name
 
+    def schedule_conflicts(self) -> list[str]:
+        duration = sa.case((Service.id == self.id, sa.literal(self.duration, sa.Numeric)), else_=Service.duration)
+        minutes = sa.cast(
+            sa.select(sa.func.coalesce(sa.func.sum(duration), 0) * 60)
+            .join(association_table, association_table.c.service_id == Service.id)
+            .filter(association_table.c.entry_id == Entry.uuid)
+            .scalar_subquery(), sa.Integer)
+        affected = sa.select(association_table.c.entry_id).filter(association_table.c.service_id == self.id)
+        proposed = (sa.select(Entry.uuid, Entry.schedule(Entry.date, Entry.time, minutes)['period'].label('period'))
+                    .filter(Entry.uuid.in_(affected))
+                    .cte('proposed'))
+        other_proposed = proposed.alias('other_proposed')
+        entry, other = so.aliased(Entry), so.aliased(Entry)
+        with db.session.no_autoflush:
+            conflicts = db.session.execute(
+                sa.select(entry.uuid, entry.date, entry.time, other.uuid, other.date, other.time)
+                .join(proposed, proposed.c.uuid == entry.uuid)
+                .join(other, other.uuid != entry.uuid)
+                .outerjoin(other_proposed, other_proposed.c.uuid == other.uuid)
+                .filter(sa.or_(
+                    sa.and_(other_proposed.c.uuid.is_(None), other.period.op('&&')(proposed.c.period)),
+                    sa.and_(entry.uuid < other.uuid, other_proposed.c.period.op('&&')(proposed.c.period))))
+                .order_by(entry.date, entry.time)).all()
+        return [f'Entry {first} on {first_date} {first_time:%H:%M} would overlap entry {second} '
+                f'on {second_date} {second_time:%H:%M}'
+                for first, first_date, first_time, second, second_date, second_time in conflicts]
+
+
+@sa.event.listens_for(User, 'after_update')
+@sa.event.listens_for(User, 'after_delete')
+def evict_cached_user(mapper: so.Mapper, connection: sa.Connection, target: User) -> None:
+    token_cache.evict(lambda snapshot: snapshot['uuid'] == target.uuid)
+
+
+@sa.event.listens_for(Post, 'after_insert')
+@sa.event.listens_for(Post, 'after_update')
+@sa.event.listens_for(Post, 'after_delete')
+@sa.event.listens_for(User, 'after_update')
+@sa.event.listens_for(User, 'after_delete')
+@sa.event.listens_for(SocialMedia, 'after_update')
+def mark_feed_changed(mapper: so.Mapper, connection: sa.Connection, target: Post | User | SocialMedia) -> None:
+    session = so.object_session(target)
+    if session is not None:
+        session.info['feed_changed'] = True
+
+
+@sa.event.listens_for(so.Session, 'after_commit')
+def invalidate_feed(session: so.Session) -> None:
+    if session.info.pop('feed_changed', False):
+        fragment_cache.invalidate()
+
+
+@sa.event.listens_for(so.Session, 'after_rollback')
+def discard_feed_changes(session: so.Session) -> None:
+    session.info.pop('feed_changed', None)
+
+
+@sa.event.listens_for(so.Session, 'before_flush')
+def sync_entry_schedule(session: so.Session, flush_context: so.UOWTransaction, instances: object) -> None:
+    services = []
+    for obj in session.new | session.dirty:
+        if isinstance(obj, Entry):
+            obj.sync_schedule()
+        elif isinstance(obj, Service) and so.attributes.get_history(obj, 'duration').has_changes():
+            services.append(obj.id)
+    services.extend(obj.id for obj in session.deleted if isinstance(obj, Service))
+    if services:
+        session.info.setdefault('stale_entries', set()).update(session.connection().scalars(
+            sa.select(association_table.c.entry_id).filter(association_table.c.service_id.in_(services))))
+
+
+@sa.event.listens_for(so.Session, 'before_flush')
+def sync_social_handles(session: so.Session, flush_context: so.UOWTransaction, instances: object) -> None:
+    for obj in session.new | session.dirty:
+        if isinstance(obj, SocialMedia):
+            obj.sync_handles()
+
+
+@sa.event.listens_for(so.Session, 'after_flush')
+def refresh_stale_entries(session: so.Session, flush_context: so.UOWTransaction) -> None:
+    entries = session.info.pop('stale_entries', None)
+    if entries:
+        minutes = sa.cast(
+            sa.select(sa.func.coalesce(sa.func.sum(Service.duration), 0) * 60)
+            .join(association_table, association_table.c.service_id == Service.id)
+            .filter(association_table.c.entry_id == Entry.uuid)
+            .scalar_subquery(), sa.Integer)
+        session.connection().execute(
+            sa.update(Entry)
+            .filter(Entry.uuid.in_(entries))
+            .values(duration_minutes=minutes, **Entry.schedule(Entry.date, Entry.time, minutes)))
+
 
 class AdminView(ModelView):
     column_display_pk = True
@@ -319,9 +609,10 @@ class PostView(AdminView):
 
     def on_model_change(self, form: BaseForm, model: Post, is_created: bool) -> None:
         if form.new_image.data is not None:
+            from .images import image_processor
+            image_processor.submit(model, form.new_image.data)
             if not is_created:
                 delete_image(self.img)
-            model.image = save_image(form.new_image)
 
     def on_model_delete(self, model: Post) -> None:
         self.img = model.image
@@ -335,11 +626,16 @@ class ServiceView(AdminView):
     column_editable_list = ('name', 'duration')
     form_columns = ('name', 'duration')
 
+    def on_model_change(self, form: BaseForm, model: Service, is_created: bool) -> None:
+        if not is_created and (conflicts := model.schedule_conflicts()):
+            raise ValidationError('; '.join(conflicts))
+
 
 class EntryView(AdminView):
-    column_list = ('uuid', 'created_on', 'date', 'time', 'user_id', 'user.username', 'services')
+    column_list = ('uuid', 'created_on', 'date', 'time', 'ends_at', 'user_id', 'user.username', 'services')
     column_searchable_list = ('user.username',)
     column_default_sort = ('date', True)
+    form_columns = ('date', 'time', 'user', 'services')
 
 
 class SocialMediaView(AdminView):
@@ -391,9 +687,10 @@ class SocialMediaView(AdminView):
 
     def on_model_change(self, form: BaseForm, model: SocialMedia, is_created: bool) -> None:
         if form.profile_image.data is not None:
+            from .images import image_processor
+            image_processor.submit(model, form.profile_image.data)
             if not is_created:
                 delete_image(self.img, path='profiles')
-            model.avatar = save_image(form.profile_image, path='profiles')
 
     def on_model_delete(self, model: SocialMedia) -> None:
         self.img = model.avatar
@@ -0,0 +1,137 @@
+from datetime import datetime, timedelta
+import smtplib
+from threading import Event, Lock, Thread
+from time import monotonic, sleep
+
+import click
+from flask import Flask, current_app
+from flask.cli import AppGroup
+from flask_mail import Connection, Message
+import sqlalchemy as sa
+from sqlalchemy.exc import SQLAlchemyError
+
+from . import db, mail
+
+outbox_cli = AppGroup('outbox', help='Email outbox commands.')
+
+
+class Outbox:
+    def __init__(self) -> None:
+        self.app: Flask | None = None
+        self._thread: Thread | None = None
+        self._lock = Lock()
+        self._wakeup = Event()
+
+    def init_app(self, app: Flask) -> None:
+        self.app = app
+        app.cli.add_command(outbox_cli)
+        app.before_request(self.start)
+
+    def enqueue(self, message: Message) -> None:
+        from .models import EmailOutbox
+        email = EmailOutbox(sender=message.sender,
+                            recipient=message.recipients[0],
+                            subject=message.subject,
+                            body=message.body,
+                            html=message.html)
+        db.session.add(email)
+        db.session.commit()
+        self.start()
+        self._wakeup.set()
+
+    def start(self) -> None:
+        if self.app is None or not self.app.config['MAIL_OUTBOX_THREAD']:
+            return
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = Thread(target=self.run, name='email-outbox', daemon=True)
+                self._thread.start()
+
+    def run(self, once: bool = False) -> None:
+        app = self.app if self.app is not None else current_app._get_current_object()  # type: ignore[attr-defined]
+        with app.app_context():
+            while True:
+                try:
+                    self.drain()
+                except SQLAlchemyError:
+                    app.logger.exception('Email outbox drain failed')
+                finally:
+                    db.session.remove()
+                if once:
+                    return
+                self._wakeup.wait(timeout=app.config['MAIL_OUTBOX_POLL'])
+                self._wakeup.clear()
+
+    def drain(self) -> int:
+        from .models import EmailOutbox
+        config = current_app.config
+        interval = 1 / config['MAIL_RATE_LIMIT']
+        next_send = monotonic()
+        connection: Connection | None = None
+        sent = 0
+        try:
+            while True:
+                email = db.session.scalar(
+                    sa.select(EmailOutbox)
+                    .where(EmailOutbox.status == 'pending',
+                           EmailOutbox.send_after <= sa.func.now())
+                    .order_by(EmailOutbox.send_after, EmailOutbox.id)
+                    .limit(1)
+                    .with_for_update(skip_locked=True))
+                if email is None:
+                    break
+                if (delay := next_send - monotonic()) > 0:
+                    sleep(delay)
+                next_send = max(next_send, monotonic()) + interval
+                try:
+                    if connection is None:
+                        connection = mail.connect().__enter__()
+                    connection.send(Message(email.subject,
+                                            sender=email.sender,
+                                            recipients=[email.recipient],
+                                            body=email.body,
+                                            html=email.html))
+                except (smtplib.SMTPException, OSError) as error:
+                    close(connection)
+                    connection = None
+                    email.attempts += 1
+                    email.last_error = str(error)
+                    if email.attempts >= config['MAIL_MAX_ATTEMPTS']:
+                        email.status = 'failed'
+                        current_app.logger.error('Giving up on email %s after %s attempts: %s',
+                                                 email.id, email.attempts, error)
+                    else:
+                        email.send_after = datetime.now().astimezone() + timedelta(
+                            seconds=config['MAIL_RETRY_BACKOFF'] * 2 ** (email.attempts - 1))
+                        current_app.logger.warning('Sending email %s failed (attempt %s): %s',
+                                                   email.id, email.attempts, error)
+                else:
+                    email.attempts += 1
+                    email.status = 'sent'
+                    email.sent_on = datetime.now().astimezone()
+                    sent += 1
+                db.session.commit()
+        finally:
+            close(connection)
+        return sent
+
+
+def close(connection: Connection | None) -> None:
+    if connection is None:
+        return
+    try:
+        connection.__exit__(None, None, None)
+    except (smtplib.SMTPException, OSError):
+        pass
+
+
+@outbox_cli.command('send')
+@click.option('--once', is_flag=True, help='Drain the outbox once and exit.')
+def send(once: bool) -> None:
+    """Send queued emails."""
+    outbox.run(once=once)
+
+
+outbox = Outbox()
@@ -1,7 +1,8 @@
-from datetime import datetime, date
+from datetime import datetime, date, timedelta
 import re
 from typing import Any, Type
 from apifairy.fields import FileField, FileStorage
+from flask import current_app
 from marshmallow import validate, validates, ValidationError, post_load, Schema, validates_schema
 import sqlalchemy as sa
 from webargs import fields
@@ -9,7 +10,7 @@ from werkzeug.exceptions import Forbidden, NotFound
 
 from . import ma, db, token_auth
 from .models import User, Post, SocialMedia, Entry, Service
-from .utils import PATTERNS, save_image, delete_image
+from .utils import PATTERNS, image_srcset, image_url
 
 paginated_cache: dict[Type[Schema], Type[Schema]] = {}
 
@@ -54,13 +55,13 @@ class UserSchema(ma.SQLAlchemySchema):  # type: ignore[name-defined]
             raise ValidationError('Usernames must start with a letter')
         if not pattern.match(value):
             raise ValidationError('Usernames must have only letters, numbers, dots or underscores')
-        user = db.session.scalar(sa.select(User).filter(User.username.ilike(value)))
+        user = db.session.scalar(sa.select(User.uuid).filter(sa.func.lower(User.username) == value.lower()))
         if user:
             raise ValidationError('Please choose a different username')
 
     @validates('email')
     def validate_email(self, value: str) -> None:
-        user = db.session.scalar(sa.select(User).filter(User.email.ilike(value)))
+        user = db.session.scalar(sa.select(User.uuid).filter(sa.func.lower(User.email) == value.lower()))
         if user:
             raise ValidationError('Please choose a different email')
 
@@ -90,13 +91,13 @@ class AdminUserSchema(ma.SQLAlchemySchema):  # type: ignore[name-defined]
             raise ValidationError('Usernames must start with a letter')
         if not pattern.match(value):
             raise ValidationError('Usernames must have only letters, numbers, dots or underscores')
-        user = db.session.scalar(sa.select(User).filter(User.username.ilike(value)))
+        user = db.session.scalar(sa.select(User.uuid).filter(sa.func.lower(User.username) == value.lower()))
         if user:
             raise ValidationError('Please choose a different username')
 
     @validates('email')
     def validate_email(self, value: str) -> None:
-        user = db.session.scalar(sa.select(User).filter(User.email.ilike(value)))
+        user = db.session.scalar(sa.select(User.uuid).filter(sa.func.lower(User.email) == value.lower()))
         if user:
             raise ValidationError('Please choose a different email')
 
@@ -139,14 +140,6 @@ class UserAvatarSchema(ma.Schema):  # type: ignore[name-defined]
             elif file.content_type not in {"image/jpeg", "image/png"}:
                 raise ValidationError(f"Invalid file_type: {file.content_type}. Only PNG, JPG/JPEG images accepted.")
 
-    @post_load
-    def manage_avatar(self, data: dict[str, FileStorage], **kwargs: dict[str, Any]) -> dict[str, str]:
-        if 'avatar' in data:
-            user: User = token_auth.current_user()
-            delete_image(user.socials.avatar, path='profiles')
-            data['avatar'] = save_image(data['avatar'], path='profiles')
-        return data
-
 
 class PostImageSchema(ma.Schema):  # type: ignore[name-defined]
     image = FileField()
@@ -160,12 +153,6 @@ class PostImageSchema(ma.Schema):  # type: ignore[name-defined]
             elif file.content_type not in {"image/jpeg", "image/png"}:
                 raise ValidationError(f"Invalid file_type: {file.content_type}. Only PNG, JPG/JPEG images accepted.")
 
-    @post_load
-    def manage_avatar(self, data: dict[str, FileStorage], **kwargs: dict[str, Any]) -> dict[str, str]:
-        if 'image' in data:
-            data['image'] = save_image(data['image'], path='posts')
-        return data
-
 
 class SocialMediaSchema(ma.SQLAlchemySchema):  # type: ignore[name-defined]
     class Meta:
@@ -175,6 +162,10 @@ class SocialMediaSchema(ma.SQLAlchemySchema):  # type: ignore[name-defined]
     url = ma.URLFor('api.for_socials.get_one', values={'social_id': '<uuid>'}, dump_only=True)
     user = ma.Nested(UserInfoSchema(), dump_only=True)
     avatar = ma.auto_field(dump_only=True)
+    avatar_url = ma.Method('get_avatar_url', dump_only=True)
+    avatar_width = ma.auto_field(dump_only=True)
+    avatar_height = ma.auto_field(dump_only=True)
+    srcset = ma.Method('get_srcset', dump_only=True)
     first_name = ma.auto_field(validate=[validate.Regexp(
         PATTERNS['name'], error='Invalid value for first name')])
     last_name = ma.auto_field(validate=[validate.Regexp(
@@ -196,6 +187,18 @@ class SocialMediaSchema(ma.SQLAlchemySchema):  # type: ignore[name-defined]
     vk = ma.Url(validate=[validate.Regexp(
         PATTERNS['vk'], error='Invalid value for VK')])
     about = ma.auto_field()
+    phone_number_display = ma.auto_field(dump_only=True)
+    viber_display = ma.auto_field(dump_only=True)
+    whatsapp_display = ma.auto_field(dump_only=True)
+    instagram_handle = ma.auto_field(dump_only=True)
+    telegram_handle = ma.auto_field(dump_only=True)
+    vk_handle = ma.auto_field(dump_only=True)
+
+    def get_avatar_url(self, obj: SocialMedia) -> str | None:
+        return image_url(obj.avatar, path='profiles') if obj.avatar else None
+
+    def get_srcset(self, obj: SocialMedia) -> dict[str, str | None]:
+        return {fmt: image_srcset(obj.avatar, obj.avatar_width, path='profiles', fmt=fmt) for fmt in ('webp', 'jpeg')}
 
 
 class PostSchema(ma.SQLAlchemySchema):  # type: ignore[name-defined]
@@ -206,9 +209,19 @@ class PostSchema(ma.SQLAlchemySchema):  # type: ignore[name-defined]
     title = ma.auto_field()
     content = ma.auto_field()
     image = ma.auto_field(dump_only=True)
+    image_url = ma.Method('get_image_url', dump_only=True)
+    image_width = ma.auto_field(dump_only=True)
+    image_height = ma.auto_field(dump_only=True)
+    srcset = ma.Method('get_srcset', dump_only=True)
     posted_on = ma.auto_field(dump_only=True)
     author = ma.Nested(UserInfoSchema(), dump_only=True)
 
+    def get_image_url(self, obj: Post) -> str | None:
+        return image_url(obj.image) if obj.image else None
+
+    def get_srcset(self, obj: Post) -> dict[str, str | None]:
+        return {fmt: image_srcset(obj.image, obj.image_width, fmt=fmt) for fmt in ('webp', 'jpeg')}
+
 
 class ServiceSchema(ma.SQLAlchemySchema):  # type: ignore[name-defined]
     class Meta:
@@ -240,6 +253,8 @@ class ServiceSchema(ma.SQLAlchemySchema):  # type: ignore[name-defined]
 
 class TokenSchema(ma.Schema):  # type: ignore[name-defined]
     token = ma.String()
+    expires_at = ma.DateTime()
+    scopes = ma.List(ma.String())
 
 
 class EntrySchema(ma.SQLAlchemySchema):  # type: ignore[name-defined]
@@ -256,6 +271,7 @@ class EntrySchema(ma.SQLAlchemySchema):  # type: ignore[name-defined]
     duration = ma.Decimal(dump_default=Entry.duration, dump_only=True)
     timestamp = ma.Float(dump_default=Entry.timestamp, dump_only=True)
     ending_time = ma.Float(dump_default=Entry.ending_time, dump_only=True)
+    ends_at = ma.auto_field(dump_only=True)
 
 
 class CreateEntrySchema(EntrySchema):  # type: ignore[name-defined]
@@ -270,16 +286,59 @@ class CreateEntrySchema(EntrySchema):  # type: ignore[name-defined]
             raise ValidationError('Date cannot be lower than current date')
 
 
-class UserFieldSchema(ma.Schema):  # type: ignore[name-defined]
-    uuid = ma.String()
-    url = ma.String()
-    username = ma.String()
-    registered_on = ma.String()
-    confirmed = ma.String()
-    confirmed_on = ma.String()
-    posts = ma.String()
-    entries = ma.String()
-    socials = ma.String()
+class AvailabilitySchema(ma.Schema):  # type: ignore[name-defined]
+    date_from = ma.Date(load_default=date.today,
+                        metadata={'description': """
+                                        Format:
+                                        "date_from=2023-03-27"
+                                        """})
+    date_to = ma.Date(metadata={'description': """
+                                        Format:
+                                        "date_to=2023-03-28"
+                                        """})
+    services = fields.DelimitedList(ma.Integer(),
+                                    required=True,
+                                    metadata={'description': """
+                                                List of service ids to book
+                                                Format:
+                                                "services=1,2"
+                                                """})
+
+    @validates('date_from')
+    def validate_date_from(self, value: date) -> None:
+        if value < date.today():
+            raise ValidationError('Date cannot be lower than current date')
+
+    @validates_schema
+    def validate_schema(self, data: dict, **kwargs: dict) -> None:
+        date_from = data.get('date_from', date.today())
+        date_to = data.get('date_to', date_from)
+        if date_to < date_from:
+            raise ValidationError('date_to cannot be lower than date_from')
+        if date_to - date_from > timedelta(days=current_app.config['AVAILABILITY_MAX_DAYS']):
+            raise ValidationError(
+                f'Date range cannot exceed {current_app.config["AVAILABILITY_MAX_DAYS"]} days')
+
+
+class SlotSchema(ma.Schema):  # type: ignore[name-defined]
+    class Meta:
+        ordered = True
+    date = ma.Date()
+    start = ma.Time()
+    end = ma.Time()
+
+
+class FreeSlotsSchema(ma.Schema):  # type: ignore[name-defined]
+    class Meta:
+        ordered = True
+    date_from = ma.Date()
+    date_to = ma.Date()
+    duration = ma.Decimal(places=1, as_string=True)
+    services = ma.Nested(ServiceSchema(many=True, only=['id', 'url', 'name', 'duration']))
+    slots = ma.Nested(SlotSchema(many=True))
+
+
+class UserFieldSchema(UserSchema):  # type: ignore[name-defined]
     fields = fields.DelimitedList(ma.String(), metadata={
                                   'description': """
                                                 List of fields to include in request
@@ -380,6 +439,13 @@ class UserSortSchema(ma.Schema):  # type: ignore[name-defined]
 
 
 class SocialsFieldSchema(SocialMediaSchema):  # type: ignore[name-defined]
+    include = fields.DelimitedList(ma.String(),
+                                   metadata={'description': """
+                                                Nested objects to embed, all by default.
+                                                Pass an empty value to omit them.
+                                                Possible values:
+                                                "user",
+                                                """})
     fields = fields.DelimitedList(ma.String(),
                                   metadata={'description': """
                                                 Possible values:
@@ -387,6 +453,10 @@ class SocialsFieldSchema(SocialMediaSchema):  # type: ignore[name-defined]
                                                 "url",
                                                 "user",
                                                 "avatar",
+                                                "avatar_url",
+                                                "avatar_width",
+                                                "avatar_height",
+                                                "srcset",
                                                 "first_name",
                                                 "last_name",
                                                 "phone_number",
@@ -480,6 +550,13 @@ class ServiceSortSchema(ma.Schema):  # type: ignore[name-defined]
 
 
 class PostFieldSchema(PostSchema):  # type: ignore[name-defined]
+    include = fields.DelimitedList(ma.String(),
+                                   metadata={'description': """
+                                                Nested objects to embed, all by default.
+                                                Pass an empty value to omit them.
+                                                Possible values:
+                                                "author",
+                                                """})
     fields = fields.DelimitedList(ma.String(),
                                   metadata={'description': """
                                                 Possible values:
@@ -488,6 +565,10 @@ class PostFieldSchema(PostSchema):  # type: ignore[name-defined]
                                                 "title",
                                                 "content",
                                                 "image",
+                                                "image_url",
+                                                "image_width",
+                                                "image_height",
+                                                "srcset",
                                                 "posted_on",
                                                 "author,
                                                 """})
@@ -539,6 +620,14 @@ class PostSortSchema(ma.Schema):  # type: ignore[name-defined]
 
 
 class EntryFieldSchema(EntrySchema):  # type: ignore[name-defined]
+    include = fields.DelimitedList(ma.String(),
+                                   metadata={'description': """
+                                                Nested objects to embed, all by default.
+                                                Pass an empty value to omit them.
+                                                Possible values:
+                                                "user",
+                                                "services",
+                                                """})
     fields = fields.DelimitedList(ma.String(),
                                   metadata={'description': """
                                                 Possible values:
@@ -551,7 +640,8 @@ class EntryFieldSchema(EntrySchema):  # type: ignore[name-defined]
                                                 "time",
                                                 "duration",
                                                 "timestamp",
-                                                "ending_time"
+                                                "ending_time",
+                                                "ends_at"
                                                 """})
 
 
@@ -605,13 +695,35 @@ class EntryFilterSchema(ma.Schema):  # type: ignore[name-defined]
                                     Format:
                                     "time[lt]=15:00"
                                     """})
+    ends_at_gte = ma.DateTime(data_key='ends_at[gte]',
+                              metadata={'description': """
+                                    Format:
+                                    "ends_at[gte]=2023-03-27 15:00"
+                                    """})
+    ends_at_lte = ma.DateTime(data_key='ends_at[lte]',
+                              metadata={'description': """
+                                    Format:
+                                    "ends_at[lte]=2023-03-27 15:00"
+                                    """})
+    ends_at_gt = ma.DateTime(data_key='ends_at[gt]',
+                             metadata={'description': """
+                                    Format:
+                                    "ends_at[gt]=2023-03-27 15:00"
+                                    """})
+    ends_at_lt = ma.DateTime(data_key='ends_at[lt]',
+                             metadata={'description': """
+                                    Format:
+                                    "ends_at[lt]=2023-03-27 15:00"
+                                    """})
 
     @validates_schema
     def validate_schema(self, data: dict, **kwargs: dict) -> None:
         if ((data.get('date_gte', None) and data.get('date_gt', None)) or
                 (data.get('date_lte', None) and data.get('date_lt', None)) or
                 (data.get('time_gte', None) and data.get('time_gt', None)) or
-                (data.get('time_lte', None) and data.get('time_lt', None))):
+                (data.get('time_lte', None) and data.get('time_lt', None)) or
+                (data.get('ends_at_gte', None) and data.get('ends_at_gt', None)) or
+                (data.get('ends_at_lte', None) and data.get('ends_at_lt', None))):
             raise ValidationError('Cannot specify both [gte] and [gt] or [lte] and [lt] for the same key')
 
 
@@ -619,13 +731,15 @@ class EntrySortSchema(ma.Schema):  # type: ignore[name-defined]
     created_on = ma.String()
     date = ma.String()
     time = ma.String()
+    ends_at = ma.String()
     sort = fields.DelimitedList(ma.String(),
-                                load_default=['-date'],
+                                load_default=['-date', '-time'],
                                 metadata={'description': """
                                                 Possible values:
                                                 "created_on",
                                                 "date",
-                                                "time"
+                                                "time",
+                                                "ends_at"
                                                 """})
 
 
@@ -636,6 +750,21 @@ class PaginationSchema(ma.Schema):  # type: ignore[name-defined]
     per_page = ma.Integer(load_default=25)
     last_page = ma.Integer(load_default=1, dump_only=True)
     total = ma.Integer(dump_only=True)
+    cursor = ma.String(load_only=True,
+                       metadata={'description': """
+                                    Switches to cursor pagination, "page" is ignored
+                                    Pass empty value to get the first page,
+                                    then "next_cursor" from the previous response
+                                    """})
+    next_cursor = ma.String(dump_only=True)
+    has_next = ma.Boolean(dump_only=True)
+    count = ma.String(validate=validate.OneOf(['exact', 'estimate', 'none']),
+                      metadata={'description': """
+                                    How to calculate "total":
+                                    "exact" - precise count (default for page pagination),
+                                    "estimate" - fast planner estimate,
+                                    "none" - skip counting (default for cursor pagination)
+                                    """})
 
     @validates('page')
     def validate_page(self, value: int) -> None:
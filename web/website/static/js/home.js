@@ -0,0 +1,37 @@
+const posts = document.querySelector('#posts');
+const loadMore = document.querySelector('.load-more');
+let loading = false;
+
+async function loadPosts() {
+    if (loading || !loadMore.dataset.url) return;
+    loading = true;
+    try {
+        const response = await fetch(loadMore.dataset.url, { headers: { 'Accept': 'application/json' } });
+        if (!response.ok) throw new Error(response.statusText);
+        const page = await response.json();
+        posts.insertAdjacentHTML('beforeend', page.html);
+        if (page.next_url) {
+            loadMore.dataset.url = page.next_url;
+            loadMore.href = loadMore.href.replace(/cursor=[^&]*/, `cursor=${page.next_cursor}`);
+        } else {
+            observer.disconnect();
+            loadMore.remove();
+        }
+    } catch (error) {
+        observer.disconnect(); // stop auto-loading, the button still retries on click
+    } finally {
+        loading = false;
+    }
+}
+
+const observer = new IntersectionObserver(entries => {
+    if (entries.some(entry => entry.isIntersecting)) loadPosts();
+}, { rootMargin: '400px' });
+
+if (loadMore) {
+    observer.observe(loadMore);
+    loadMore.addEventListener('click', event => {
+        event.preventDefault();
+        loadPosts();
+    });
+}
@@ -0,0 +1,153 @@
+from abc import ABC, abstractmethod
+from collections.abc import Iterator
+from datetime import datetime, timezone
+import os
+import shutil
+from tempfile import SpooledTemporaryFile
+from typing import IO, Any, cast
+
+from flask import Flask, current_app, url_for
+from werkzeug.local import LocalProxy
+
+
+class Storage(ABC):
+    @abstractmethod
+    def save(self, key: str, stream: IO[bytes], content_type: str | None = None) -> None:
+        ...
+
+    @abstractmethod
+    def open(self, key: str) -> IO[bytes]:
+        ...
+
+    @abstractmethod
+    def exists(self, key: str) -> bool:
+        ...
+
+    @abstractmethod
+    def delete(self, key: str) -> None:
+        ...
+
+    @abstractmethod
+    def list(self, prefix: str = '') -> Iterator[tuple[str, int, datetime]]:
+        ...
+
+    @abstractmethod
+    def url(self, key: str) -> str:
+        ...
+
+
+class FileSystemStorage(Storage):
+    def __init__(self, root: str, static_prefix: str = 'images') -> None:
+        self.root = root
+        self.static_prefix = static_prefix
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.root, key)
+
+    def save(self, key: str, stream: IO[bytes], content_type: str | None = None) -> None:
+        os.makedirs(os.path.dirname(self.path(key)), exist_ok=True)
+        with open(self.path(key), 'wb') as file:
+            shutil.copyfileobj(stream, file)
+
+    def open(self, key: str) -> IO[bytes]:
+        return open(self.path(key), 'rb')
+
+    def exists(self, key: str) -> bool:
+        return os.path.isfile(self.path(key))
+
+    def delete(self, key: str) -> None:
+        try:
+            os.unlink(self.path(key))
+        except FileNotFoundError:
+            pass
+
+    def list(self, prefix: str = '') -> Iterator[tuple[str, int, datetime]]:
+        folder, start = os.path.split(prefix)
+        try:
+            entries = os.scandir(self.path(folder))
+        except FileNotFoundError:
+            return
+        with entries:
+            for entry in entries:
+                if entry.is_file() and entry.name.startswith(start):
+                    stat = entry.stat()
+                    yield (f'{folder}/{entry.name}' if folder else entry.name, stat.st_size,
+                           datetime.fromtimestamp(stat.st_mtime, timezone.utc))
+
+    def url(self, key: str) -> str:
+        return url_for('static', filename=f'{self.static_prefix}/{key}')
+
+
+class S3Storage(Storage):
+    def __init__(self, client: Any, bucket: str, public_url: str, prefix: str = '',
+                 cache_control: str | None = None, spool_size: int = 8 * 2 ** 20) -> None:
+        self.client = client
+        self.bucket = bucket
+        self.public_url = public_url.rstrip('/')
+        self.prefix = prefix
+        self.cache_control = cache_control
+        self.spool_size = spool_size
+
+    @classmethod
+    def from_config(cls, app: Flask) -> 'S3Storage':
+        import boto3
+        client = boto3.client('s3',
+                              endpoint_url=app.config['S3_ENDPOINT_URL'],
+                              region_name=app.config['S3_REGION'])
+        return cls(client, app.config['S3_BUCKET'], app.config['S3_PUBLIC_URL'],
+                   prefix=app.config['S3_PREFIX'],
+                   cache_control=f"public, max-age={app.config['IMAGE_CACHE_MAX_AGE']}, immutable")
+
+    def save(self, key: str, stream: IO[bytes], content_type: str | None = None) -> None:
+        extra = {'ContentType': content_type} if content_type else {}
+        if self.cache_control:
+            extra['CacheControl'] = self.cache_control
+        self.client.upload_fileobj(stream, self.bucket, self.prefix + key, ExtraArgs=extra)
+
+    def open(self, key: str) -> IO[bytes]:
+        file = SpooledTemporaryFile(max_size=self.spool_size)
+        try:
+            self.client.download_fileobj(self.bucket, self.prefix + key, file)
+        except self.client.exceptions.ClientError as error:
+            file.close()
+            if missing(error):
+                raise FileNotFoundError(key) from error
+            raise
+        file.seek(0)
+        return cast(IO[bytes], file)
+
+    def exists(self, key: str) -> bool:
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self.prefix + key)
+        except self.client.exceptions.ClientError as error:
+            if missing(error):
+                return False
+            raise
+        return True
+
+    def delete(self, key: str) -> None:
+        self.client.delete_object(Bucket=self.bucket, Key=self.prefix + key)
+
+    def list(self, prefix: str = '') -> Iterator[tuple[str, int, datetime]]:
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self.prefix + prefix):
+            for item in page.get('Contents', []):
+                yield item['Key'].removeprefix(self.prefix), item['Size'], item['LastModified']
+
+    def url(self, key: str) -> str:
+        return f'{self.public_url}/{self.prefix}{key}'
+
+
+def missing(error: Any) -> bool:
+    return error.response.get('Error', {}).get('Code') in {'404', 'NoSuchKey', 'NotFound'}
+
+
+def init_storage(app: Flask) -> None:
+    if app.config['IMAGE_STORAGE'] == 's3':
+        backend: Storage = S3Storage.from_config(app)
+    else:
+        backend = FileSystemStorage(os.path.join(app.root_path, app.config['UPLOAD_FOLDER']))
+    app.extensions['storage'] = backend
+
+
+storage: Storage = LocalProxy(lambda: current_app.extensions['storage'])  # type: ignore[assignment]
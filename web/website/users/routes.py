@@ -1,62 +1,58 @@
-from urllib.parse import urlparse, ParseResult
 from uuid import UUID
 
-from flask import flash, render_template, redirect, url_for, session, Blueprint, request, current_app, abort
+from flask import flash, render_template, redirect, url_for, session, Blueprint, request, abort, current_app
 from flask_login import login_required
-import phonenumbers
 import sqlalchemy as sa
+import sqlalchemy.orm as so
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.sql import func
 from werkzeug.wrappers.response import Response
 
 from .forms import PasswordChangeForm, EmailChangeForm, EntryForm, UpdateProfileForm
 from .. import db
-from ..api.common import can_create_entry
-from ..models import User, Entry, Service, current_user, get_or_404
-from ..utils import send_email, email_confirmed, current_user_required, save_image, delete_image
+from ..api.common import decode_cursor, encode_cursor, keyset_condition, save_entry
+from ..models import User, Entry, Service, SocialMedia, current_user, get_or_404
+from ..images import image_processor
+from ..utils import send_email, email_confirmed, current_user_required, delete_image, empty_image
 
 users = Blueprint('users', __name__)
 
+ENTRY_VIEWS: dict[str, list[tuple[so.InstrumentedAttribute, bool]]] = {
+    'upcoming': [(Entry.date, False), (Entry.time, False), (Entry.uuid, False)],
+    'past': [(Entry.date, True), (Entry.time, True), (Entry.uuid, True)],
+}
+
 
 @users.route("/<username>/profile", methods=['GET'])
 @login_required
 @email_confirmed
 def profile(username: str) -> Response | str:
     user = db.session.scalar(sa.select(User).filter_by(username=username)) or abort(404)
-    prev_entry = db.session.scalar(
-        user.entries.select()
-        .filter(sa.or_(
-            Entry.date < func.current_date(), sa.and_(
-                Entry.date == func.current_date(),
-                Entry.time <= func.current_time())))
-        .order_by(Entry.date.desc(), Entry.time.desc()))
-    next_entry = db.session.scalar(
-        user.entries.select()
-        .filter(sa.or_(
-            Entry.date > func.current_date(), sa.and_(
-                Entry.date == func.current_date(),
-                Entry.time > func.current_time())))
-        .order_by(Entry.date, Entry.time))
-    form: dict[str, str | None] = {}
-    for item in ['phone_number', 'viber', 'whatsapp']:
-        try:
-            p = phonenumbers.parse(getattr(user.socials, item))
-        except phonenumbers.phonenumberutil.NumberParseException:
-            form[item] = None
-            continue
-        formatted_number = phonenumbers.format_number(p, phonenumbers.PhoneNumberFormat.INTERNATIONAL)
-        form[item] = formatted_number
-    for item in ['vk', 'telegram', 'instagram']:
-        form[item] = None
-        url = getattr(user.socials, item)
-        if url:
-            parsed: ParseResult = urlparse(url=url)
-            form[item] = parsed.path.strip('/')
+    past = (user.entries.select()
+            .add_columns(sa.literal('prev').label('position'))
+            .filter(sa.or_(
+                Entry.date < func.current_date(), sa.and_(
+                    Entry.date == func.current_date(),
+                    Entry.time <= func.current_time())))
+            .order_by(Entry.date.desc(), Entry.time.desc())
+            .limit(1))
+    upcoming = (user.entries.select()
+                .add_columns(sa.literal('next').label('position'))
+                .filter(sa.or_(
+                    Entry.date > func.current_date(), sa.and_(
+                        Entry.date == func.current_date(),
+                        Entry.time > func.current_time())))
+                .order_by(Entry.date, Entry.time)
+                .limit(1))
+    nearest = sa.union_all(past, upcoming).subquery()
+    entry = so.aliased(Entry, nearest)
+    entries = {position: entry for entry, position in db.session.execute(
+        sa.select(entry, nearest.c.position).options(so.selectinload(entry.services)))}
     return render_template('users/profile.html',
                            title='Profile',
                            user=user,
-                           form=form,
-                           prev_entry=prev_entry,
-                           next_entry=next_entry)
+                           prev_entry=entries.get('prev'),
+                           next_entry=entries.get('next'))
 
 
 @users.route("/<username>/profile/change-password", methods=['GET', 'POST'])
@@ -133,10 +129,7 @@ def create_entry(username: str) -> Response | str:
                       time=form.time.data,
                       user_id=current_user.uuid)
         entry.services.extend(service_types)
-        available = can_create_entry(entry)
-        if available:
-            db.session.add(entry)
-            db.session.commit()
+        if save_entry(entry):
             flash('New entry has been created.', 'success')
             return redirect(url_for('users.my_entries', username=username))
         else:
@@ -165,9 +158,7 @@ def edit_entry(username: str, entry_id: UUID) -> Response | str:
         entry.time = form.time.data
         entry.services.clear()
         entry.services.extend(service_types)
-        available = can_create_entry(entry, context='update')
-        if available:
-            db.session.commit()
+        if save_entry(entry):
             flash('Your entry has been updated.', 'success')
             return redirect(url_for('users.my_entries', username=username))
         else:
@@ -194,10 +185,24 @@ def cancel_entry(username: str, entry_id: UUID) -> Response:
 @email_confirmed
 @current_user_required
 def my_entries(username: str) -> str:
-    entries = db.session.scalars(current_user.entries
-                                 .select()
-                                 .order_by(Entry.date.desc(), Entry.time.desc())).all()
-    return render_template('users/my_entries.html', title='Profile', entries=entries)
+    view = request.args.get('view', 'upcoming')
+    if view not in ENTRY_VIEWS:
+        abort(404)
+    order = ENTRY_VIEWS[view]
+    per_page = current_app.config['ENTRIES_PER_PAGE']
+    now = sa.tuple_(func.current_date(), func.current_time())
+    starts = sa.tuple_(Entry.date, Entry.time)
+    query = (current_user.entries.select()
+             .filter(starts > now if view == 'upcoming' else starts <= now)
+             .options(so.selectinload(Entry.services))
+             .order_by(*(column.desc() if desc else column.asc() for column, desc in order))
+             .limit(per_page + 1))
+    if cursor := request.args.get('cursor'):
+        query = query.filter(keyset_condition(order, decode_cursor(cursor, order)))  # type: ignore[arg-type]
+    entries = db.session.scalars(query).all()
+    next_cursor = encode_cursor(order, entries[per_page - 1]) if len(entries) > per_page else None  # type: ignore[arg-type]
+    return render_template('users/my_entries.html', title='Profile', entries=entries[:per_page],
+                           view=view, next_cursor=next_cursor)
 
 
 @users.route("/<username>/profile/update", methods=['GET', 'POST'])
@@ -208,27 +213,36 @@ def update_profile(username: str) -> Response | str:
     user = db.session.scalar(sa.select(User).filter_by(username=username)) or abort(404)
     form = UpdateProfileForm()
     if form.validate_on_submit():
+        avatar = user.socials.avatar
         for field in form._fields.values():
             if field.name not in ['delete_avatar', 'submit', 'csrf_token']:
                 if field.data and field.name in ['instagram', 'telegram', 'vk']:
                     field.data = field.data.lower()
                 elif field.data and field.name in ['first_name', 'last_name']:
                     field.data = field.data.capitalize()
-                elif form.delete_avatar.data and field.name in ['avatar']:
-                    delete_image(user.socials.avatar, path='profiles')
-                    field.data = current_app.config['DEFAULT_AVATAR']
-                elif field.data and field.name in ['avatar']:
-                    delete_image(user.socials.avatar, path='profiles')
-                    field.data = save_image(form.avatar.data, path='profiles')
                 elif field.name in ['avatar']:
-                    field.data = user.socials.avatar
+                    if form.delete_avatar.data:
+                        user.socials.update(empty_image('profiles'))
+                    elif field.data:
+                        image_processor.submit(user.socials, form.avatar.data)
+                    continue
                 elif not field.data:
                     field.data = None
                 setattr(user.socials, field.name, field.data)
         db.session.add(user.socials)
-        db.session.commit()
-        flash('Your profile has been updated.', 'success')
-        return redirect(url_for('users.profile', username=username))
+        try:
+            db.session.commit()
+        except IntegrityError as error:
+            db.session.rollback()
+            field = SocialMedia.duplicate_field(error)
+            if field is None or field not in form:
+                raise
+            form[field].errors.append('Already exists. Please choose a different one.')
+        else:
+            if form.delete_avatar.data or form.avatar.data:
+                delete_image(avatar, path='profiles')
+            flash('Your profile has been updated.', 'success')
+            return redirect(url_for('users.profile', username=username))
     elif request.method == 'GET':
         for field in form._fields.values():
             if field.name not in ['delete_avatar', 'submit', 'csrf_token']:
@@ -1,18 +1,22 @@
 from collections.abc import Callable
 from functools import wraps
+import hashlib
 import os
 import secrets
-from threading import Thread
+from tempfile import SpooledTemporaryFile
 from typing import ParamSpec, TypeVar, Any
 
-from flask import current_app, flash, redirect, url_for, render_template, Flask, abort
+from flask import current_app, flash, redirect, url_for, render_template, abort
 from flask_mail import Message
 from flask_wtf.file import FileStorage
-from PIL import Image
+from PIL import Image, ImageOps
+import sqlalchemy as sa
 from werkzeug.wrappers.response import Response
 
-from . import mail, token_auth
+from . import db, token_auth
 from .models import current_user
+from .outbox import outbox
+from .storage import storage
 
 P = ParamSpec("P")
 R = TypeVar("R")
@@ -28,14 +32,12 @@ PATTERNS = {
     'name': r'([A-ZÀ-ÿ][-,a-z. \']+[ ]*)+'
 }
 
+IMAGE_COLUMNS = {'posts': 'image', 'profiles': 'avatar'}
+IMAGE_EXTENSIONS = {'JPEG': '.jpg', 'PNG': '.png'}
+IMAGE_FORMATS = {'webp': 'WEBP', 'jpeg': 'JPEG', 'png': 'PNG'}
 
-def send_async_email(app: Flask, msg: Message) -> None:
-    with app.app_context():
-        mail.send(msg)
 
-
-def send_email(to: str, subject: str, template: str, **kwargs: str) -> Thread:
-    app = current_app._get_current_object()  # type: ignore[attr-defined]
+def send_email(to: str, subject: str, template: str, **kwargs: str) -> None:
     msg = Message(
         subject,
         recipients=[to],
@@ -43,9 +45,7 @@ def send_email(to: str, subject: str, template: str, **kwargs: str) -> Thread:
         sender=current_app.config['MAIL_DEFAULT_SENDER'])
     msg.body = render_template(template + '.txt', **kwargs)
     msg.html = render_template(template + '.html', **kwargs)
-    thr = Thread(target=send_async_email, args=[app, msg])
-    thr.start()
-    return thr
+    outbox.enqueue(msg)
 
 
 def email_confirmed(func: Callable[P, R]) -> Callable[P, R | Response]:
@@ -78,32 +78,112 @@ def current_user_required(func: Callable[..., R]) -> Callable[..., R | Response]
     return decorated_function
 
 
+def image_key(filename: str, path: str = 'posts') -> str:
+    return f'{path}/{filename}'
+
+
+def image_url(filename: str, path: str = 'posts') -> str:
+    return storage.url(image_key(filename, path))
+
+
+def variant_name(filename: str, width: int, fmt: str) -> str:
+    stem, _ = os.path.splitext(filename)
+    return f'{stem}-{width}w.{fmt}'
+
+
+def variant_widths(width: int, path: str = 'posts') -> list[int]:
+    return sorted({min(size, width) for size in current_app.config['IMAGE_WIDTHS'][path]})
+
+
+def image_srcset(filename: str | None, width: int | None, path: str = 'posts', fmt: str = 'webp') -> str | None:
+    if not filename:
+        return None
+    if not width:
+        return ', '.join(f"{url_for('main.image', folder=path, filename=filename, w=size, fmt=fmt)} {size}w"
+                         for size in current_app.config['IMAGE_WIDTHS'][path])
+    return ', '.join(f'{image_url(variant_name(filename, size, fmt), path)} {size}w'
+                     for size in variant_widths(width, path))
+
+
 def save_image(file: FileStorage, path: str = 'posts') -> str:
     _, f_ext = os.path.splitext(file.filename)
-    filename = secrets.token_hex(8) + f_ext
-    img_path = os.path.join(
-        current_app.root_path,
-        current_app.config['UPLOAD_FOLDER'],
-        path,
-        filename)
+    upload = secrets.token_hex(8) + f_ext.lower() + '.upload'
+    storage.save(image_key(upload, path), file.stream, file.content_type)
+    return upload
+
+
+def process_image(upload: str, path: str = 'posts') -> dict[str, Any]:
+    with storage.open(image_key(upload, path)) as file:
+        sha = hashlib.sha256()
+        for chunk in iter(lambda: file.read(65536), b''):
+            sha.update(chunk)
+        digest = sha.hexdigest()[:16]
+        file.seek(0)
+        with Image.open(file) as original:
+            if original.format not in IMAGE_EXTENSIONS:
+                raise ValueError(f'Unsupported image format: {original.format}')
+            filename = digest + IMAGE_EXTENSIONS[original.format]
+            if storage.exists(image_key(filename, path)):
+                with storage.open(image_key(filename, path)) as existing, Image.open(existing) as img:
+                    width, height = img.size
+            else:
+                width, height = write_image(original, filename, path)
+    column = IMAGE_COLUMNS[path]
+    return {column: filename, f'{column}_width': width, f'{column}_height': height}
+
+
+def write_image(original: Image.Image, filename: str, path: str = 'posts') -> tuple[int, int]:
+    quality = current_app.config['IMAGE_QUALITY']
+    img = ImageOps.exif_transpose(original)
     if path != 'posts':
-        output_size = (150, 150)
-        img = Image.open(file)
-        img.thumbnail(output_size)
-        img.save(img_path)
-        return filename
-    file.save(img_path)
-    return filename
+        img.thumbnail((150, 150))
+    for size in variant_widths(img.width, path):
+        variant = img.resize((size, round(img.height * size / img.width)), Image.Resampling.LANCZOS)
+        store_image(variant, variant_name(filename, size, 'webp'), path, 'WEBP', quality=quality)
+        store_image(variant.convert('RGB'), variant_name(filename, size, 'jpeg'), path, 'JPEG',
+                    quality=quality, optimize=True, progressive=True)
+    store_image(img, filename, path, original.format, quality=quality)
+    return img.size
+
+
+def store_image(img: Image.Image, filename: str, path: str, fmt: str, **params: Any) -> None:
+    with SpooledTemporaryFile(max_size=8 * 2 ** 20) as buffer:
+        img.save(buffer, fmt, **params)
+        buffer.seek(0)
+        storage.save(image_key(filename, path), buffer, f'image/{fmt.lower()}')
+
+
+def render_variant(key: str, width: int, fmt: str, target: str) -> None:
+    with storage.open(key) as file, Image.open(file) as original:
+        img = ImageOps.exif_transpose(original)
+        if img.width > width:
+            img = img.resize((width, round(img.height * width / img.width)), Image.Resampling.LANCZOS)
+        if fmt == 'jpeg':
+            img = img.convert('RGB')
+        img.save(target, IMAGE_FORMATS[fmt], quality=current_app.config['IMAGE_QUALITY'])
+
+
+def image_references(filename: str, path: str = 'posts') -> int:
+    from .models import Post, SocialMedia
+    column = {'posts': Post.image, 'profiles': SocialMedia.avatar}[path]
+    return db.session.scalar(sa.select(sa.func.count()).where(column == filename)) or 0
+
+
+def pending_image(path: str = 'posts') -> dict[str, Any]:
+    column = IMAGE_COLUMNS[path]
+    return {column: current_app.config['IMAGE_PLACEHOLDERS'][path], f'{column}_width': None, f'{column}_height': None}
+
+
+def empty_image(path: str = 'posts') -> dict[str, Any]:
+    column = IMAGE_COLUMNS[path]
+    filename = current_app.config['DEFAULT_AVATAR'] if path == 'profiles' else None
+    return {column: filename, f'{column}_width': None, f'{column}_height': None}
 
 
 def delete_image(filename: str, path: str = 'posts') -> None:
-    if filename != current_app.config['DEFAULT_AVATAR']:
-        try:
-            img_path = os.path.join(
-                current_app.root_path,
-                current_app.config['UPLOAD_FOLDER'],
-                path,
-                filename)
-            os.unlink(img_path)
-        except (FileNotFoundError, TypeError):
-            pass
+    placeholders = {current_app.config['DEFAULT_AVATAR'], *current_app.config['IMAGE_PLACEHOLDERS'].values()}
+    if filename and filename not in placeholders and not image_references(filename, path):
+        stem, _ = os.path.splitext(filename)
+        storage.delete(image_key(filename, path))
+        for key, _, _ in list(storage.list(image_key(f'{stem}-', path))):
+            storage.delete(key)